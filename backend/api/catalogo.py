@@ -0,0 +1,240 @@
+"""
+Índice invertido em memória sobre os nomes dos alimentos (TACO).
+
+Permite localizar os alimentos citados em um texto livre sem consultar o
+banco a cada busca: o catálogo é carregado uma vez por processo e
+reconstruído quando algum Alimento muda (ver api/signals.py) ou quando o
+índice expira.
+"""
+import difflib
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+
+from nutrition import metrics
+
+from .models import Alimento
+
+
+AlimentoInfo = namedtuple('AlimentoInfo', [
+    'id', 'nome', 'energia_kcal', 'carboidratos_g', 'proteinas_g',
+    'lipideos_g', 'fibra_g', 'sodio_mg',
+])
+
+STOPWORDS = {
+    'a', 'ao', 'as', 'com', 'da', 'das', 'de', 'do', 'dos', 'e', 'em',
+    'na', 'nas', 'no', 'nos', 'o', 'os', 'ou', 'para', 'por', 'um', 'uma',
+}
+
+# Qualificadores que costumam ficar implícitos ("banana prata" é a crua,
+# "ovo cozido" é o de galinha inteiro, "leite integral" é o de vaca)
+QUALIFICADORES_IMPLICITOS = {
+    'cru', 'crua', 'cozido', 'cozida', 'inteiro', 'inteira', 'galinha',
+    'vaca', 'trigo', 'minuto', 'natural', 'fresco', 'fresca',
+}
+
+# Modos de preparo: citados no texto e ausentes do nome do alimento
+# resolvido, indicam outro alimento ("ovo frito" não é o "Ovo, cozido")
+PREPARACOES = {
+    'assado', 'assada', 'cozido', 'cozida', 'cru', 'crua', 'empanado',
+    'empanada', 'ensopado', 'ensopada', 'frito', 'frita', 'grelhado',
+    'grelhada', 'refogado', 'refogada', 'torrado', 'torrada', 'vapor',
+}
+
+_PALAVRA_RE = re.compile(r"[a-z]+")
+
+
+def normalizar(texto):
+    """Minúsculas e sem acentos"""
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+def _singular(token):
+    if len(token) > 4 and token.endswith(('oes', 'aes', 'aos')):
+        return token[:-3] + 'ao'
+    if len(token) > 3 and token.endswith('s'):
+        return token[:-1]
+    return token
+
+
+def tokenizar(texto):
+    """Lista de termos normalizados do texto, sem stopwords"""
+    return [
+        _singular(palavra)
+        for palavra in _PALAVRA_RE.findall(normalizar(texto))
+        if palavra not in STOPWORDS and len(palavra) > 1
+    ]
+
+
+class IndiceAlimentos:
+    """
+    Índice invertido termo -> alimentos.
+
+    O primeiro trecho do nome TACO (antes da vírgula) é o alimento em si
+    ("Arroz, integral, cozido"); só é considerado citado o alimento cujos
+    termos desse trecho aparecem todos no texto.
+    """
+
+    def __init__(self, alimentos):
+        self.alimentos = {}
+        self.termos = {}
+        self.cabecas = {}
+        self.indice = defaultdict(set)
+
+        for alimento in alimentos:
+            termos = set(tokenizar(alimento.nome))
+            cabeca = frozenset(tokenizar(alimento.nome.split(',')[0]))
+            if not termos or not cabeca:
+                continue
+            self.alimentos[alimento.id] = alimento
+            self.termos[alimento.id] = termos
+            self.cabecas[alimento.id] = cabeca
+            for termo in termos:
+                self.indice[termo].add(alimento.id)
+        self.vocabulario = sorted(self.indice)
+
+    def buscar(self, texto, limite=5, por_alimento=2):
+        """
+        Alimentos citados no texto, do mais para o menos provável.
+
+        Retorna uma lista de (AlimentoInfo, score), com score entre 0 e 1
+        indicando a fração dos termos do nome presentes no texto. Para cada
+        alimento base ("Arroz", "Feijão") entram no máximo `por_alimento`
+        variações.
+        """
+        termos_texto = set(tokenizar(texto))
+        acertos = defaultdict(int)
+        for termo in termos_texto:
+            for alimento_id in self.indice.get(termo, ()):
+                acertos[alimento_id] += 1
+
+        candidatos = []
+        for alimento_id, total in acertos.items():
+            if not self.cabecas[alimento_id] <= termos_texto:
+                continue
+            score = total / len(self.termos[alimento_id])
+            candidatos.append((
+                -score,
+                -total,
+                len(self.termos[alimento_id]),
+                self.alimentos[alimento_id].nome,
+                alimento_id,
+            ))
+        candidatos.sort()
+
+        resultado = []
+        por_cabeca = defaultdict(int)
+        for neg_score, _, _, _, alimento_id in candidatos:
+            cabeca = self.cabecas[alimento_id]
+            if por_cabeca[cabeca] >= por_alimento:
+                continue
+            por_cabeca[cabeca] += 1
+            resultado.append((self.alimentos[alimento_id], -neg_score))
+            if len(resultado) >= limite:
+                break
+        return resultado
+
+    def resolver(self, texto):
+        """
+        O alimento citado no texto, apenas quando não há ambiguidade.
+
+        Considera os alimentos cujo nome aparece inteiro no texto, a menos
+        de qualificadores implícitos, e escolhe o que tem mais termos em
+        comum com ele. Retorna None se não houver candidato ou se houver
+        empate ("arroz integral" pode ser o cru ou o cozido).
+        """
+        termos_texto = set(tokenizar(texto))
+        candidatos = {
+            alimento_id
+            for termo in termos_texto
+            for alimento_id in self.indice.get(termo, ())
+        }
+
+        melhores, maior = [], 0
+        for alimento_id in candidatos:
+            if not self.cabecas[alimento_id] <= termos_texto:
+                continue
+            termos = self.termos[alimento_id]
+            if not (termos - termos_texto) <= QUALIFICADORES_IMPLICITOS:
+                continue
+            casados = len(termos & termos_texto)
+            if casados > maior:
+                melhores, maior = [alimento_id], casados
+            elif casados == maior:
+                melhores.append(alimento_id)
+
+        if len(melhores) != 1:
+            return None
+        return self.alimentos[melhores[0]]
+
+    def termos_soltos(self, texto, alimento):
+        """
+        Termos do texto que nomeiam alimentos ou modos de preparo e não
+        estão no nome de `alimento`: sinal de um segundo alimento ("ovo e
+        arroz") ou de outra preparação ("ovo frito") no texto
+        """
+        return {
+            termo for termo in tokenizar(texto)
+            if (termo in self.indice or termo in PREPARACOES)
+            and termo not in self.termos[alimento.id]
+        }
+
+    def corrigir(self, texto, corte=0.8):
+        """
+        Texto com cada termo desconhecido trocado pelo termo mais parecido
+        do vocabulário ("feijao preot" -> "feijao preto")
+        """
+        corrigidos = []
+        for termo in tokenizar(texto):
+            if termo not in self.indice:
+                parecidos = difflib.get_close_matches(
+                    termo, self.vocabulario, n=1, cutoff=corte
+                )
+                if parecidos:
+                    termo = parecidos[0]
+            corrigidos.append(termo)
+        return ' '.join(corrigidos)
+
+
+_lock = threading.Lock()
+_indice = None
+_construido_em = 0.0
+
+
+def get_indice():
+    """Índice do processo, construído sob demanda"""
+    global _indice, _construido_em
+
+    ttl = settings.CATALOGO_INDICE_TTL
+    indice = _indice
+    if indice is not None and time.monotonic() - _construido_em < ttl:
+        metrics.inc('nutriapp_cache_requests_total', cache='catalogo',
+                    result='hit')
+        return indice
+
+    with _lock:
+        if _indice is None or time.monotonic() - _construido_em >= ttl:
+            metrics.inc('nutriapp_cache_requests_total', cache='catalogo',
+                        result='miss')
+            alimentos = [
+                AlimentoInfo(*valores)
+                for valores in Alimento.objects.values_list(*AlimentoInfo._fields)
+            ]
+            _indice = IndiceAlimentos(alimentos)
+            _construido_em = time.monotonic()
+        else:
+            metrics.inc('nutriapp_cache_requests_total', cache='catalogo',
+                        result='hit')
+        return _indice
+
+
+def invalidar_indice():
+    """Descarta o índice; o próximo acesso recarrega o catálogo"""
+    global _indice
+    with _lock:
+        _indice = None
@@ -0,0 +1,147 @@
+"""
+Exportação completa dos dados de um usuário: refeições, itens (com os
+macros calculados) e mensagens do chat, inclusive as arquivadas.
+
+Os registros saem um a um de geradores que leem o banco com
+.iterator(chunk_size=...) (cursores no servidor do PostgreSQL), então a
+memória usada não cresce com o histórico e os primeiros bytes saem antes
+de tudo ser lido. Cada registro é um dicionário com o campo "tipo"
+('refeicao', 'item' ou 'mensagem'); no CSV todos dividem as COLUNAS.
+"""
+import heapq
+
+from django.conf import settings
+from django.db.models import Prefetch
+
+from api.models import Refeicao, RefeicaoAlimento
+from chatbot.archive import unpack
+from chatbot.models import ChatArchive, ChatMessage
+
+COLUNAS = [
+    'tipo', 'id', 'data', 'refeicao_id', 'nome', 'descricao', 'essencial',
+    'alimento', 'quantidade_g', 'kcal', 'carbo_g', 'proteina_g',
+    'gordura_g', 'sessao_id', 'sessao', 'papel', 'conteudo', 'tokens',
+]
+
+
+def _chunk_size(chunk_size):
+    return chunk_size or settings.EXPORT_CHUNK_SIZE
+
+
+def registros_refeicoes(user, chunk_size=None):
+    """Cada refeição seguida dos seus itens, da mais antiga à mais nova"""
+    refeicoes = (
+        Refeicao.objects.filter(user=user)
+        .prefetch_related(
+            Prefetch(
+                'itens',
+                queryset=RefeicaoAlimento.objects.select_related(
+                    'alimento'
+                ).order_by('id')
+            )
+        )
+        .order_by('data_criacao', 'id')
+    )
+    # Com chunk_size o prefetch dos itens é feito a cada lote de refeições
+    for refeicao in refeicoes.iterator(chunk_size=_chunk_size(chunk_size)):
+        yield {
+            'tipo': 'refeicao',
+            'id': refeicao.id,
+            'data': refeicao.data_criacao,
+            'nome': refeicao.nome,
+            'descricao': refeicao.descricao or '',
+            'essencial': refeicao.essencial,
+            'kcal': round(refeicao.total_kcal, 2),
+            'carbo_g': round(refeicao.total_carbo, 2),
+            'proteina_g': round(refeicao.total_proteina, 2),
+            'gordura_g': round(refeicao.total_gordura, 2),
+        }
+        for item in refeicao.itens.all():
+            yield {
+                'tipo': 'item',
+                'id': item.id,
+                'refeicao_id': refeicao.id,
+                'alimento': item.alimento.nome,
+                'quantidade_g': item.quantidade_g,
+                'kcal': round(item.kcal_total, 2),
+                'carbo_g': round(item.carbo_total, 2),
+                'proteina_g': round(item.proteina_total, 2),
+                'gordura_g': round(item.gordura_total, 2),
+            }
+
+
+def _registro_mensagem(mensagem, sessao_id, titulo):
+    return {
+        'tipo': 'mensagem',
+        'id': mensagem.id,
+        'data': mensagem.timestamp,
+        'sessao_id': sessao_id,
+        'sessao': titulo,
+        'papel': mensagem.role,
+        'conteudo': mensagem.content,
+        'tokens': mensagem.tokens_used,
+    }
+
+
+def _mensagens_arquivadas(user, chunk_size):
+    lotes = (
+        ChatArchive.objects.filter(session__user=user)
+        .select_related('session')
+        .order_by('session_id', 'first_timestamp', 'first_message_id')
+    )
+    # Cada lote arquivado já traz centenas de mensagens
+    for lote in lotes.iterator(chunk_size=max(chunk_size // 100, 1)):
+        for mensagem in unpack(lote):
+            yield _registro_mensagem(
+                mensagem, lote.session_id, lote.session.title
+            )
+
+
+def _mensagens_quentes(user, chunk_size):
+    mensagens = (
+        ChatMessage.objects.filter(session__user=user)
+        .select_related('session')
+        .only(
+            'id', 'role', 'content', 'timestamp', 'tokens_used',
+            'session__id', 'session__title'
+        )
+        .order_by('session_id', 'timestamp', 'id')
+    )
+    for mensagem in mensagens.iterator(chunk_size=chunk_size):
+        yield _registro_mensagem(
+            mensagem, mensagem.session_id, mensagem.session.title
+        )
+
+
+def registros_mensagens(user, chunk_size=None):
+    """
+    Mensagens de todas as conversas, por sessão e em ordem do chat: as
+    arquivadas e as da tabela quente intercaladas, sem carregar nenhuma
+    das duas listas inteira
+    """
+    chunk_size = _chunk_size(chunk_size)
+    return heapq.merge(
+        _mensagens_arquivadas(user, chunk_size),
+        _mensagens_quentes(user, chunk_size),
+        key=lambda registro: (
+            registro['sessao_id'], registro['data'], registro['id']
+        )
+    )
+
+
+def registros(user, chunk_size=None):
+    """Todos os registros do usuário: refeições e itens, depois mensagens"""
+    yield from registros_refeicoes(user, chunk_size)
+    yield from registros_mensagens(user, chunk_size)
+
+
+def valor_csv(registro):
+    """Registro com datas em ISO 8601 e booleanos como 0/1, para o CSV"""
+    return {
+        campo: (
+            valor.isoformat() if hasattr(valor, 'isoformat')
+            else int(valor) if isinstance(valor, bool)
+            else valor
+        )
+        for campo, valor in registro.items()
+    }
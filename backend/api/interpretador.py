@@ -0,0 +1,194 @@
+"""
+Interpretação de refeições descritas em texto livre.
+
+"200g de arroz, 1 ovo cozido e 100g de frango grelhado" vira uma lista de
+itens (alimento do catálogo + quantidade em gramas), resolvida localmente
+com o índice de alimentos: sem consultas por item e sem chamar modelo.
+"""
+import re
+from dataclasses import dataclass, field
+
+from .catalogo import get_indice, normalizar, tokenizar
+
+
+NUMEROS_POR_EXTENSO = {
+    'meio': 0.5, 'meia': 0.5, 'um': 1, 'uma': 1, 'dois': 2, 'duas': 2,
+    'tres': 3, 'quatro': 4, 'cinco': 5, 'seis': 6, 'sete': 7, 'oito': 8,
+    'nove': 9, 'dez': 10,
+}
+
+# Medidas caseiras em gramas (aproximações usuais de tabelas de porções)
+MEDIDAS_CASEIRAS = [
+    (r'kg|quilos?', 1000),
+    (r'g|gr|gramas?', 1),
+    (r'ml', 1),
+    (r'l|litros?', 1000),
+    (r'colher(?:es)? de sopa', 15),
+    (r'colher(?:es)? de (?:cha|cafe)', 5),
+    (r'colher(?:es)?', 15),
+    (r'xicaras?', 150),
+    (r'copos?', 200),
+    (r'conchas?', 100),
+    (r'escumadeiras?', 90),
+    (r'fatias?', 25),
+    (r'pedacos?', 50),
+    (r'porc(?:ao|oes)', 100),
+    (r'pratos?', 250),
+    (r'unidades?|un', None),
+]
+
+# Peso de uma unidade, pelo primeiro termo do nome do alimento
+PESO_UNIDADE = {
+    'ovo': 50, 'pao': 50, 'banana': 80, 'maca': 130, 'laranja': 180,
+    'pera': 130, 'tangerina': 135, 'kiwi': 75, 'tomate': 100,
+    'batata': 150, 'cenoura': 80, 'bife': 100, 'file': 100,
+    'biscoito': 8, 'torrada': 10, 'tapioca': 70, 'coxinha': 80,
+    'pastel': 80, 'hamburguer': 90, 'linguica': 60, 'salsicha': 50,
+    'iogurte': 170,
+}
+PESO_PADRAO = 100
+
+_NUMERO = (
+    r'\d+(?:[.,]\d+)?|(?:'
+    + '|'.join(sorted(NUMEROS_POR_EXTENSO, key=len, reverse=True))
+    + r')(?![a-z])'
+)
+_MEDIDA = '|'.join(f'(?:{padrao})' for padrao, _ in MEDIDAS_CASEIRAS)
+_ITEM_RE = re.compile(
+    rf'^(?P<quantidade>{_NUMERO})?\s*'
+    rf'(?:(?P<medida>{_MEDIDA})\b\.?)?\s*'
+    rf'(?:de\s+|d[oa]s?\s+)?(?P<nome>.*)$'
+)
+# Vírgula entre dígitos é decimal ("2,5 kg de arroz"), não separa itens
+_SEPARADOR_RE = re.compile(r'(?<!\d),|,(?!\d)|[;+\n]|\be\b|\bmais\b')
+
+
+@dataclass
+class ItemInterpretado:
+    trecho: str
+    quantidade_g: float = None
+    medida: str = None
+    alimento: object = None
+    confianca: str = None
+    alternativas: list = field(default_factory=list)
+    # Alimentos ou preparos do trecho que não estão no alimento escolhido
+    termos_soltos: list = field(default_factory=list)
+
+    @property
+    def confirmado(self):
+        """Pode ir para o diário sem confirmação do usuário"""
+        return (
+            self.alimento is not None and bool(self.quantidade_g)
+            and self.confianca in ('alta', 'media')
+            and not self.termos_soltos
+        )
+
+    def como_dict(self):
+        dados = {
+            'trecho': self.trecho,
+            'quantidade_g': (
+                round(self.quantidade_g, 1)
+                if self.quantidade_g is not None else None
+            ),
+            'medida': self.medida,
+            'confianca': self.confianca,
+            'alimento_id': None,
+            'alimento_nome': None,
+            'alternativas': [
+                {'alimento_id': alt.id, 'alimento_nome': alt.nome}
+                for alt in self.alternativas
+            ],
+            'termos_soltos': self.termos_soltos,
+        }
+        if self.alimento is not None:
+            fator = (self.quantidade_g or 0) / 100
+            dados.update({
+                'alimento_id': self.alimento.id,
+                'alimento_nome': self.alimento.nome,
+                'kcal_total': round(self.alimento.energia_kcal * fator, 2),
+                'carbo_total': round(self.alimento.carboidratos_g * fator, 2),
+                'proteina_total': round(self.alimento.proteinas_g * fator, 2),
+                'gordura_total': round(self.alimento.lipideos_g * fator, 2),
+            })
+        return dados
+
+
+def _valor_numerico(texto):
+    if texto in NUMEROS_POR_EXTENSO:
+        return NUMEROS_POR_EXTENSO[texto]
+    return float(texto.replace(',', '.'))
+
+
+def _gramas_por_medida(medida):
+    for padrao, gramas in MEDIDAS_CASEIRAS:
+        if re.fullmatch(padrao, medida):
+            return gramas
+    return None
+
+
+def _peso_unidade(alimento):
+    termos = tokenizar(alimento.nome.split(',')[0])
+    if termos:
+        return PESO_UNIDADE.get(termos[0], PESO_PADRAO)
+    return PESO_PADRAO
+
+
+def _resolver_alimento(indice, nome):
+    """(alimento, confiança, alternativas) para o nome citado"""
+    alimento = indice.resolver(nome)
+    if alimento is not None:
+        return alimento, 'alta', []
+
+    # Erros de digitação: aproxima cada termo do vocabulário
+    corrigido = indice.corrigir(nome)
+    if corrigido != ' '.join(tokenizar(nome)):
+        alimento = indice.resolver(corrigido)
+        if alimento is not None:
+            return alimento, 'media', []
+
+    encontrados = indice.buscar(corrigido, limite=3, por_alimento=3)
+    if not encontrados:
+        return None, None, []
+    alternativas = [alimento for alimento, _ in encontrados]
+    return alternativas[0], 'baixa', alternativas[1:]
+
+
+def interpretar_item(trecho, indice=None):
+    indice = indice or get_indice()
+    item = ItemInterpretado(trecho=trecho.strip())
+
+    match = _ITEM_RE.match(normalizar(trecho).strip())
+    nome = match.group('nome').strip()
+    if not nome:
+        return item
+
+    item.alimento, item.confianca, item.alternativas = _resolver_alimento(
+        indice, nome
+    )
+    if item.alimento is not None:
+        # "pão com manteiga" resolve o pão; a manteiga não pode sumir
+        item.termos_soltos = sorted(
+            indice.termos_soltos(indice.corrigir(nome), item.alimento)
+        )
+
+    quantidade = match.group('quantidade')
+    medida = match.group('medida')
+    valor = _valor_numerico(quantidade) if quantidade else 1
+    gramas = _gramas_por_medida(medida) if medida else None
+    item.medida = medida
+
+    if gramas is None and item.alimento is not None:
+        gramas = _peso_unidade(item.alimento)
+        item.medida = item.medida or 'unidade'
+    if gramas is not None:
+        item.quantidade_g = valor * gramas
+    return item
+
+
+def interpretar_refeicao(texto):
+    """Itens interpretados de uma refeição descrita em texto livre"""
+    indice = get_indice()
+    trechos = [
+        trecho for trecho in _SEPARADOR_RE.split(texto) if trecho.strip()
+    ]
+    return [interpretar_item(trecho, indice) for trecho in trechos]
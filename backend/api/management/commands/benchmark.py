@@ -0,0 +1,234 @@
+"""
+Benchmark dos principais endpoints sobre os dados do banco (de preferência
+gerados por gerar_dados_sinteticos), com o LLM simulado (mock).
+
+    python manage.py benchmark --iteracoes 200 --threads 4
+    python manage.py benchmark --salvar-baseline
+    python manage.py benchmark --falhar   # código de saída 1 se regredir
+
+As refeições e a conversa criadas durante a execução são apagadas ao final.
+"""
+import logging
+import platform
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import Alimento, Refeicao
+from chatbot.models import ChatSession
+from nutrition.benchmark import (
+    compare,
+    load_baseline,
+    run_scenario,
+    save_baseline,
+)
+from user.models import User
+from user.views import get_tokens_for_user
+
+BUSCAS = [
+    'arroz', 'feijão', 'frango', 'banana', 'leite', 'pão', 'ovo', 'queijo',
+    'batata', 'carne', 'maçã', 'iogurte', 'tomate', 'aveia', 'café',
+]
+PERGUNTAS = [
+    'Me ajuda a montar um cardápio para a semana?',
+    'O que comer antes do treino da manhã?',
+    'Como bater a meta de proteína sem suplemento?',
+    'Estou comendo pouca fibra, o que posso incluir no almoço?',
+    'Quantas refeições por dia você recomenda?',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede vazão, latência p50/p99 e consultas por requisição dos '
+        'principais endpoints e compara com a baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iteracoes', type=int, default=50)
+        parser.add_argument('--threads', type=int, default=1)
+        parser.add_argument(
+            '--aquecimento', type=int, default=5,
+            help='Chamadas descartadas antes da medição'
+        )
+        parser.add_argument(
+            '--cenarios', nargs='+', help='Executa só estes cenários'
+        )
+        parser.add_argument(
+            '--email',
+            help='Usuário usado (padrão: o primeiro usuário sintético)'
+        )
+        parser.add_argument(
+            '--latencia-mock', default='none',
+            help='Latência do LLM simulado (formato de CHATBOT_MOCK_LATENCY)'
+        )
+        parser.add_argument(
+            '--baseline', default=settings.BENCHMARK_BASELINE,
+            help='Arquivo JSON da baseline'
+        )
+        parser.add_argument(
+            '--tolerancia', type=float, default=0.2,
+            help='Piora aceita em latência e vazão (0.2 = 20%%)'
+        )
+        parser.add_argument('--salvar-baseline', action='store_true')
+        parser.add_argument(
+            '--falhar', action='store_true',
+            help='Sai com erro se houver regressão'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        # O log INFO do chatbot (uma linha por mensagem) encobriria o
+        # relatório
+        logging.getLogger('chatbot').setLevel(logging.WARNING)
+        self.user = self._usuario(options['email'])
+        self.token = get_tokens_for_user(self.user)['access']
+        self.alimentos = list(
+            Alimento.objects.order_by('id').values_list('id', flat=True)[:500]
+        )
+        if not self.alimentos:
+            raise CommandError('Nenhum alimento cadastrado')
+        primeira = Refeicao.objects.filter(
+            user=self.user, essencial=False
+        ).order_by('data_criacao').values_list('data_criacao', flat=True)
+        inicio = primeira.first()
+        self.datas = (
+            [
+                inicio.date() + timedelta(days=dia)
+                for dia in range((timezone.now() - inicio).days + 1)
+            ]
+            if inicio else [timezone.localdate()]
+        )
+
+        cenarios = {
+            'refeicoes-lista': self.lista_refeicoes,
+            'refeicoes-cria': self.cria_refeicao,
+            'alimentos-busca': self.busca_alimentos,
+            'perfil': self.perfil,
+            'chat-mensagem': self.envia_mensagem,
+        }
+        escolhidos = options['cenarios'] or list(cenarios)
+        desconhecidos = set(escolhidos) - set(cenarios)
+        if desconhecidos:
+            raise CommandError(
+                f"Cenários desconhecidos: {', '.join(sorted(desconhecidos))}"
+                f" (disponíveis: {', '.join(cenarios)})"
+            )
+
+        ultima_refeicao = Refeicao.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+        self.sessao = ChatSession.objects.create(
+            user=self.user, title='Benchmark'
+        )
+        resultados = {}
+        try:
+            with override_settings(
+                CHATBOT_USE_MOCK=True,
+                CHATBOT_MOCK_LATENCY=options['latencia_mock'],
+                CHATBOT_MOCK_ERROR_RATE=0,
+                CHATBOT_RATE_LIMIT_PER_MINUTE=0,
+                CHATBOT_DAILY_TOKEN_QUOTA=0,
+            ):
+                for nome in escolhidos:
+                    resultados[nome] = run_scenario(
+                        self._cliente, cenarios[nome],
+                        options['iteracoes'], options['threads'],
+                        options['aquecimento'], options['seed']
+                    )
+                    self._mostrar(nome, resultados[nome])
+        finally:
+            Refeicao.objects.filter(
+                user=self.user, id__gt=ultima_refeicao
+            ).delete()
+            self.sessao.delete()
+
+        baseline = load_baseline(options['baseline'])
+        regressoes = compare(resultados, baseline, options['tolerancia'])
+        for nome, metrica, antes, agora in regressoes:
+            self.stdout.write(self.style.ERROR(
+                f'REGRESSÃO {nome} {metrica}: {antes} -> {agora}'
+            ))
+        if not baseline:
+            self.stdout.write(self.style.WARNING(
+                f"Sem baseline em {options['baseline']}"
+            ))
+        elif not regressoes:
+            self.stdout.write(self.style.SUCCESS('Sem regressões'))
+
+        if options['salvar_baseline']:
+            save_baseline(options['baseline'], resultados, {
+                'data': timezone.now().isoformat(),
+                'maquina': platform.node(),
+                'python': platform.python_version(),
+                'iteracoes': options['iteracoes'],
+                'threads': options['threads'],
+                'usuario': self.user.email,
+            })
+            self.stdout.write(f"Baseline gravada em {options['baseline']}")
+
+        if regressoes and options['falhar']:
+            raise CommandError(f'{len(regressoes)} regressões')
+
+    def _usuario(self, email):
+        if email:
+            user = User.objects.filter(email=email).first()
+        else:
+            user = User.objects.filter(
+                email__endswith='@sintetico.nutriapp.dev'
+            ).order_by('id').first()
+        if user is None:
+            raise CommandError(
+                'Usuário não encontrado; rode gerar_dados_sinteticos ou '
+                'use --email'
+            )
+        return user
+
+    def _cliente(self):
+        client = APIClient(SERVER_NAME='localhost')
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        return client
+
+    def _mostrar(self, nome, resultado):
+        self.stdout.write(
+            f"{nome:<16} {resultado['requests']:>5} req  "
+            f"{resultado['throughput']:>8} req/s  "
+            f"p50 {resultado['p50_ms']:>8} ms  "
+            f"p99 {resultado['p99_ms']:>8} ms  "
+            f"{resultado['queries_per_request']:>5} consultas/req"
+            + (f"  {resultado['errors']} erros" if resultado['errors'] else '')
+        )
+
+    # Cenários
+
+    def lista_refeicoes(self, client, rng):
+        data = rng.choice(self.datas).isoformat()
+        return client.get(f'/api/refeicoes/?data={data}')
+
+    def cria_refeicao(self, client, rng):
+        itens = [
+            {'alimento_id': alimento_id,
+             'quantidade_g': rng.randrange(30, 250, 5)}
+            for alimento_id in rng.sample(self.alimentos, 3)
+        ]
+        return client.post(
+            '/api/refeicoes/', {'nome': 'Benchmark', 'itens': itens},
+            format='json'
+        )
+
+    def busca_alimentos(self, client, rng):
+        return client.get(f'/api/alimentos/?search={rng.choice(BUSCAS)}')
+
+    def perfil(self, client, rng):
+        return client.get('/api/auth/profile/')
+
+    def envia_mensagem(self, client, rng):
+        return client.post(
+            '/api/chatbot/sessions/send_message/',
+            {'message': rng.choice(PERGUNTAS), 'session_id': self.sessao.id},
+            format='json'
+        )
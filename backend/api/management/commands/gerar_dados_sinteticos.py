@@ -0,0 +1,318 @@
+"""
+Gera usuários sintéticos com perfil, diário de refeições de vários anos e
+histórico de conversas com o chatbot, para testes de carga e benchmarks
+(comando benchmark).
+
+Tudo é criado com bulk_create, um usuário por vez; os usuários ficam no
+domínio --dominio, e --limpar apaga os gerados antes.
+"""
+import random
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import Alimento, Refeicao, RefeicaoAlimento
+from chatbot.models import ChatMessage, ChatSession, message_preview
+from user.models import PlanoAlimentar, User, UserProfile
+from user.views import calcular_macros
+
+NOMES = [
+    'Ana', 'Bruno', 'Carla', 'Daniel', 'Eduarda', 'Felipe', 'Gabriela',
+    'Henrique', 'Isabela', 'João', 'Larissa', 'Marcos', 'Natália', 'Otávio',
+    'Paula', 'Rafael', 'Sofia', 'Thiago', 'Vanessa', 'Yuri',
+]
+SOBRENOMES = [
+    'Silva', 'Santos', 'Oliveira', 'Souza', 'Lima', 'Pereira', 'Costa',
+    'Almeida', 'Ferreira', 'Rodrigues', 'Gomes', 'Martins',
+]
+
+# Refeição do diário: (nome, chance no dia, horário, termos dos alimentos,
+# quantidade de itens, gramas por item)
+REFEICOES_DO_DIA = [
+    ('Café da manhã', 0.85, 7,
+     ['pão', 'café', 'leite', 'banana', 'mamão', 'ovo', 'queijo',
+      'manteiga', 'aveia', 'iogurte'], (2, 4), (30, 200)),
+    ('Almoço', 0.95, 12,
+     ['arroz', 'feijão', 'frango', 'carne', 'alface', 'tomate', 'batata',
+      'macarrão', 'cenoura', 'peixe', 'farofa'], (3, 5), (50, 250)),
+    ('Lanche', 0.6, 16,
+     ['biscoito', 'maçã', 'banana', 'iogurte', 'pão', 'castanha',
+      'laranja', 'bolo'], (1, 3), (20, 150)),
+    ('Jantar', 0.9, 20,
+     ['arroz', 'feijão', 'frango', 'ovo', 'sopa', 'salada', 'carne',
+      'abobrinha', 'batata'], (2, 4), (50, 250)),
+    ('Ceia', 0.15, 22,
+     ['leite', 'fruta', 'iogurte', 'chá', 'mamão'], (1, 2), (50, 200)),
+]
+
+PERGUNTAS = [
+    "Quantas calorias tem {alimento}?",
+    "Posso trocar {alimento} por outra opção mais leve?",
+    "Me ajuda a montar um cardápio para {objetivo}?",
+    "Quanto de proteína tem {alimento}?",
+    "O que comer antes do treino da manhã?",
+    "Qual a melhor fruta para o lanche da tarde?",
+    "Estou comendo pouca fibra, o que posso incluir no almoço?",
+    "{alimento} à noite atrapalha a dieta?",
+    "Como bater a meta de proteína sem suplemento?",
+    "Quantas refeições por dia você recomenda?",
+]
+RESPOSTAS = [
+    "{alimento} tem cerca de {kcal} kcal a cada 100g. Para {objetivo}, "
+    "vale controlar a porção e combinar com vegetais.",
+    "Uma boa troca é priorizar alimentos integrais e fontes magras de "
+    "proteína, mantendo a meta de calorias do seu plano.",
+    "Sugestão: café com pão integral e ovo, almoço com arroz, feijão, "
+    "frango e salada, lanche com fruta e iogurte, jantar leve com sopa.",
+    "Distribua a proteína ao longo do dia: ovos no café, carne ou frango "
+    "no almoço e jantar, e iogurte ou leite nos lanches.",
+    "Não existe alimento proibido à noite; o que conta é o total do dia "
+    "em relação ao seu plano alimentar.",
+]
+OBJETIVOS = {
+    'emagrecer': 'emagrecer',
+    'manter': 'manter o peso',
+    'ganhar': 'ganhar massa',
+}
+
+
+@contextmanager
+def datas_explicitas(*modelos):
+    """
+    Desliga auto_now/auto_now_add dos modelos no bloco, para o bulk_create
+    gravar as datas geradas (no passado) em vez do horário atual
+    """
+    alterados = []
+    for modelo in modelos:
+        for campo in modelo._meta.concrete_fields:
+            if getattr(campo, 'auto_now', False) or getattr(
+                campo, 'auto_now_add', False
+            ):
+                alterados.append((campo, campo.auto_now, campo.auto_now_add))
+                campo.auto_now = campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo, auto_now, auto_now_add in alterados:
+            campo.auto_now = auto_now
+            campo.auto_now_add = auto_now_add
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera usuários sintéticos com diário de refeições e histórico de '
+        'conversas, para testes de carga'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=10)
+        parser.add_argument(
+            '--dias', type=int, default=730,
+            help='Dias de diário por usuário, até hoje'
+        )
+        parser.add_argument(
+            '--sessoes', type=int, default=5,
+            help='Conversas com o chatbot por usuário'
+        )
+        parser.add_argument(
+            '--mensagens', type=int, default=20,
+            help='Mensagens por conversa (pergunta e resposta)'
+        )
+        parser.add_argument('--dominio', default='sintetico.nutriapp.dev')
+        parser.add_argument('--senha', default='Senha123')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--limpar', action='store_true',
+            help='Apaga antes os usuários do domínio'
+        )
+
+    def handle(self, *args, **options):
+        alimentos = list(
+            Alimento.objects.values_list('id', 'nome', 'energia_kcal')
+        )
+        if not alimentos:
+            raise CommandError(
+                'Nenhum alimento cadastrado; rode importar_taco antes'
+            )
+        self.rng = random.Random(options['seed'])
+        self.alimentos = alimentos
+        self.grupos = self._agrupar_alimentos(alimentos)
+        dominio = options['dominio']
+
+        if options['limpar']:
+            removidos, _ = User.objects.filter(
+                email__endswith=f'@{dominio}'
+            ).delete()
+            self.stdout.write(f'{removidos} registros removidos')
+
+        senha = make_password(options['senha'])
+        inicio = User.objects.filter(email__endswith=f'@{dominio}').count()
+        hoje = timezone.localdate()
+        for i in range(inicio, inicio + options['usuarios']):
+            with transaction.atomic():
+                # Antes de desligar auto_now: o sinal de User cria as
+                # refeições essenciais com a data atual
+                user = self._criar_usuario(i, dominio, senha)
+                with datas_explicitas(
+                    Refeicao, RefeicaoAlimento, ChatSession, ChatMessage
+                ):
+                    refeicoes, itens = self._criar_diario(
+                        user, hoje, options['dias']
+                    )
+                    mensagens = self._criar_conversas(
+                        user, hoje, options['dias'], options['sessoes'],
+                        options['mensagens']
+                    )
+            self.stdout.write(
+                f'{user.email}: {refeicoes} refeições, {itens} itens, '
+                f'{mensagens} mensagens'
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['usuarios']} usuários gerados (senha: "
+            f"{options['senha']})"
+        ))
+
+    def _agrupar_alimentos(self, alimentos):
+        grupos = {}
+        for _, _, _, termos, _, _ in REFEICOES_DO_DIA:
+            for termo in termos:
+                if termo in grupos:
+                    continue
+                grupos[termo] = [
+                    alimento for alimento in alimentos
+                    if alimento[1].lower().startswith(termo)
+                ] or [
+                    alimento for alimento in alimentos
+                    if termo in alimento[1].lower()
+                ]
+        return grupos
+
+    def _criar_usuario(self, indice, dominio, senha):
+        rng = self.rng
+        nome = f'{rng.choice(NOMES)} {rng.choice(SOBRENOMES)}'
+        user = User.objects.create(
+            email=f'usuario{indice}@{dominio}', name=nome, password=senha
+        )
+
+        # O sinal de User já criou o perfil e as refeições essenciais
+        profile = user.profile
+        profile.sexo = rng.choice('MF')
+        profile.idade = rng.randint(18, 70)
+        profile.altura = round(
+            rng.gauss(175 if profile.sexo == 'M' else 162, 7)
+        )
+        imc = rng.uniform(19, 32)
+        profile.peso = round(imc * (profile.altura / 100) ** 2, 1)
+        profile.nivel_atividade = rng.choice(
+            [c for c, _ in UserProfile.NIVEL_ATIVIDADE_CHOICES]
+        )
+        profile.objetivo = rng.choice(list(OBJETIVOS))
+        profile.status = True
+        profile.save()
+        PlanoAlimentar.objects.create(
+            profile=profile, **calcular_macros(profile)
+        )
+        return user
+
+    def _criar_diario(self, user, hoje, dias):
+        rng = self.rng
+        tz = timezone.get_current_timezone()
+        refeicoes = []
+        escolhas = []
+        for dia in range(dias, 0, -1):
+            data = hoje - timedelta(days=dia - 1)
+            for nome, chance, hora, termos, n_itens, gramas in REFEICOES_DO_DIA:
+                if rng.random() > chance:
+                    continue
+                quando = timezone.make_aware(
+                    datetime.combine(data, time(hora, rng.randint(0, 59))),
+                    tz
+                )
+                refeicoes.append(Refeicao(
+                    user=user, nome=nome, essencial=False,
+                    data_criacao=quando, data_atualizacao=quando
+                ))
+                escolhas.append([
+                    (self._alimento(termos), gramas)
+                    for _ in range(rng.randint(*n_itens))
+                ])
+
+        refeicoes = Refeicao.objects.bulk_create(refeicoes, batch_size=2000)
+        itens = [
+            RefeicaoAlimento(
+                refeicao=refeicao, alimento_id=alimento[0],
+                quantidade_g=5 * round(rng.uniform(*gramas) / 5),
+                data_criacao=refeicao.data_criacao,
+                data_atualizacao=refeicao.data_criacao
+            )
+            for refeicao, escolha in zip(refeicoes, escolhas)
+            for alimento, gramas in escolha
+        ]
+        RefeicaoAlimento.objects.bulk_create(itens, batch_size=5000)
+        return len(refeicoes), len(itens)
+
+    def _alimento(self, termos):
+        grupo = self.grupos.get(self.rng.choice(termos))
+        return self.rng.choice(grupo or self.alimentos)
+
+    def _criar_conversas(self, user, hoje, dias, sessoes, mensagens):
+        rng = self.rng
+        tz = timezone.get_current_timezone()
+        objetivo = OBJETIVOS[user.profile.objetivo]
+        total = 0
+        for _ in range(sessoes):
+            inicio = timezone.make_aware(
+                datetime.combine(
+                    hoje - timedelta(days=rng.randint(0, max(dias - 1, 0))),
+                    time(rng.randint(7, 22), rng.randint(0, 59))
+                ),
+                tz
+            )
+            quando = inicio
+            conversa = []
+            for _ in range(max(mensagens // 2, 1)):
+                _, nome, kcal = rng.choice(self.alimentos)
+                valores = {
+                    'alimento': nome.split(',')[0], 'kcal': round(kcal),
+                    'objetivo': objetivo,
+                }
+                tempo = round(rng.lognormvariate(0.3, 0.5), 3)
+                conversa.append((
+                    'user', rng.choice(PERGUNTAS).format(**valores),
+                    quando, {}
+                ))
+                quando += timedelta(seconds=tempo)
+                conversa.append((
+                    'assistant', rng.choice(RESPOSTAS).format(**valores),
+                    quando, {
+                        'tokens_used': rng.randint(250, 900),
+                        'response_time': tempo,
+                        'backend': 'mock:llama-3.1-8b-instant',
+                    }
+                ))
+                quando += timedelta(seconds=rng.randint(20, 600))
+
+            ultima_pergunta = conversa[-2][1]
+            session = ChatSession.objects.create(
+                user=user, title=message_preview(conversa[0][1]),
+                created_at=inicio, updated_at=conversa[-1][2],
+                message_count=len(conversa),
+                last_user_message_preview=message_preview(ultima_pergunta),
+                last_message_at=conversa[-1][2]
+            )
+            # bulk_create não dispara o sinal que atualiza os contadores da
+            # sessão; eles já foram preenchidos acima
+            ChatMessage.objects.bulk_create([
+                ChatMessage(
+                    session=session, role=role, content=conteudo,
+                    timestamp=timestamp, **extras
+                )
+                for role, conteudo, timestamp, extras in conversa
+            ], batch_size=2000)
+            total += len(conversa)
+        return total
@@ -35,28 +35,23 @@ class Refeicao(models.Model):
     def __str__(self):
         return self.nome
 
+    # Os totais usam self.itens.all(): com prefetch_related dos itens (e
+    # select_related do alimento) não fazem nenhuma consulta extra
+
     @property
     def total_kcal(self):
-        if not self.itens.exists():
-            return 0
         return sum(item.kcal_total for item in self.itens.all())
 
     @property
     def total_carbo(self):
-        if not self.itens.exists():
-            return 0
         return sum(item.carbo_total for item in self.itens.all())
 
     @property
     def total_proteina(self):
-        if not self.itens.exists():
-            return 0
         return sum(item.proteina_total for item in self.itens.all())
 
     @property
     def total_gordura(self):
-        if not self.itens.exists():
-            return 0
         return sum(item.gordura_total for item in self.itens.all())
 
 
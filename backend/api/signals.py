@@ -0,0 +1,10 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Alimento
+from .catalogo import invalidar_indice
+
+
+@receiver(post_save, sender=Alimento)
+@receiver(post_delete, sender=Alimento)
+def invalidar_catalogo(sender, instance, **kwargs):
+    invalidar_indice()
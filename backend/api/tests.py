@@ -1,3 +1,378 @@
-from django.test import TestCase
+import csv
+import json
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
 
-# Create your tests here.
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from chatbot.archive import archive_session
+from chatbot.models import ChatMessage, ChatSession
+from nutrition.testing import QueryBudgetMixin
+from user.models import User
+from user.views import get_tokens_for_user
+from .catalogo import invalidar_indice
+from .interpretador import interpretar_refeicao
+from .models import Alimento, Refeicao, RefeicaoAlimento
+
+
+@override_settings(
+    QUERY_BUDGET_RAISE=True,
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class ConsultasPorEndpointTests(QueryBudgetMixin, TestCase):
+    """
+    Número de consultas de cada endpoint do app, com dados suficientes para
+    um N+1 aparecer (várias refeições, vários itens por refeição)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='consultas@teste.com', name='Consultas',
+            password=make_password('Senha123')
+        )
+        cls.alimentos = Alimento.objects.bulk_create([
+            Alimento(
+                nome=f'Alimento {i}', energia_kcal=100 + i,
+                carboidratos_g=10, proteinas_g=5, lipideos_g=2
+            )
+            for i in range(12)
+        ])
+        Alimento.objects.bulk_create([
+            Alimento(
+                nome=nome, energia_kcal=kcal, carboidratos_g=carbo,
+                proteinas_g=proteina, lipideos_g=gordura
+            )
+            for nome, kcal, carbo, proteina, gordura in (
+                ('Arroz, tipo 1, cozido', 128, 28.1, 2.5, 0.2),
+                ('Ovo, de galinha, inteiro, cozido', 146, 0.6, 13.3, 9.5),
+            )
+        ])
+        refeicoes = list(Refeicao.objects.filter(user=cls.user))
+        refeicoes.append(Refeicao.objects.create(user=cls.user, nome='Ceia'))
+        RefeicaoAlimento.objects.bulk_create([
+            RefeicaoAlimento(
+                refeicao=refeicao, alimento=alimento, quantidade_g=100
+            )
+            for refeicao in refeicoes
+            for alimento in cls.alimentos[:4]
+        ])
+        cls.refeicao = refeicoes[-1]
+
+    def setUp(self):
+        invalidar_indice()
+        self.client = APIClient(SERVER_NAME='localhost')
+        token = get_tokens_for_user(self.user)['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def itens(self, quantidade=6):
+        return [
+            {'alimento_id': alimento.id, 'quantidade_g': 50}
+            for alimento in self.alimentos[:quantidade]
+        ]
+
+    def test_lista_alimentos(self):
+        with self.assertMaxQueries(2):
+            response = self.client.get('/api/alimentos/?search=alimento')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 10)
+
+    def test_lista_refeicoes_do_dia(self):
+        with self.assertMaxQueries(3):
+            response = self.client.get(
+                f'/api/refeicoes/?data={timezone.localdate().isoformat()}'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 5)
+        self.assertEqual(len(response.json()[0]['itens']), 4)
+
+    def test_cria_refeicao(self):
+        with self.assertMaxQueries(8):
+            response = self.client.post(
+                '/api/refeicoes/',
+                {'nome': 'Lanche extra', 'itens': self.itens()},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['itens']), 6)
+
+    def test_cria_refeicao_com_alimento_inexistente(self):
+        itens = self.itens() + [{'alimento_id': 0, 'quantidade_g': 10}]
+        with self.assertMaxQueries(2):
+            response = self.client.post(
+                '/api/refeicoes/',
+                {'nome': 'Inválida', 'itens': itens},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Refeicao.objects.filter(nome='Inválida').exists())
+
+    def test_detalhe_refeicao(self):
+        with self.assertMaxQueries(3):
+            response = self.client.get(f'/api/refeicoes/{self.refeicao.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['itens']), 4)
+
+    def test_atualiza_refeicao(self):
+        with self.assertMaxQueries(10):
+            response = self.client.put(
+                f'/api/refeicoes/{self.refeicao.id}/',
+                {'nome': 'Ceia leve', 'itens': self.itens(8)},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['itens']), 8)
+
+    def test_remove_refeicao(self):
+        with self.assertMaxQueries(4):
+            response = self.client.delete(
+                f'/api/refeicoes/{self.refeicao.id}/'
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_refeicao_por_texto(self):
+        with self.assertMaxQueries(8):
+            response = self.client.post(
+                '/api/refeicoes/texto/',
+                {'texto': '200g de arroz tipo 1 cozido e 1 ovo cozido',
+                 'criar': True},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['itens']), 2)
+
+    def test_exporta_refeicoes_e_mensagens(self):
+        arquivada, atual = ChatSession.objects.bulk_create([
+            ChatSession(user=self.user, title='Antiga'),
+            ChatSession(user=self.user, title='Atual'),
+        ])
+        for sessao in (arquivada, atual):
+            ChatMessage.objects.bulk_create([
+                ChatMessage(session=sessao, role=role, content=f'{role} {i}')
+                for i in range(3) for role in ('user', 'assistant')
+            ])
+        archive_session(arquivada, batch_size=4)
+
+        # Usuário, refeições, itens, lotes arquivados e mensagens
+        with self.assertMaxQueries(5):
+            response = self.client.get('/api/exportar/?formato=ndjson')
+            linhas = b''.join(response.streaming_content).splitlines()
+        registros = [json.loads(linha) for linha in linhas]
+        por_tipo = {}
+        for registro in registros:
+            por_tipo.setdefault(registro['tipo'], []).append(registro)
+        self.assertEqual(len(por_tipo['refeicao']), 5)
+        self.assertEqual(len(por_tipo['item']), 20)
+        self.assertEqual(por_tipo['item'][0]['kcal'], 100.0)
+        self.assertEqual(por_tipo['refeicao'][0]['kcal'], 406.0)
+        self.assertEqual(
+            [(m['sessao'], m['conteudo']) for m in por_tipo['mensagem']],
+            [
+                (sessao.title, f'{role} {i}')
+                for sessao in (arquivada, atual)
+                for i in range(3) for role in ('user', 'assistant')
+            ]
+        )
+
+        response = self.client.get('/api/exportar/?formato=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        linhas = list(csv.DictReader(
+            StringIO(b''.join(response.streaming_content).decode())
+        ))
+        self.assertEqual(len(linhas), len(registros))
+        self.assertEqual(linhas[-1]['conteudo'], 'assistant 2')
+
+        response = self.client.get('/api/exportar/?formato=xml')
+        self.assertEqual(response.status_code, 400)
+
+
+class InterpretadorTests(TestCase):
+    """Refeições em texto livre viram itens com quantidade em gramas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Alimento.objects.bulk_create([
+            Alimento(
+                nome=nome, energia_kcal=100, carboidratos_g=10,
+                proteinas_g=5, lipideos_g=2
+            )
+            for nome in (
+                'Arroz, tipo 1, cozido', 'Feijão, carioca, cozido',
+                'Ovo, de galinha, inteiro, cozido', 'Leite, de vaca, integral',
+                'Banana, prata, crua',
+            )
+        ])
+
+    def setUp(self):
+        invalidar_indice()
+
+    def tearDown(self):
+        invalidar_indice()
+
+    def itens(self, texto):
+        return [
+            (item.alimento.nome if item.alimento else None, item.quantidade_g)
+            for item in interpretar_refeicao(texto)
+        ]
+
+    def test_virgula_decimal(self):
+        self.assertEqual(
+            self.itens('2,5 kg de arroz, 1,5 colher de sopa de feijão'),
+            [
+                ('Arroz, tipo 1, cozido', 2500),
+                ('Feijão, carioca, cozido', 22.5),
+            ]
+        )
+
+    def test_unidades_e_medidas(self):
+        self.assertEqual(
+            self.itens(
+                '2 ovos cozidos; 1 copo de leite integral; meia banana prata'
+            ),
+            [
+                ('Ovo, de galinha, inteiro, cozido', 100),
+                ('Leite, de vaca, integral', 200),
+                ('Banana, prata, crua', 40),
+            ]
+        )
+
+    def test_separadores(self):
+        for texto in (
+            '100g de arroz e 50g de feijão',
+            '100g de arroz mais 50g de feijão',
+            '100g de arroz + 50g de feijão',
+            '100g de arroz,50g de feijão',
+        ):
+            with self.subTest(texto=texto):
+                self.assertEqual(self.itens(texto), [
+                    ('Arroz, tipo 1, cozido', 100),
+                    ('Feijão, carioca, cozido', 50),
+                ])
+
+
+class RefeicaoPorTextoTests(TestCase):
+    """Com criar: true só vão para o diário itens reconhecidos com certeza"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='texto@teste.com', name='T')
+        Alimento.objects.bulk_create([
+            Alimento(
+                nome=nome, energia_kcal=100, carboidratos_g=10,
+                proteinas_g=5, lipideos_g=2
+            )
+            for nome in (
+                'Arroz, tipo 1, cozido', 'Arroz, integral, cozido',
+                'Arroz, integral, cru', 'Frango, coxa, com pele, assada',
+                'Pão, trigo, francês', 'Manteiga, com sal',
+                'Café, infusão 10%', 'Leite, de vaca, integral',
+                'Ovo, de galinha, inteiro, cozido',
+            )
+        ])
+
+    def setUp(self):
+        invalidar_indice()
+        self.client = APIClient(SERVER_NAME='localhost')
+        token = get_tokens_for_user(self.user)['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def tearDown(self):
+        invalidar_indice()
+
+    def criar(self, texto):
+        return self.client.post(
+            '/api/refeicoes/texto/', {'texto': texto, 'criar': True},
+            format='json'
+        )
+
+    def test_itens_incertos_nao_sao_criados(self):
+        for texto, confianca, soltos in (
+            ('100g de arroz integral', 'baixa', []),
+            ('frango grelhado', 'baixa', ['grelhado']),
+            ('1 pão francês com manteiga', 'alta', ['manteiga']),
+            ('café com leite', 'baixa', ['leite']),
+        ):
+            with self.subTest(texto=texto):
+                response = self.criar(texto)
+                self.assertEqual(response.status_code, 400)
+                data = response.json()
+                self.assertFalse(data['completo'])
+                self.assertIn('total_kcal', data)
+                [item] = data['itens']
+                self.assertEqual(item['confianca'], confianca)
+                self.assertEqual(item['termos_soltos'], soltos)
+        self.assertFalse(Refeicao.objects.filter(user=self.user).exclude(
+            essencial=True
+        ).exists())
+
+    def test_alternativas_na_resposta(self):
+        [item] = self.criar('100g de arroz integral').json()['itens']
+        nomes = {item['alimento_nome']} | {
+            alt['alimento_nome'] for alt in item['alternativas']
+        }
+        self.assertLessEqual(
+            {'Arroz, integral, cozido', 'Arroz, integral, cru'}, nomes
+        )
+
+    def test_itens_certos_sao_criados(self):
+        response = self.criar('2 ovos cozidos e 1 copo de leite integral')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['itens']), 2)
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class DadosSinteticosTests(TestCase):
+    """gerar_dados_sinteticos e uma rodada curta do benchmark"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Alimento.objects.bulk_create([
+            Alimento(
+                nome=nome, energia_kcal=100, carboidratos_g=10,
+                proteinas_g=5, lipideos_g=2
+            )
+            for nome in ('Arroz, tipo 1, cozido', 'Feijão, carioca, cozido',
+                         'Banana, prata, crua', 'Pão, trigo, francês')
+        ])
+
+    def test_gera_dados_e_roda_benchmark(self):
+        call_command(
+            'gerar_dados_sinteticos', usuarios=2, dias=30, sessoes=2,
+            mensagens=6, stdout=StringIO()
+        )
+        usuarios = User.objects.filter(
+            email__endswith='@sintetico.nutriapp.dev'
+        )
+        self.assertEqual(usuarios.count(), 2)
+        diario = Refeicao.objects.filter(user__in=usuarios, essencial=False)
+        self.assertGreater(diario.count(), 30)
+        self.assertLess(
+            diario.order_by('data_criacao').first().data_criacao,
+            timezone.now() - timedelta(days=25)
+        )
+        self.assertEqual(
+            ChatMessage.objects.filter(session__user__in=usuarios).count(),
+            2 * 2 * 6
+        )
+
+        with tempfile.TemporaryDirectory() as pasta:
+            baseline = Path(pasta) / 'baseline.json'
+            call_command(
+                'benchmark', iteracoes=3, aquecimento=0,
+                cenarios=['refeicoes-lista', 'refeicoes-cria', 'perfil'],
+                baseline=str(baseline), salvar_baseline=True,
+                stdout=StringIO()
+            )
+            cenarios = json.loads(baseline.read_text())['scenarios']
+        self.assertEqual(cenarios['refeicoes-lista']['requests'], 3)
+        self.assertEqual(cenarios['perfil']['errors'], 0)
+        # As refeições criadas pelo benchmark são apagadas ao final
+        self.assertFalse(Refeicao.objects.filter(nome='Benchmark').exists())
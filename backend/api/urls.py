@@ -1,5 +1,11 @@
 from django.urls import path, include
-from api.views import AlimentoAPIView, RefeicaoCreateView, RefeicaoDetailView
+from api.views import (
+    AlimentoAPIView,
+    ExportarView,
+    RefeicaoCreateView,
+    RefeicaoDetailView,
+    RefeicaoTextoView,
+)
 from rest_framework.routers import DefaultRouter
 
 
@@ -9,5 +15,7 @@ from rest_framework.routers import DefaultRouter
 urlpatterns = [
     path('alimentos/', AlimentoAPIView.as_view(), name='alimento-list'),
     path("refeicoes/", RefeicaoCreateView.as_view(), name="refeicao-create"),
+    path("refeicoes/texto/", RefeicaoTextoView.as_view(), name="refeicao-texto"),
     path("refeicoes/<int:refeicao_id>/", RefeicaoDetailView.as_view(), name="refeicao-detail"),
+    path("exportar/", ExportarView.as_view(), name="exportar"),
 ]
@@ -7,10 +7,64 @@ from api.serializers import (
     RefeicaoSerializer
 )
 from api.models import Alimento, Refeicao, RefeicaoAlimento
+from api.interpretador import interpretar_refeicao
+from api.exportacao import COLUNAS, registros, valor_csv
 from rest_framework.permissions import IsAuthenticated
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from datetime import datetime
+from nutrition.singleflight import SingleFlight, make_key
+from nutrition.streaming import iter_csv, iter_ndjson
 # from .renderers import UserRenderer
 
+# Buscas iguais simultâneas (várias abas, vários usuários) fazem uma só query
+_busca_alimentos = SingleFlight('api.alimentos.busca')
+
+
+def refeicoes_com_itens():
+    """
+    Refeições com itens e alimentos já carregados: os itens e os totais do
+    RefeicaoSerializer saem de duas consultas, não de uma por item
+    """
+    return Refeicao.objects.prefetch_related(
+        Prefetch(
+            'itens',
+            queryset=RefeicaoAlimento.objects.select_related('alimento')
+        )
+    )
+
+
+def buscar_alimentos_dos_itens(itens):
+    """
+    Alimentos dos itens em uma consulta, por id em texto. Retorna
+    (alimentos, ids não encontrados).
+    """
+    ids = [item.get("alimento_id") for item in itens]
+    alimentos = {
+        str(alimento_id): alimento
+        for alimento_id, alimento in Alimento.objects.in_bulk(
+            [alimento_id for alimento_id in ids if alimento_id is not None]
+        ).items()
+    }
+    faltando = [
+        alimento_id for alimento_id in ids
+        if str(alimento_id) not in alimentos
+    ]
+    return alimentos, faltando
+
+
+def salvar_itens(refeicao, itens, alimentos):
+    RefeicaoAlimento.objects.bulk_create([
+        RefeicaoAlimento(
+            refeicao=refeicao,
+            alimento=alimentos[str(item.get("alimento_id"))],
+            quantidade_g=item.get("quantidade_g")
+        )
+        for item in itens
+    ])
+
 
 class AlimentoAPIView(ListAPIView):
     permission_classes = [IsAuthenticated]
@@ -31,6 +85,17 @@ class AlimentoAPIView(ListAPIView):
 
         return qs[:10]
 
+    def list(self, request, *args, **kwargs):
+        # icontains ignora maiúsculas, então "Arroz" e "arroz" são a mesma busca
+        search = request.query_params.get('search') or ''
+        dados, _ = _busca_alimentos.do(
+            make_key(search.lower()),
+            lambda: list(
+                self.get_serializer(self.get_queryset(), many=True).data
+            )
+        )
+        return Response(dados)
+
 
 class RefeicaoCreateView(GenericAPIView):
     """
@@ -50,34 +115,26 @@ class RefeicaoCreateView(GenericAPIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Criar refeição
-        refeicao = Refeicao.objects.create(
-            nome=nome,
-            descricao=descricao,
-            user=request.user
-        )
-
-        # Adicionar alimentos
-        for item in itens:
-            alimento_id = item.get("alimento_id")
-            quantidade = item.get("quantidade_g")
-
-            try:
-                alimento = Alimento.objects.get(id=alimento_id)
-            except Alimento.DoesNotExist:
-                return Response(
-                    {"error": f"Alimento {alimento_id} não encontrado"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+        alimentos, faltando = buscar_alimentos_dos_itens(itens)
+        if faltando:
+            return Response(
+                {"error": f"Alimento {faltando[0]} não encontrado"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-            RefeicaoAlimento.objects.create(
-                refeicao=refeicao,
-                alimento=alimento,
-                quantidade_g=quantidade
+        # Criar refeição com os alimentos
+        with transaction.atomic():
+            refeicao = Refeicao.objects.create(
+                nome=nome,
+                descricao=descricao,
+                user=request.user
             )
+            salvar_itens(refeicao, itens, alimentos)
 
         # Serializar a refeição criada com seus itens
-        refeicao_serializer = RefeicaoSerializer(refeicao)
+        refeicao_serializer = RefeicaoSerializer(
+            refeicoes_com_itens().get(id=refeicao.id)
+        )
 
         # Retornar refeição com totais
         return Response(
@@ -101,22 +158,13 @@ class RefeicaoCreateView(GenericAPIView):
             except ValueError:
                 data = datetime.now().date()
 
-        # Buscar TODAS as refeições essenciais (sempre devem aparecer)
-        refeicoes_essenciais = Refeicao.objects.filter(
-            essencial=True,
+        # TODAS as refeições essenciais (sempre devem aparecer) e as NÃO
+        # essenciais criadas na data específica, numa consulta só
+        refeicoes = refeicoes_com_itens().filter(
+            Q(essencial=True) | Q(essencial=False, data_criacao__date=data),
             user=request.user
         )
 
-        # Buscar refeições NÃO essenciais criadas na data específica
-        refeicoes_customizadas_na_data = Refeicao.objects.filter(
-            essencial=False,
-            user=request.user,
-            data_criacao__date=data
-        )
-
-        # Combinar as duas consultas
-        refeicoes = refeicoes_essenciais.union(refeicoes_customizadas_na_data)
-
         # Ordenar para manter consistência
         # (essenciais primeiro, depois por data de criação)
         refeicoes = refeicoes.order_by('-essencial', 'data_criacao')
@@ -131,7 +179,7 @@ class RefeicaoDetailView(APIView):
     """
     def get(self, request, refeicao_id, *args, **kwargs):
         try:
-            refeicao = Refeicao.objects.get(id=refeicao_id)
+            refeicao = refeicoes_com_itens().get(id=refeicao_id)
             serializer = RefeicaoSerializer(refeicao)
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Refeicao.DoesNotExist:
@@ -178,34 +226,135 @@ class RefeicaoDetailView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Atualizar dados da refeição
-        refeicao.nome = nome
-        refeicao.descricao = descricao
-        refeicao.save()
+        alimentos, faltando = buscar_alimentos_dos_itens(itens)
+        if faltando:
+            return Response(
+                {"error": f"Alimento {faltando[0]} não encontrado"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        # Remover itens antigos
-        RefeicaoAlimento.objects.filter(refeicao=refeicao).delete()
+        with transaction.atomic():
+            # Atualizar dados da refeição
+            refeicao.nome = nome
+            refeicao.descricao = descricao
+            refeicao.save()
 
-        # Adicionar novos itens
-        for item in itens:
-            alimento_id = item.get("alimento_id")
-            quantidade = item.get("quantidade_g")
+            # Trocar os itens antigos pelos novos
+            RefeicaoAlimento.objects.filter(refeicao=refeicao).delete()
+            salvar_itens(refeicao, itens, alimentos)
 
-            try:
-                alimento = Alimento.objects.get(id=alimento_id)
-            except Alimento.DoesNotExist:
-                return Response(
-                    {"error": f"Alimento {alimento_id} não encontrado"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+        # Serializar a refeição atualizada com seus itens
+        refeicao_serializer = RefeicaoSerializer(
+            refeicoes_com_itens().get(id=refeicao.id)
+        )
+
+        return Response(refeicao_serializer.data, status=status.HTTP_200_OK)
+
+
+class RefeicaoTextoView(GenericAPIView):
+    """
+    Registra uma refeição descrita em texto livre, ex:
+    "200g de arroz, 1 ovo cozido e 100g de frango grelhado".
+
+    Sem "criar" retorna a refeição proposta para confirmação; com
+    "criar": true cria a refeição de uma vez, desde que todos os itens
+    tenham sido reconhecidos com confiança alta ou média e sem sobras no
+    texto. Caso contrário responde 400 com a proposta e as alternativas.
+    """
+    permission_classes = [IsAuthenticated]
 
-            RefeicaoAlimento.objects.create(
-                refeicao=refeicao,
-                alimento=alimento,
-                quantidade_g=quantidade
+    def post(self, request, *args, **kwargs):
+        texto = (request.data.get("texto") or "").strip()
+        nome = request.data.get("nome") or "Refeição"
+        descricao = request.data.get("descricao", "")
+        criar = request.data.get("criar", False) in (True, "true", "1", 1)
+
+        if not texto:
+            return Response(
+                {"error": "Texto é obrigatório"},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Serializar a refeição atualizada com seus itens
-        refeicao_serializer = RefeicaoSerializer(refeicao)
+        itens = interpretar_refeicao(texto)
+        completo = bool(itens) and all(item.confirmado for item in itens)
+
+        if not criar or not completo:
+            itens_dict = [item.como_dict() for item in itens]
+            proposta = {
+                "nome": nome,
+                "descricao": descricao,
+                "completo": completo,
+                "itens": itens_dict,
+            }
+            for total, campo in (
+                ("total_kcal", "kcal_total"),
+                ("total_carbo", "carbo_total"),
+                ("total_proteina", "proteina_total"),
+                ("total_gordura", "gordura_total"),
+            ):
+                proposta[total] = round(
+                    sum(item.get(campo, 0) for item in itens_dict), 2
+                )
+            if not criar:
+                return Response(proposta, status=status.HTTP_200_OK)
+            # Palpites de baixa confiança e trechos sem alimento voltam para
+            # o usuário confirmar em vez de irem direto para o diário
+            return Response({
+                "error": "Não foi possível identificar todos os alimentos",
+                **proposta,
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            refeicao = Refeicao.objects.create(
+                nome=nome,
+                descricao=descricao,
+                user=request.user
+            )
+            RefeicaoAlimento.objects.bulk_create([
+                RefeicaoAlimento(
+                    refeicao=refeicao,
+                    alimento_id=item.alimento.id,
+                    quantidade_g=item.quantidade_g
+                )
+                for item in itens
+            ])
 
-        return Response(refeicao_serializer.data, status=status.HTTP_200_OK)
+        refeicao_serializer = RefeicaoSerializer(
+            refeicoes_com_itens().get(id=refeicao.id)
+        )
+        return Response(
+            refeicao_serializer.data,
+            status=status.HTTP_201_CREATED
+        )
+
+
+class ExportarView(APIView):
+    """
+    Exporta refeições, itens e mensagens do chat do usuário em CSV ou NDJSON
+    (?formato=csv|ndjson), gerados à medida que são enviados.
+    """
+    permission_classes = [IsAuthenticated]
+    formatos = {
+        "csv": ("text/csv; charset=utf-8", "csv"),
+        "ndjson": ("application/x-ndjson", "ndjson"),
+    }
+
+    def get(self, request, *args, **kwargs):
+        formato = request.query_params.get("formato", "ndjson")
+        if formato not in self.formatos:
+            return Response(
+                {"error": "Formato deve ser csv ou ndjson"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        dados = registros(request.user)
+        if formato == "csv":
+            conteudo = iter_csv(map(valor_csv, dados), COLUNAS)
+        else:
+            conteudo = iter_ndjson(dados)
+
+        content_type, extensao = self.formatos[formato]
+        response = StreamingHttpResponse(conteudo, content_type=content_type)
+        nome = f"nutriapp-{timezone.localdate().isoformat()}.{extensao}"
+        response["Content-Disposition"] = f'attachment; filename="{nome}"'
+        return response
@@ -1,35 +1,59 @@
 from django.contrib import admin
-from .models import ChatSession, ChatMessage, ChatbotConfig
+from django.contrib.postgres.search import SearchQuery
+from django.db.models import Q
+from .models import (
+    ChatSession, ChatMessage, ChatArchive, ChatJob, ChatbotConfig
+)
 
 
 @admin.register(ChatSession)
 class ChatSessionAdmin(admin.ModelAdmin):
     list_display = [
-        'id', 'user', 'title', 'is_active', 'created_at', 'message_count'
+        'id', 'user', 'title', 'is_active', 'created_at', 'message_count',
+        'last_message_at'
     ]
     list_filter = ['is_active', 'created_at', 'updated_at']
     search_fields = ['user__name', 'user__email', 'title']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = [
+        'created_at', 'updated_at', 'message_count',
+        'last_user_message_preview', 'last_user_message_at',
+        'last_message_at'
+    ]
     date_hierarchy = 'created_at'
-    
-    def message_count(self, obj):
-        return obj.messages.count()
-    message_count.short_description = 'Mensagens'
 
 
 @admin.register(ChatMessage)
 class ChatMessageAdmin(admin.ModelAdmin):
     list_display = [
         'id', 'session', 'role', 'content_preview', 'timestamp',
-        'tokens_used', 'response_time'
+        'tokens_used', 'response_time', 'source', 'backend', 'hedged'
+    ]
+    list_filter = [
+        'role', 'source', 'backend', 'hedged', 'timestamp', 'session__user'
     ]
-    list_filter = ['role', 'timestamp', 'session__user']
-    search_fields = ['content', 'session__title', 'session__user__name']
+    search_fields = ['session__title', 'session__user__name']
     readonly_fields = [
-        'timestamp', 'tokens_used', 'response_time', 'session', 'role'
+        'timestamp', 'tokens_used', 'response_time', 'session', 'role',
+        'source', 'backend', 'hedged'
     ]
     date_hierarchy = 'timestamp'
-    
+
+    def get_search_results(self, request, queryset, search_term):
+        # Conteúdo pela busca textual (índice GIN) em vez de icontains sobre
+        # a tabela inteira; título e usuário filtram as sessões (pequenas)
+        if not search_term:
+            return queryset, False
+        sessions = ChatSession.objects.filter(
+            Q(title__icontains=search_term)
+            | Q(user__name__icontains=search_term)
+        ).values('id')
+        query = SearchQuery(
+            search_term, config='portuguese', search_type='websearch'
+        )
+        return queryset.filter(
+            Q(search_vector=query) | Q(session_id__in=sessions)
+        ), False
+
     def content_preview(self, obj):
         if len(obj.content) > 100:
             return obj.content[:100] + '...'
@@ -37,6 +61,34 @@ class ChatMessageAdmin(admin.ModelAdmin):
     content_preview.short_description = 'Conteúdo'
 
 
+@admin.register(ChatArchive)
+class ChatArchiveAdmin(admin.ModelAdmin):
+    list_display = [
+        'id', 'session', 'message_count', 'first_timestamp',
+        'last_timestamp', 'codec', 'raw_size', 'created_at'
+    ]
+    list_filter = ['codec', 'created_at']
+    exclude = ['data']
+    readonly_fields = [
+        'session', 'first_message_id', 'last_message_id', 'first_timestamp',
+        'last_timestamp', 'message_count', 'codec', 'raw_size', 'created_at'
+    ]
+
+
+@admin.register(ChatJob)
+class ChatJobAdmin(admin.ModelAdmin):
+    list_display = [
+        'id', 'session', 'status', 'attempts', 'next_attempt_at',
+        'locked_by', 'created_at'
+    ]
+    list_filter = ['status', 'created_at']
+    readonly_fields = [
+        'session', 'user_message', 'assistant_message', 'attempts',
+        'locked_by', 'locked_at', 'error', 'created_at', 'updated_at'
+    ]
+    date_hierarchy = 'created_at'
+
+
 @admin.register(ChatbotConfig)
 class ChatbotConfigAdmin(admin.ModelAdmin):
     list_display = [
@@ -0,0 +1,177 @@
+"""
+Controle de admissão das chamadas ao LLM.
+
+Em um pico de mensagens, todas as threads do servidor ficariam presas
+esperando o backend, e até os endpoints de refeições e catálogo passariam a
+esperar por uma thread livre. O número de chamadas simultâneas ao LLM é
+limitado por processo (CHATBOT_MAX_INFLIGHT) e, opcionalmente, no total
+entre processos via cache (CHATBOT_MAX_INFLIGHT_GLOBAL). Quem passa do
+limite espera até CHATBOT_ADMISSION_WAIT segundos por uma vaga; depois disso
+recebe AdmissionRejected (503 com Retry-After na API).
+
+As vagas globais são chaves próprias no cache (uma por vaga), reservadas
+com cache.add e com prazo de 4x CHATBOT_LLM_TIMEOUT: a vaga de um processo
+morto expira sozinha, sem afetar as vagas das chamadas em andamento (com um
+contador único, a expiração da chave zerava a contagem e o limite deixava
+de valer).
+"""
+import logging
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+from nutrition import tracing
+
+from .providers import ProviderError
+
+logger = logging.getLogger(__name__)
+
+SLOT_KEY = 'chatbot:admission:slot:{}'
+
+
+class AdmissionRejected(ProviderError):
+    """Sem vaga para chamar o LLM dentro da espera permitida"""
+
+    def __init__(self, retry_after):
+        super().__init__(
+            "Chatbot sobrecarregado, tente novamente em instantes",
+            status_code=503,
+            retryable=True
+        )
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, limit=None, global_limit=None, wait=None):
+        self.limit = settings.CHATBOT_MAX_INFLIGHT if limit is None else limit
+        self.global_limit = (
+            settings.CHATBOT_MAX_INFLIGHT_GLOBAL if global_limit is None
+            else global_limit
+        )
+        self.wait = settings.CHATBOT_ADMISSION_WAIT if wait is None else wait
+        self._semaphore = threading.BoundedSemaphore(self.limit or 1)
+        self._lock = threading.Lock()
+        self.stats = {
+            'in_flight': 0,
+            'waiting': 0,
+            'max_waiting': 0,
+            'admitted': 0,
+            'rejected': 0,
+            'wait_seconds': 0.0,
+        }
+
+    def _update(self, **deltas):
+        with self._lock:
+            for key, delta in deltas.items():
+                self.stats[key] += delta
+            self.stats['max_waiting'] = max(
+                self.stats['max_waiting'], self.stats['waiting']
+            )
+
+    def _slot_keys(self):
+        return [SLOT_KEY.format(i) for i in range(self.global_limit)]
+
+    def _acquire_global(self, deadline):
+        """Reserva uma vaga global; retorna (chave, dono) ou None"""
+        token = uuid.uuid4().hex
+        keys = self._slot_keys()
+        while True:
+            # Começa de uma vaga aleatória para os processos não disputarem
+            # sempre as primeiras chaves
+            start = random.randrange(len(keys))
+            for key in keys[start:] + keys[:start]:
+                if cache.add(
+                    key, token, timeout=settings.CHATBOT_LLM_TIMEOUT * 4
+                ):
+                    return key, token
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.05)
+
+    def _release_global(self, lease):
+        key, token = lease
+        # A vaga pode ter expirado e sido reservada por outra chamada
+        if cache.get(key) == token:
+            cache.delete(key)
+
+    @contextmanager
+    def slot(self):
+        """Reserva uma vaga para uma chamada ao LLM"""
+        if not self.limit and not self.global_limit:
+            yield
+            return
+
+        started = time.monotonic()
+        deadline = started + self.wait
+        self._update(waiting=1)
+        acquired_local = False
+        lease = None
+        try:
+            with tracing.span('chatbot.admission'):
+                if self.limit:
+                    acquired_local = self._semaphore.acquire(
+                        timeout=self.wait
+                    )
+                if self.global_limit and (acquired_local or not self.limit):
+                    try:
+                        lease = self._acquire_global(deadline)
+                    except Exception:
+                        # Erro no cache: a vaga local não pode ficar presa
+                        if acquired_local:
+                            self._semaphore.release()
+                        raise
+        finally:
+            self._update(
+                waiting=-1, wait_seconds=time.monotonic() - started
+            )
+
+        admitted = (
+            (acquired_local or not self.limit)
+            and (lease is not None or not self.global_limit)
+        )
+        if not admitted:
+            if acquired_local:
+                self._semaphore.release()
+            self._update(rejected=1)
+            logger.warning("Chamada ao LLM recusada: limite de concorrência")
+            raise AdmissionRejected(settings.CHATBOT_ADMISSION_RETRY_AFTER)
+
+        self._update(admitted=1, in_flight=1)
+        try:
+            yield
+        finally:
+            self._update(in_flight=-1)
+            if lease is not None:
+                self._release_global(lease)
+            if acquired_local:
+                self._semaphore.release()
+
+    def snapshot(self):
+        with self._lock:
+            data = {
+                'limit': self.limit,
+                'global_limit': self.global_limit,
+                **self.stats,
+            }
+        data['wait_seconds'] = round(data['wait_seconds'], 3)
+        if self.global_limit:
+            data['global_in_flight'] = len(cache.get_many(self._slot_keys()))
+        return data
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission():
+    """Controlador de admissão do processo"""
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController()
+        return _controller
@@ -7,5 +7,4 @@ class ChatbotConfig(AppConfig):
     verbose_name = 'Chatbot Nutricional'
     
     def ready(self):
-        # Importa signals se houver
-        pass
+        from . import signals  # noqa: F401
@@ -0,0 +1,191 @@
+"""
+Arquivamento (hot/cold) das mensagens de sessões antigas.
+
+Mensagens de sessões sem atividade há CHATBOT_ARCHIVE_AFTER_DAYS dias saem
+de ChatMessage e vão para ChatArchive em lotes de JSON comprimido (zlib ou
+zstd, se o pacote zstandard estiver instalado), um conjunto de lotes por
+sessão. A tabela quente e seus índices ficam pequenos; o histórico antigo
+continua disponível pela paginação de mensagens (MessagePagination), que
+completa a página com os lotes arquivados quando as mensagens quentes
+acabam.
+"""
+import json
+import logging
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ChatArchive, ChatJob, ChatMessage, ChatSession
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_FIELDS = [
+    'id', 'role', 'content', 'timestamp', 'tokens_used', 'response_time',
+    'source', 'backend', 'hedged',
+]
+
+
+def _compress(raw, codec):
+    if codec == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=10).compress(raw)
+    return zlib.compress(raw, 9)
+
+
+def _decompress(data, codec):
+    data = bytes(data)
+    if codec == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def _codec():
+    codec = settings.CHATBOT_ARCHIVE_CODEC
+    if codec == 'zstd':
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            logger.warning("zstandard não instalado, usando zlib")
+            return 'zlib'
+    return codec
+
+
+def _pack(messages, codec):
+    rows = [
+        {
+            **{field: getattr(message, field) for field in ARCHIVED_FIELDS},
+            'timestamp': message.timestamp.isoformat(),
+        }
+        for message in messages
+    ]
+    raw = json.dumps(rows, ensure_ascii=False, separators=(',', ':'))
+    raw = raw.encode()
+    return _compress(raw, codec), len(raw)
+
+
+def unpack(archive):
+    """Mensagens de um lote como ChatMessage não salvas, em ordem do chat"""
+    rows = json.loads(_decompress(archive.data, archive.codec))
+    return [
+        ChatMessage(
+            session_id=archive.session_id,
+            **{**row, 'timestamp': parse_datetime(row['timestamp'])}
+        )
+        for row in rows
+    ]
+
+
+def _busy_jobs():
+    return ChatJob.objects.filter(
+        status__in=[ChatJob.STATUS_PENDING, ChatJob.STATUS_RUNNING]
+    )
+
+
+def archive_session(session, batch_size=None):
+    """
+    Move todas as mensagens da sessão para lotes arquivados. Para se a
+    sessão tiver um job na fila ou em execução, que ainda precisa da
+    mensagem do usuário.
+    """
+    batch_size = batch_size or settings.CHATBOT_ARCHIVE_BATCH_SIZE
+    codec = _codec()
+    archived = 0
+
+    while True:
+        with transaction.atomic():
+            # Lock da sessão: enqueue_message de outra requisição espera o
+            # lote terminar
+            ChatSession.objects.select_for_update().filter(
+                id=session.id
+            ).exists()
+            if _busy_jobs().filter(session_id=session.id).exists():
+                logger.info(
+                    f"Sessão {session.id} com job em andamento, arquivamento "
+                    f"interrompido"
+                )
+                break
+            messages = list(
+                ChatMessage.objects.select_for_update()
+                .filter(session=session)
+                .order_by('timestamp', 'id')[:batch_size]
+            )
+            if not messages:
+                break
+            data, raw_size = _pack(messages, codec)
+            ChatArchive.objects.create(
+                session=session,
+                first_message_id=messages[0].id,
+                last_message_id=messages[-1].id,
+                first_timestamp=messages[0].timestamp,
+                last_timestamp=messages[-1].timestamp,
+                message_count=len(messages),
+                codec=codec,
+                data=data,
+                raw_size=raw_size,
+            )
+            # Só os ids empacotados: mensagens inseridas durante o lote ficam
+            # na tabela para o próximo
+            ChatMessage.objects.filter(
+                id__in=[message.id for message in messages]
+            ).delete()
+            archived += len(messages)
+
+    return archived
+
+
+def sessions_to_archive(days=None):
+    """Sessões sem atividade há `days` dias, sem jobs em andamento"""
+    days = days if days is not None else settings.CHATBOT_ARCHIVE_AFTER_DAYS
+    cutoff = timezone.now() - timedelta(days=days)
+    busy = _busy_jobs().values('session_id')
+    return (
+        ChatSession.objects
+        .filter(updated_at__lt=cutoff, messages__isnull=False)
+        .exclude(id__in=busy)
+        .distinct()
+    )
+
+
+def archive_old_sessions(days=None, batch_size=None, limit=None):
+    """Arquiva as sessões antigas; retorna (sessões, mensagens)"""
+    sessions = sessions_to_archive(days).order_by('updated_at')
+    if limit:
+        sessions = sessions[:limit]
+
+    total_sessions = total_messages = 0
+    for session in list(sessions):
+        total_messages += archive_session(session, batch_size)
+        total_sessions += 1
+    if total_sessions:
+        logger.info(
+            f"{total_messages} mensagens de {total_sessions} sessões "
+            f"arquivadas"
+        )
+    return total_sessions, total_messages
+
+
+def archived_before(session, before=None, limit=50):
+    """
+    Até `limit` mensagens arquivadas da sessão anteriores ao cursor
+    (timestamp, id), da mais recente para a mais antiga
+    """
+    batches = ChatArchive.objects.filter(session=session)
+    if before is not None:
+        batches = batches.filter(first_timestamp__lte=before[0])
+    batches = batches.order_by('-last_timestamp', '-last_message_id')
+
+    found = []
+    for batch in batches.iterator(chunk_size=2):
+        messages = [
+            message for message in reversed(unpack(batch))
+            if before is None or (message.timestamp, message.id) < before
+        ]
+        found.extend(messages)
+        if len(found) >= limit:
+            break
+    return found[:limit]
@@ -0,0 +1,77 @@
+"""
+Coalescência de chamadas idênticas ao LLM (ver nutrition/singleflight.py).
+
+Duas chamadas só são consideradas iguais quando a conversa inteira enviada
+ao modelo (prompt de sistema com o perfil, histórico e pergunta) e os
+parâmetros coincidem, após normalizar espaços. Na prática isso junta envios
+duplicados e perguntas repetidas em sessões novas com o mesmo contexto.
+Entre processos, só quem chegou enquanto a chamada estava em andamento
+recebe a resposta dela; a mesma pergunta repetida depois chama o modelo.
+A resposta compartilhada tem tokens_used=0: só quem fez a chamada tem os
+tokens descontados da cota.
+"""
+import dataclasses
+import re
+
+from django.conf import settings
+
+from nutrition.singleflight import SingleFlight, make_key
+
+from .providers import LLMProvider
+
+_SPACES_RE = re.compile(r'\s+')
+
+_flight = None
+
+
+def _get_flight():
+    global _flight
+    if _flight is None:
+        _flight = SingleFlight(
+            'chatbot.complete', wait=settings.CHATBOT_LLM_TIMEOUT + 1,
+            concurrent_only=True
+        )
+    return _flight
+
+
+def _normalize(messages):
+    return [
+        (m['role'], _SPACES_RE.sub(' ', m['content']).strip())
+        for m in messages
+    ]
+
+
+class CoalescingProvider(LLMProvider):
+    """Compartilha uma chamada em andamento entre pedidos idênticos"""
+
+    def __init__(self, provider):
+        super().__init__(provider.model)
+        self.provider = provider
+        self.name = provider.name
+        self.flight = _get_flight()
+
+    def complete(self, messages, max_tokens, temperature, timeout=None,
+                 cancel_event=None):
+        key = make_key(
+            self.name, self.model, max_tokens, temperature,
+            _normalize(messages)
+        )
+        response, shared = self.flight.do(
+            key,
+            lambda: self.provider.complete(
+                messages, max_tokens, temperature, timeout=timeout
+            )
+        )
+        if shared:
+            return dataclasses.replace(
+                response, coalesced=True, prompt_tokens=0,
+                completion_tokens=0
+            )
+        return response
+
+    def stream(self, messages, max_tokens, temperature, timeout=None,
+               cancel_event=None):
+        return self.provider.stream(
+            messages, max_tokens, temperature,
+            timeout=timeout, cancel_event=cancel_event
+        )
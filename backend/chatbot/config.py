@@ -0,0 +1,123 @@
+"""
+Configuração ativa do chatbot, mantida em memória no processo.
+
+Toda mensagem do chat precisa de ChatbotConfig (modelo, max_tokens,
+temperatura, prompt de sistema), mas a configuração quase nunca muda. Cada
+processo guarda a sua cópia e só consulta o banco quando a versão publicada
+no cache compartilhado muda; salvar ou excluir uma ChatbotConfig gera uma
+nova versão (signals.py). A versão é conferida no cache no máximo a cada
+CHATBOT_CONFIG_CHECK_INTERVAL segundos (uma leitura do cache, não do
+banco), então as mensagens do chat não fazem consultas para ler a
+configuração.
+
+Sem um cache compartilhado (CACHE_BACKEND) a nova versão só é vista pelo
+processo que salvou a configuração; os outros a releem do banco quando a
+cópia passa de CHATBOT_CONFIG_MAX_AGE segundos.
+"""
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from nutrition import metrics
+
+from .models import ChatbotConfig
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'chatbot:config:version'
+
+DEFAULT_CONFIG = {
+    'model_name': "llama-3.1-8b-instant",
+    'max_tokens': 500,
+    'temperature': 0.7,
+    'system_prompt': """
+Você é um assistente nutricional especializado e amigável do NutriApp.
+Suas principais funções são:
+1. Responder dúvidas sobre nutrição de forma clara e educativa
+2. Sugerir substituições de alimentos baseadas no perfil do usuário
+3. Explicar valores nutricionais e benefícios dos alimentos
+4. Dar orientações personalizadas considerando objetivos
+(emagrecer, ganhar peso, manter)
+5. Sempre orientar a procurar um nutricionista para casos específicos
+
+Mantenha suas respostas:
+- Claras e objetivas
+- Baseadas em evidências científicas
+- Personalizadas quando possível
+- Sempre incentivando hábitos saudáveis
+- Nunca substitua consulta médica ou nutricional profissional
+
+Responda sempre em português brasileiro e seja amigável.
+""".strip(),
+    'is_active': True,
+}
+
+# RLock: criar a configuração padrão dispara o signal que invalida o cache
+_lock = threading.RLock()
+_state = {
+    'config': None, 'version': None, 'checked_at': 0.0, 'loaded_at': 0.0
+}
+
+
+def _current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Primeira leitura (ou cache limpo): publica uma versão; se outro
+        # processo publicou antes, vale a dele
+        cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _load():
+    config = (
+        ChatbotConfig.objects.filter(is_active=True)
+        .order_by('-updated_at', '-id')
+        .first()
+    )
+    if config is None:
+        # Sem configuração ativa: cria a padrão (a mesma do setup_chatbot)
+        config = ChatbotConfig.objects.create(**DEFAULT_CONFIG)
+        logger.warning(
+            f"Nenhuma configuração ativa do chatbot; padrão criada "
+            f"(ID: {config.id})"
+        )
+    return config
+
+
+def get_active_config():
+    """Configuração ativa do chatbot, do cache do processo quando possível"""
+    now = time.monotonic()
+    interval = settings.CHATBOT_CONFIG_CHECK_INTERVAL
+    with _lock:
+        config = _state['config']
+        if config is not None and now - _state['checked_at'] < interval:
+            metrics.inc('nutriapp_cache_requests_total', cache='config',
+                        result='hit')
+            return config
+
+        version = _current_version()
+        stale = (
+            config is None or version != _state['version']
+            or now - _state['loaded_at'] >= settings.CHATBOT_CONFIG_MAX_AGE
+        )
+        metrics.inc('nutriapp_cache_requests_total', cache='config',
+                    result='miss' if stale else 'hit')
+        if stale:
+            config = _load()
+            _state['loaded_at'] = now
+        _state.update(config=config, version=version, checked_at=now)
+        return config
+
+
+def invalidate_config():
+    """Publica uma nova versão; todos os processos recarregam a configuração"""
+    cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    with _lock:
+        _state.update(
+            config=None, version=None, checked_at=0.0, loaded_at=0.0
+        )
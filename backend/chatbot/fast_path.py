@@ -0,0 +1,181 @@
+"""
+Respostas diretas do catálogo TACO, sem chamar o modelo.
+
+Perguntas do tipo "quantas calorias tem 150g de arroz integral cozido" ou
+"o que tem mais proteína, X ou Y?" são resolvidas com o índice de alimentos
+e uma regra de três. Quando o parser não tem certeza (alimento ambíguo,
+mais de um alimento, preparo que o catálogo não tem, unidade desconhecida,
+pergunta aberta) retorna None e a mensagem segue para o modelo.
+"""
+import re
+
+from api.catalogo import get_indice, normalizar
+
+
+# (campo, rótulo, unidade, radicais que identificam o nutriente)
+NUTRIENTS = [
+    ('energia_kcal', 'Calorias', 'kcal', ('caloria', 'kcal', 'energia')),
+    ('carboidratos_g', 'Carboidratos', 'g', ('carboidrato', 'carbo')),
+    ('proteinas_g', 'Proteínas', 'g', ('proteina',)),
+    ('lipideos_g', 'Gorduras', 'g', ('gordura', 'lipideo')),
+    ('fibra_g', 'Fibras', 'g', ('fibra',)),
+    ('sodio_mg', 'Sódio', 'mg', ('sodio',)),
+]
+MAIN_NUTRIENTS = ['energia_kcal', 'carboidratos_g', 'proteinas_g', 'lipideos_g']
+
+_NUTRIENT_RE = {
+    field: re.compile(r"\b(" + "|".join(stems) + r")")
+    for field, _, _, stems in NUTRIENTS
+}
+_ALL_NUTRIENTS_RE = re.compile(
+    r"\b(valor(es)? nutricion\w*|informac\w* nutricion\w*|"
+    r"tabela nutricional|macros?|macronutrientes?)\b"
+)
+_LOOKUP_RE = re.compile(r"\b(quant[oa]s?|qual|quais|valor(es)?|informac\w*)\b")
+_COMPARE_RE = re.compile(r"\b(mais|menos|compar\w*)\b")
+_SPLIT_RE = re.compile(r"\bou\b|\bvs\.?|\bversus\b|\be\b")
+# Perguntas abertas ficam com o modelo mesmo citando alimento e nutriente
+_OPEN_QUESTION_RE = re.compile(
+    r"\b(por ?que|devo|posso|como|melhor|substitu\w*|dieta|emagre\w*|"
+    r"engord\w*|ganhar|perder|receita|benefici\w*|faz mal|saudave\w*|"
+    r"recomend\w*|dia|diari\w*|meta)\b"
+)
+_GRAMS_RE = re.compile(
+    r"(\d+(?:[.,]\d+)?)\s*(kg|quilos?|g|gr|gramas?)\b"
+)
+_NUMBER_RE = re.compile(r"\d")
+# Palavras da pergunta, retiradas antes de conferir os termos do alimento
+_QUESTION_WORDS_RE = re.compile(
+    r"\b(" + "|".join(
+        stem for _, _, _, stems in NUTRIENTS for stem in stems
+    ) + r")\w*|" + _LOOKUP_RE.pattern
+)
+
+MAX_WORDS = 25
+
+
+def _fmt(value):
+    return f"{value:.1f}".rstrip('0').rstrip('.')
+
+
+def _parse_grams(text):
+    """
+    Quantidade em gramas citada no texto (100 se nenhuma).
+
+    Retorna None se há números que não são gramas ("2 ovos", "1 xícara"),
+    caso em que a resposta direta não é confiável.
+    """
+    matches = list(_GRAMS_RE.finditer(text))
+    if len(matches) > 1:
+        return None
+    if not matches:
+        return None if _NUMBER_RE.search(text) else 100.0
+    remaining = text[:matches[0].start()] + text[matches[0].end():]
+    if _NUMBER_RE.search(remaining):
+        return None
+    value = float(matches[0].group(1).replace(',', '.'))
+    if matches[0].group(2).startswith(('kg', 'quilo')):
+        value *= 1000
+    return value if value > 0 else None
+
+
+def _requested_nutrients(text):
+    if _ALL_NUTRIENTS_RE.search(text):
+        return list(MAIN_NUTRIENTS)
+    return [field for field, regex in _NUTRIENT_RE.items() if regex.search(text)]
+
+
+def _nutrient_meta(field):
+    for name, label, unit, _ in NUTRIENTS:
+        if name == field:
+            return label, unit
+    raise KeyError(field)
+
+
+def _resolve(indice, text):
+    """
+    O alimento do texto, ou None se sobrar no texto outro alimento ou um
+    preparo que não está no nome dele
+    """
+    food = indice.resolver(text)
+    if food is None:
+        return None
+    if indice.termos_soltos(_QUESTION_WORDS_RE.sub(' ', text), food):
+        return None
+    return food
+
+
+def _answer_lookup(text, fields):
+    grams = _parse_grams(text)
+    if grams is None:
+        return None
+    food = _resolve(get_indice(), _GRAMS_RE.sub(' ', text))
+    if food is None:
+        return None
+
+    lines = [f"🍽️ **{_fmt(grams)} g de {food.nome}** (Tabela TACO):"]
+    for field in fields:
+        value = getattr(food, field)
+        if value is None:
+            continue
+        label, unit = _nutrient_meta(field)
+        lines.append(f"- {label}: **{_fmt(value * grams / 100)} {unit}**")
+    if len(lines) == 1:
+        return None
+    return "\n".join(lines)
+
+
+def _answer_comparison(text, fields):
+    if len(fields) != 1 or _parse_grams(text) != 100.0:
+        return None
+    parts = [part for part in _SPLIT_RE.split(text) if part.strip()]
+    if len(parts) != 2:
+        return None
+
+    indice = get_indice()
+    foods = [_resolve(indice, part) for part in parts]
+    if None in foods or foods[0].id == foods[1].id:
+        return None
+
+    field = fields[0]
+    values = [getattr(food, field) for food in foods]
+    if None in values:
+        return None
+    label, unit = _nutrient_meta(field)
+
+    lines = [f"⚖️ **{label}** em 100 g (Tabela TACO):"]
+    for food, value in zip(foods, values):
+        lines.append(f"- {food.nome}: **{_fmt(value)} {unit}**")
+
+    if values[0] == values[1]:
+        lines.append("\nOs dois têm a mesma quantidade.")
+    else:
+        wants_less = re.search(r"\bmenos\b", text) is not None
+        pick = min if wants_less else max
+        winner = foods[values.index(pick(values))]
+        direction = "menos" if wants_less else "mais"
+        lines.append(f"\n➡️ **{winner.nome}** tem {direction} {label.lower()}.")
+    return "\n".join(lines)
+
+
+def try_answer(message):
+    """
+    Resposta pronta para perguntas de consulta/comparação ao catálogo, ou
+    None quando a pergunta deve ir para o modelo
+    """
+    text = normalizar(message)
+    if len(text.split()) > MAX_WORDS or _OPEN_QUESTION_RE.search(text):
+        return None
+
+    fields = _requested_nutrients(text)
+    if not fields:
+        return None
+
+    if _COMPARE_RE.search(text):
+        return _answer_comparison(text, fields)
+    starts_with_nutrient = any(
+        _NUTRIENT_RE[field].match(text) for field in fields
+    )
+    if starts_with_nutrient or _LOOKUP_RE.search(text):
+        return _answer_lookup(text, fields)
+    return None
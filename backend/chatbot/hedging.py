@@ -0,0 +1,231 @@
+"""
+Pedidos "hedged" para cortar a latência de cauda do LLM.
+
+A chamada vai primeiro ao backend principal. Se ele não responder dentro de
+um atraso igual ao percentil CHATBOT_HEDGE_PERCENTILE das suas latências
+recentes (ou falhar antes disso), uma cópia do pedido vai ao backend
+secundário; a primeira resposta vence e a outra chamada é cancelada. Como só
+as chamadas mais lentas que o percentil são duplicadas, o custo extra fica
+em torno de (1 - percentil) das chamadas.
+
+Nem todo backend interrompe a chamada cancelada (a do Groq vai até o fim),
+então o perdedor pode continuar ocupando uma thread do pool. Cada chamada
+reserva uma vaga do pool até terminar de fato; sem vaga, o principal roda na
+thread da requisição e o pedido não é duplicado.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+from .providers import LLMProvider, ProviderCancelled, ProviderError
+
+logger = logging.getLogger(__name__)
+
+# Pool compartilhado pelas chamadas hedged do processo e as suas vagas,
+# ocupadas até a chamada terminar (inclusive a perdedora da corrida)
+_executor = None
+_slots = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is None:
+            _slots = threading.BoundedSemaphore(
+                settings.CHATBOT_HEDGE_POOL_SIZE
+            )
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.CHATBOT_HEDGE_POOL_SIZE,
+                thread_name_prefix='llm-hedge'
+            )
+        return _executor
+
+
+class LatencyTracker:
+    """Janela das últimas latências (s) de sucesso de um backend"""
+
+    def __init__(self, window=200):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(q * len(samples)))
+        return samples[index]
+
+
+_stats_lock = threading.Lock()
+_trackers = {}
+_stats = {}
+
+
+def _tracker(name):
+    with _stats_lock:
+        if name not in _trackers:
+            _trackers[name] = LatencyTracker()
+            _stats[name] = {
+                'calls': 0, 'hedged': 0, 'secondary_wins': 0,
+                'pool_full': 0,
+            }
+        return _trackers[name]
+
+
+def _count(name, key):
+    with _stats_lock:
+        _stats[name][key] += 1
+
+
+def hedging_snapshot():
+    """Taxa de hedge e de vitórias do secundário por backend principal"""
+    with _stats_lock:
+        items = [(name, dict(stats)) for name, stats in _stats.items()]
+    snapshot = []
+    for name, stats in items:
+        calls = stats['calls'] or 1
+        delay = _trackers[name].percentile(settings.CHATBOT_HEDGE_PERCENTILE)
+        snapshot.append({
+            'primary': name,
+            **stats,
+            'hedge_rate': round(stats['hedged'] / calls, 3),
+            'current_delay': round(delay, 3) if delay is not None else None,
+        })
+    return snapshot
+
+
+class HedgedProvider(LLMProvider):
+    """
+    Envia o pedido ao `primary` e, se ele demorar ou falhar, também ao
+    `secondary`. Os dois normalmente são ResilientProvider, de modo que cada
+    um mantém prazo e circuit breaker próprios.
+    """
+
+    def __init__(self, primary, secondary, percentile=None, min_delay=None,
+                 max_delay=None, initial_delay=None):
+        super().__init__(primary.model)
+        self.primary = primary
+        self.secondary = secondary
+        self.name = primary.name
+        self.label = f"{primary.name}:{primary.model}"
+        self.percentile = percentile or settings.CHATBOT_HEDGE_PERCENTILE
+        self.min_delay = (
+            min_delay if min_delay is not None
+            else settings.CHATBOT_HEDGE_MIN_DELAY
+        )
+        self.max_delay = max_delay or settings.CHATBOT_HEDGE_MAX_DELAY
+        self.initial_delay = (
+            initial_delay or settings.CHATBOT_HEDGE_INITIAL_DELAY
+        )
+        self.tracker = _tracker(self.label)
+
+    def hedge_delay(self):
+        """Quanto esperar pelo principal antes de acionar o secundário"""
+        delay = self.tracker.percentile(self.percentile)
+        if delay is None:
+            return self.initial_delay
+        return min(max(delay, self.min_delay), self.max_delay)
+
+    def _timed(self, provider, **kwargs):
+        started = time.monotonic()
+        try:
+            response = provider.complete(**kwargs)
+        except ProviderCancelled:
+            # O principal perdeu a corrida depois do atraso do hedge: a
+            # latência real é pelo menos esta. Sem ela o percentil ficaria
+            # só com as chamadas rápidas e o hedge dispararia cada vez mais
+            if provider is self.primary:
+                self.tracker.add(time.monotonic() - started)
+            raise
+        elapsed = time.monotonic() - started
+        # Registrada mesmo quando o principal perde (e não é interrompido)
+        if provider is self.primary:
+            self.tracker.add(elapsed)
+        return response, elapsed
+
+    def _run(self, provider, **kwargs):
+        try:
+            return self._timed(provider, **kwargs)
+        finally:
+            _slots.release()
+
+    def complete(self, messages, max_tokens, temperature, timeout=None,
+                 cancel_event=None):
+        executor = _get_executor()
+        kwargs = dict(
+            messages=messages, max_tokens=max_tokens,
+            temperature=temperature, timeout=timeout
+        )
+        cancels = {}
+
+        def submit(provider):
+            if not _slots.acquire(blocking=False):
+                return None
+            cancels[provider] = threading.Event()
+            future = executor.submit(
+                self._run, provider,
+                cancel_event=cancels[provider], **kwargs
+            )
+            future.provider = provider
+            return future
+
+        _count(self.label, 'calls')
+        primary = submit(self.primary)
+        if primary is None:
+            # Pool tomado (inclusive por perdedores ainda rodando): sem hedge
+            _count(self.label, 'pool_full')
+            response, _ = self._timed(
+                self.primary, cancel_event=cancel_event, **kwargs
+            )
+            return response
+        done, pending = wait({primary}, timeout=self.hedge_delay())
+
+        primary_failed = any(f.exception() is not None for f in done)
+        if not done or primary_failed:
+            secondary = submit(self.secondary)
+            if secondary is not None:
+                _count(self.label, 'hedged')
+                pending.add(secondary)
+            else:
+                _count(self.label, 'pool_full')
+
+        last_error = None
+        try:
+            while True:
+                for future in done:
+                    if future.exception() is not None:
+                        last_error = future.exception()
+                        continue
+                    response, _ = future.result()
+                    if future.provider is not self.primary:
+                        _count(self.label, 'secondary_wins')
+                    response.hedged = len(cancels) > 1
+                    return response
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        finally:
+            # Cancela quem ainda está rodando (perdedor da corrida)
+            for future in pending:
+                cancels[future.provider].set()
+
+        logger.warning(f"Hedge de {self.label} falhou nos dois backends")
+        raise last_error or ProviderError("Nenhum backend respondeu")
+
+    def stream(self, messages, max_tokens, temperature, timeout=None,
+               cancel_event=None):
+        # Streaming não é duplicado: o texto já começa a chegar ao cliente
+        return self.primary.stream(
+            messages, max_tokens, temperature,
+            timeout=timeout, cancel_event=cancel_event
+        )
@@ -0,0 +1,114 @@
+import math
+import re
+
+from .models import ChatMessage
+
+# Aproximação local do tokenizador: palavras são quebradas em pedaços de
+# ~4 caracteres (média observada para português nos modelos Llama) e cada
+# sinal de pontuação conta como um token.
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+CHARS_PER_TOKEN = 4
+# Tokens extras que o formato de chat adiciona por mensagem (role, separadores)
+MESSAGE_OVERHEAD = 4
+
+
+def count_tokens(text):
+    """Estimativa do número de tokens de um texto, sem rede"""
+    if not text:
+        return 0
+    total = 0
+    for piece in _TOKEN_RE.findall(text):
+        total += max(1, math.ceil(len(piece) / CHARS_PER_TOKEN))
+    return total
+
+
+def count_message_tokens(message):
+    """Estimativa de tokens de uma mensagem no formato da API"""
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Corta o texto (mantendo o início) para caber em max_tokens"""
+    if max_tokens <= 0:
+        return ""
+    total = 0
+    for match in _TOKEN_RE.finditer(text):
+        total += max(1, math.ceil(len(match.group()) / CHARS_PER_TOKEN))
+        if total > max_tokens:
+            return text[:match.start()].rstrip() + "..."
+    return text
+
+
+class HistoryBuilder:
+    """
+    Monta o histórico da sessão dentro de um orçamento de tokens.
+
+    As mensagens mais recentes entram inteiras até o orçamento acabar; as
+    anteriores são representadas pelo resumo salvo em ChatSession.summary.
+    O resultado indica até qual mensagem o resumo precisa ser atualizado.
+    """
+
+    def __init__(self, token_budget, max_messages=40):
+        self.token_budget = token_budget
+        self.max_messages = max_messages
+
+    def build(self, session, before_id=None):
+        """
+        Retorna (mensagens, summarize_until_id).
+
+        summarize_until_id é o id da mensagem mais recente que ficou de fora
+        da janela e ainda não está no resumo (None se o resumo está em dia).
+        Com before_id, considera apenas mensagens anteriores a ela.
+        """
+        messages = []
+        budget = self.token_budget
+
+        if session.summary:
+            summary_message = {
+                "role": "system",
+                "content": "Resumo da conversa até aqui: " + session.summary,
+            }
+            summary_tokens = count_message_tokens(summary_message)
+            if summary_tokens > budget // 2:
+                summary_message["content"] = truncate_to_tokens(
+                    summary_message["content"], budget // 2 - MESSAGE_OVERHEAD
+                )
+                summary_tokens = count_message_tokens(summary_message)
+            messages.append(summary_message)
+            budget -= summary_tokens
+
+        queryset = ChatMessage.objects.filter(session=session)
+        if session.summary_until_id:
+            queryset = queryset.filter(id__gt=session.summary_until_id)
+        if before_id:
+            queryset = queryset.filter(id__lt=before_id)
+        recent = list(
+            queryset.order_by('-timestamp', '-id')
+            .only('id', 'role', 'content')[:self.max_messages + 1]
+        )
+
+        window = []
+        dropped_id = None
+        for msg in recent[:self.max_messages]:
+            item = {"role": msg.role, "content": msg.content}
+            tokens = count_message_tokens(item)
+            if tokens > budget:
+                if not window and budget > MESSAGE_OVERHEAD:
+                    # Nem a mensagem mais recente cabe: entra truncada
+                    item["content"] = truncate_to_tokens(
+                        msg.content, budget - MESSAGE_OVERHEAD
+                    )
+                    window.append(item)
+                    budget = 0
+                    continue
+                dropped_id = msg.id
+                break
+            window.append(item)
+            budget -= tokens
+        else:
+            # Tudo coube, mas há mensagens mais antigas além de max_messages
+            if len(recent) > self.max_messages:
+                dropped_id = recent[-1].id
+
+        messages.extend(reversed(window))
+        return messages, dropped_id
@@ -0,0 +1,200 @@
+"""
+Fila de chamadas ao LLM persistida no banco (ChatJob).
+
+A view salva a mensagem do usuário e enfileira um job; o worker
+(manage.py chatbot_worker) reserva jobs com SELECT ... FOR UPDATE SKIP
+LOCKED, chama o backend e grava a resposta. Falhas temporárias voltam para
+a fila com backoff exponencial; a gravação da resposta é idempotente, então
+um job reprocessado nunca gera duas mensagens do assistente.
+"""
+import logging
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from nutrition import tracing
+
+from .admission import get_admission
+from .models import ChatJob, ChatMessage, ChatSession
+from .quotas import record_tokens
+from .services import ChatbotService
+from . import telemetry
+
+logger = logging.getLogger(__name__)
+
+ERROR_REPLY = (
+    "Desculpe, ocorreu um erro ao processar sua "
+    "mensagem. Tente novamente em alguns instantes."
+)
+
+
+def enqueue_message(session, user_message):
+    """Salva a mensagem do usuário e cria o job que vai respondê-la"""
+    with transaction.atomic():
+        user_msg = ChatMessage.objects.create(
+            session=session,
+            role='user',
+            content=user_message
+        )
+        job = ChatJob.objects.create(
+            session=session,
+            user_message=user_msg,
+            max_attempts=settings.CHATBOT_JOB_MAX_ATTEMPTS
+        )
+    return job
+
+
+def claim_jobs(worker_id, limit):
+    """
+    Reserva até `limit` jobs prontos para execução.
+
+    Jobs em execução há mais de CHATBOT_JOB_LOCK_TIMEOUT segundos são
+    considerados abandonados (worker morto) e podem ser reservados de novo.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.CHATBOT_JOB_LOCK_TIMEOUT)
+
+    with transaction.atomic():
+        jobs = list(
+            ChatJob.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=ChatJob.STATUS_PENDING, next_attempt_at__lte=now)
+                | Q(status=ChatJob.STATUS_RUNNING, locked_at__lt=stale)
+            )
+            .order_by('next_attempt_at', 'id')[:limit]
+        )
+        for job in jobs:
+            job.status = ChatJob.STATUS_RUNNING
+            job.attempts += 1
+            job.locked_by = worker_id
+            job.locked_at = now
+        ChatJob.objects.bulk_update(
+            jobs, ['status', 'attempts', 'locked_by', 'locked_at']
+        )
+    return [job.id for job in jobs]
+
+
+def _persist_reply(job_id, content, status, error="", **fields):
+    """
+    Grava a resposta do assistente uma única vez por job e o encerra
+    """
+    with transaction.atomic():
+        job = ChatJob.objects.select_for_update(of=('self',)).select_related(
+            'session'
+        ).get(id=job_id)
+        if job.assistant_message_id:
+            return job
+
+        assistant_msg = ChatMessage.objects.create(
+            session_id=job.session_id,
+            role='assistant',
+            content=content,
+            response_time=(timezone.now() - job.created_at).total_seconds(),
+            **fields
+        )
+        job.assistant_message = assistant_msg
+        job.status = status
+        job.error = error
+        job.locked_by = ""
+        job.locked_at = None
+        job.save()
+        ChatSession.objects.filter(id=job.session_id).update(
+            updated_at=timezone.now()
+        )
+        user_id = job.session.user_id
+        transaction.on_commit(
+            lambda: record_tokens(user_id, fields.get('tokens_used'))
+        )
+    return job
+
+
+def _backoff(attempts):
+    base = settings.CHATBOT_JOB_BACKOFF_BASE
+    delay = base * 2 ** (attempts - 1)
+    return delay * random.uniform(1, 1.25)
+
+
+def _handle_failure(job, error):
+    retryable = getattr(error, 'retryable', True)
+    if retryable and job.attempts < job.max_attempts:
+        delay = _backoff(job.attempts)
+        ChatJob.objects.filter(
+            id=job.id, status=ChatJob.STATUS_RUNNING
+        ).update(
+            status=ChatJob.STATUS_PENDING,
+            next_attempt_at=timezone.now() + timedelta(seconds=delay),
+            locked_by="",
+            locked_at=None,
+            error=str(error),
+            updated_at=timezone.now()
+        )
+        logger.warning(
+            f"Job {job.id} falhou (tentativa {job.attempts}), "
+            f"nova tentativa em {delay:.1f}s: {error}"
+        )
+        return
+
+    logger.error(f"Job {job.id} falhou definitivamente: {error}")
+    _persist_reply(
+        job.id, ERROR_REPLY, ChatJob.STATUS_FAILED, error=str(error)
+    )
+
+
+def process_job(job_id, service=None):
+    """Executa um job reservado por claim_jobs()"""
+    with tracing.start_trace('chatbot.job', job_id=job_id):
+        return _process_job(job_id, service)
+
+
+def _process_job(job_id, service=None):
+    job = ChatJob.objects.select_related(
+        'session__user', 'user_message'
+    ).get(id=job_id)
+    if job.assistant_message_id:
+        return job
+
+    try:
+        service = service or ChatbotService()
+        messages = service._prepare_messages(
+            job.session,
+            job.user_message.content,
+            before_id=job.user_message_id
+        )
+        started = time.time()
+        # Sem vaga: AdmissionRejected é temporário e o job volta para a fila
+        with get_admission().slot(), tracing.span(
+            'llm.complete', backend=service.provider.name,
+            model=service.model
+        ):
+            response = service.provider.complete(
+                messages=messages,
+                max_tokens=service.config.max_tokens,
+                temperature=service.config.temperature,
+            )
+        elapsed = time.time() - started
+        telemetry.record(
+            response.label, elapsed,
+            ttft=elapsed,
+            prompt_tokens=response.prompt_tokens,
+            completion_tokens=response.completion_tokens,
+            cache_hit=response.coalesced
+        )
+        logger.info(f"Job {job.id} respondido em {elapsed:.2f}s")
+    except Exception as e:
+        telemetry.record_error(
+            getattr(getattr(service, 'provider', None), 'name', ''), 'job'
+        )
+        _handle_failure(job, e)
+        return job
+
+    return _persist_reply(
+        job.id, response.content, ChatJob.STATUS_DONE,
+        tokens_used=response.tokens_used,
+        backend=response.label,
+        hedged=response.hedged
+    )
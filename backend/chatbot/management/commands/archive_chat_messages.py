@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from django.db.models.functions import Length
+
+from chatbot.archive import archive_old_sessions, sessions_to_archive
+from chatbot.models import ChatArchive, ChatMessage
+
+
+class Command(BaseCommand):
+    help = (
+        'Move mensagens de sessões sem atividade para o arquivo comprimido '
+        '(ChatArchive)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.CHATBOT_ARCHIVE_AFTER_DAYS,
+            help='Arquiva sessões sem atividade há mais que isso (dias)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int,
+            default=settings.CHATBOT_ARCHIVE_BATCH_SIZE,
+            help='Mensagens por lote comprimido'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help='Máximo de sessões nesta execução'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Mostra o que seria arquivado, sem alterar nada'
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            sessions = sessions_to_archive(options['days'])
+            messages = ChatMessage.objects.filter(session__in=sessions)
+            stats = messages.aggregate(
+                total=Count('id'), size=Sum(Length('content'))
+            )
+            self.stdout.write(
+                f"{sessions.count()} sessões, {stats['total']} mensagens "
+                f"(~{(stats['size'] or 0) // 1024} KiB de texto) seriam "
+                f"arquivadas"
+            )
+            return
+
+        sessions, messages = archive_old_sessions(
+            days=options['days'],
+            batch_size=options['batch_size'],
+            limit=options['limit']
+        )
+
+        totals = ChatArchive.objects.aggregate(
+            raw=Sum('raw_size'), stored=Sum(Length('data'))
+        )
+        ratio = (totals['raw'] or 0) / (totals['stored'] or 1)
+        self.stdout.write(self.style.SUCCESS(
+            f'{messages} mensagens de {sessions} sessões arquivadas '
+            f'(compressão do arquivo: {ratio:.1f}x)'
+        ))
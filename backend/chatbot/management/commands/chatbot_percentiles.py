@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+
+from chatbot.telemetry import PERCENTILES, historical_percentiles
+
+GROUP_FIELDS = ('backend', 'source', 'hedged')
+
+
+def _fmt(value, spec):
+    return '-' if value is None else format(value, spec)
+
+
+class Command(BaseCommand):
+    help = (
+        'Percentis de tempo de resposta e tokens das respostas do chatbot, '
+        'calculados no banco com percentile_cont'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=7,
+            help='Período analisado (dias)'
+        )
+        parser.add_argument(
+            '--by', nargs='+', choices=GROUP_FIELDS,
+            default=['backend', 'source'],
+            help='Campos de agrupamento'
+        )
+
+    def handle(self, *args, **options):
+        rows = historical_percentiles(options['days'], options['by'])
+        if not rows:
+            self.stdout.write(
+                self.style.WARNING('Nenhuma resposta no período')
+            )
+            return
+
+        labels = [f"p{round(q * 100)}" for q in PERCENTILES]
+        header = ' | '.join(options['by'])
+        self.stdout.write(
+            f"{header:<45} {'respostas':>9}  "
+            f"{'tempo (s) ' + '/'.join(labels):>24}  "
+            f"{'tokens ' + '/'.join(labels):>22}"
+        )
+        for row in rows:
+            group = ' | '.join(
+                str(row[field]) if row[field] != '' else '-'
+                for field in options['by']
+            )
+            times = '/'.join(
+                _fmt(row[f'response_time_{label}'], '.2f')
+                for label in labels
+            )
+            tokens = '/'.join(
+                _fmt(row[f'tokens_used_{label}'], '.0f') for label in labels
+            )
+            self.stdout.write(
+                f"{group:<45} {row['replies']:>9}  {times:>24}  {tokens:>22}"
+            )
+
@@ -0,0 +1,110 @@
+import logging
+import os
+import signal
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from chatbot.archive import archive_old_sessions
+from chatbot.jobs import claim_jobs, process_job
+
+logger = logging.getLogger(__name__)
+
+
+# Os futures do pool não são consultados: o que escapar daqui só aparece
+# no log
+def _run_job(job_id):
+    try:
+        process_job(job_id)
+    except Exception:
+        logger.exception(f"Falha ao processar o job {job_id}")
+    finally:
+        # Cada thread do pool tem a própria conexão com o banco
+        connection.close()
+
+
+def _run_archive():
+    try:
+        archive_old_sessions()
+    except Exception:
+        logger.exception("Falha no arquivamento de sessões antigas")
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Processa a fila de mensagens do chatbot (ChatJob)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int,
+            default=settings.CHATBOT_WORKER_CONCURRENCY,
+            help='Máximo de chamadas ao LLM em paralelo'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=0.5,
+            help='Intervalo (s) entre consultas quando a fila está vazia'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Processa os jobs disponíveis e encerra'
+        )
+        parser.add_argument(
+            '--archive-every', type=int,
+            default=settings.CHATBOT_ARCHIVE_INTERVAL,
+            help='Intervalo (s) entre arquivamentos de sessões antigas '
+                 '(0 desativa)'
+        )
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Worker {worker_id} iniciado (concorrência: {concurrency})'
+        ))
+
+        running = set()
+        archive_every = options['archive_every']
+        next_archive = time.monotonic() + min(archive_every, 60)
+        archiving = None
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while not self.stopping:
+                running = {future for future in running if not future.done()}
+                free = concurrency - len(running)
+
+                # Arquivamento periódico das mensagens antigas, uma execução
+                # por vez, ocupando uma vaga do pool
+                if (archive_every and not options['once'] and free > 0
+                        and time.monotonic() >= next_archive
+                        and (archiving is None or archiving.done())):
+                    archiving = pool.submit(_run_archive)
+                    running.add(archiving)
+                    next_archive = time.monotonic() + archive_every
+                    free -= 1
+
+                job_ids = []
+                if free > 0:
+                    close_old_connections()
+                    job_ids = claim_jobs(worker_id, free)
+                    for job_id in job_ids:
+                        running.add(pool.submit(_run_job, job_id))
+
+                if options['once'] and not job_ids and not running:
+                    break
+                if not job_ids:
+                    time.sleep(options['poll_interval'])
+
+            self.stdout.write('Aguardando jobs em execução...')
+
+        self.stdout.write(self.style.SUCCESS('Worker encerrado'))
+
+    def _stop(self, signum, frame):
+        self.stopping = True
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0002_update_model_to_groq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='summary',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='summary_until',
+            field=models.ForeignKey(blank=True, help_text='Última mensagem incluída no resumo', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chatbot.chatmessage'),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='summary_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
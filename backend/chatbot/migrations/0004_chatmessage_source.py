@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0003_chatsession_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='source',
+            field=models.CharField(choices=[('llm', 'Modelo'), ('fast_path', 'Resposta direta do catálogo')], default='llm', help_text='Origem da resposta do assistente', max_length=20),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0006_alter_chatmessage_source'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='backend',
+            field=models.CharField(blank=True, help_text='Backend e modelo que responderam (ex: groq:llama-3.1-8b)', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='hedged',
+            field=models.BooleanField(default=False, help_text='Se o pedido também foi enviado ao backend secundário'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:38
+
+from django.db import migrations, models
+from django.db.models import (
+    Case, CharField, Count, IntegerField, OuterRef, Subquery, Value, When
+)
+from django.db.models.functions import Coalesce, Concat, Left, Length
+
+
+def preencher_contadores(apps, schema_editor):
+    """Calcula os campos desnormalizados das sessões existentes"""
+    ChatSession = apps.get_model('chatbot', 'ChatSession')
+    ChatMessage = apps.get_model('chatbot', 'ChatMessage')
+
+    mensagens = ChatMessage.objects.filter(session=OuterRef('pk'))
+    contagem = (
+        mensagens.order_by().values('session')
+        .annotate(total=Count('id')).values('total')
+    )
+    ultima = mensagens.order_by('-timestamp', '-id').values('timestamp')[:1]
+    previa = (
+        mensagens.filter(role='user')
+        .order_by('-timestamp', '-id')
+        .annotate(tamanho=Length('content'))
+        .annotate(previa=Case(
+            When(
+                tamanho__gt=100,
+                then=Concat(Left('content', 100), Value('...'))
+            ),
+            default='content',
+            output_field=CharField()
+        ))
+        .values('previa')[:1]
+    )
+    ChatSession.objects.update(
+        message_count=Coalesce(
+            Subquery(contagem, output_field=IntegerField()), 0
+        ),
+        last_message_at=Subquery(ultima),
+        last_user_message_preview=Coalesce(Subquery(previa), Value('')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0007_chatmessage_backend_hedged'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='last_user_message_preview',
+            field=models.CharField(blank=True, default='', max_length=103),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(preencher_contadores, migrations.RunPython.noop),
+    ]
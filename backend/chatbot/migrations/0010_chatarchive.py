@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0009_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_message_id', models.BigIntegerField()),
+                ('last_message_id', models.BigIntegerField()),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('message_count', models.PositiveIntegerField()),
+                ('codec', models.CharField(choices=[('zlib', 'zlib'), ('zstd', 'zstd')], max_length=10)),
+                ('data', models.BinaryField(help_text='Mensagens em JSON, comprimidas')),
+                ('raw_size', models.PositiveIntegerField(help_text='Tamanho do JSON antes da compressão (bytes)')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archives', to='chatbot.chatsession')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['session', 'last_timestamp', 'last_message_id'], name='chatarchive_session_ts_idx')],
+            },
+        ),
+    ]
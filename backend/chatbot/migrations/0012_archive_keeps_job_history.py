@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0011_chatmessage_search_vector'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chatjob',
+            name='user_message',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='job', to='chatbot.chatmessage'),
+        ),
+        migrations.AlterField(
+            model_name='chatsession',
+            name='summary_until',
+            field=models.ForeignKey(blank=True, db_constraint=False, help_text='Última mensagem incluída no resumo', null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='chatbot.chatmessage'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:02
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def preencher_ultima_do_usuario(apps, schema_editor):
+    """Data da última mensagem do usuário nas sessões existentes"""
+    ChatSession = apps.get_model('chatbot', 'ChatSession')
+    ChatMessage = apps.get_model('chatbot', 'ChatMessage')
+
+    ultima = (
+        ChatMessage.objects.filter(session=OuterRef('pk'), role='user')
+        .order_by('-timestamp', '-id')
+        .values('timestamp')[:1]
+    )
+    ChatSession.objects.update(last_user_message_at=Subquery(ultima))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0012_archive_keeps_job_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='last_user_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(
+            preencher_ultima_do_usuario, migrations.RunPython.noop
+        ),
+    ]
@@ -1,6 +1,18 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
+from django.utils import timezone
 from user.models import User
 
+PREVIEW_LENGTH = 100
+
+
+def message_preview(content):
+    """Início da mensagem para a listagem de sessões"""
+    if len(content) > PREVIEW_LENGTH:
+        return content[:PREVIEW_LENGTH] + '...'
+    return content
+
 
 class ChatSession(models.Model):
     """
@@ -14,8 +26,34 @@ class ChatSession(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
 
+    # Resumo acumulado das mensagens que saíram da janela de histórico
+    summary = models.TextField(blank=True, default="")
+    # Sem constraint: a mensagem pode ir para o arquivo (chatbot.archive) e
+    # o id continua marcando até onde o resumo vai
+    summary_until = models.ForeignKey(
+        'ChatMessage', on_delete=models.DO_NOTHING, null=True, blank=True,
+        db_constraint=False, related_name='+',
+        help_text="Última mensagem incluída no resumo"
+    )
+    summary_updated_at = models.DateTimeField(null=True, blank=True)
+
+    # Desnormalizados, mantidos por chatbot.signals a cada mensagem criada
+    message_count = models.PositiveIntegerField(default=0)
+    last_user_message_preview = models.CharField(
+        max_length=PREVIEW_LENGTH + 3, blank=True, default=""
+    )
+    last_user_message_at = models.DateTimeField(null=True, blank=True)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            # Listagem paginada por cursor (chatbot.pagination)
+            models.Index(
+                fields=['user', '-updated_at', '-id'],
+                name='chatsession_user_upd_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"Chat {self.title} - {self.user.name}"
@@ -30,6 +68,11 @@ class ChatMessage(models.Model):
         ('assistant', 'Assistente'),
         ('system', 'Sistema'),
     ]
+    SOURCE_CHOICES = [
+        ('llm', 'Modelo'),
+        ('fast_path', 'Resposta direta do catálogo'),
+        ('fallback', 'Resposta degradada'),
+    ]
 
     session = models.ForeignKey(
         ChatSession, on_delete=models.CASCADE, related_name='messages'
@@ -43,14 +86,130 @@ class ChatMessage(models.Model):
     response_time = models.FloatField(
         null=True, blank=True, help_text="Tempo de resposta em segundos"
     )
+    source = models.CharField(
+        max_length=20, choices=SOURCE_CHOICES, default='llm',
+        help_text="Origem da resposta do assistente"
+    )
+    backend = models.CharField(
+        max_length=100, blank=True,
+        help_text="Backend e modelo que responderam (ex: groq:llama-3.1-8b)"
+    )
+    hedged = models.BooleanField(
+        default=False,
+        help_text="Se o pedido também foi enviado ao backend secundário"
+    )
+    # Busca textual em português; calculado pelo próprio PostgreSQL
+    search_vector = models.GeneratedField(
+        expression=SearchVector('content', config='portuguese'),
+        output_field=SearchVectorField(),
+        db_persist=True
+    )
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Histórico paginado por cursor (chatbot.pagination)
+            models.Index(
+                fields=['session', 'timestamp', 'id'],
+                name='chatmessage_session_ts_idx'
+            ),
+            GinIndex(fields=['search_vector'], name='chatmessage_search_idx'),
+        ]
 
     def __str__(self):
         return f"{self.role}: {self.content[:50]}..."
 
 
+class ChatArchive(models.Model):
+    """
+    Lote comprimido de mensagens antigas de uma sessão (ver
+    chatbot.archive). As mensagens saem de ChatMessage e são lidas daqui
+    quando o usuário abre o histórico antigo.
+    """
+    CODEC_CHOICES = [
+        ('zlib', 'zlib'),
+        ('zstd', 'zstd'),
+    ]
+
+    session = models.ForeignKey(
+        ChatSession, on_delete=models.CASCADE, related_name='archives'
+    )
+    first_message_id = models.BigIntegerField()
+    last_message_id = models.BigIntegerField()
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    message_count = models.PositiveIntegerField()
+    codec = models.CharField(max_length=10, choices=CODEC_CHOICES)
+    data = models.BinaryField(help_text="Mensagens em JSON, comprimidas")
+    raw_size = models.PositiveIntegerField(
+        help_text="Tamanho do JSON antes da compressão (bytes)"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['session', 'last_timestamp', 'last_message_id'],
+                name='chatarchive_session_ts_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Arquivo {self.session_id}: {self.message_count} mensagens"
+
+
+class ChatJob(models.Model):
+    """
+    Chamada ao LLM enfileirada para o worker (manage.py chatbot_worker)
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Na fila'),
+        (STATUS_RUNNING, 'Em execução'),
+        (STATUS_DONE, 'Concluído'),
+        (STATUS_FAILED, 'Falhou'),
+    ]
+
+    session = models.ForeignKey(
+        ChatSession, on_delete=models.CASCADE, related_name='jobs'
+    )
+    # SET_NULL: arquivar as mensagens não apaga o histórico dos jobs
+    user_message = models.OneToOneField(
+        ChatMessage, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='job'
+    )
+    assistant_message = models.OneToOneField(
+        ChatMessage, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='answered_job'
+    )
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=4)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True, default="")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(
+                fields=['status', 'next_attempt_at'],
+                name='chatjob_status_next_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} ({self.status})"
+
+
 class ChatbotConfig(models.Model):
     """
     Configurações globais do chatbot
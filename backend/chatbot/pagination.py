@@ -0,0 +1,145 @@
+"""
+Paginação por keyset (cursor) para o histórico do chat.
+
+Em vez de OFFSET, cada página continua a partir da última linha vista
+(`?before=<cursor>`), com um filtro do tipo (timestamp, id) < (t, i) que
+usa o índice composto da tabela. O custo de uma página não depende de quão
+longe do início ela está.
+"""
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(BasePagination):
+    """
+    Páginas em ordem decrescente de `ordering` (dois campos: data e id).
+    Com reverse_page=True cada página é devolvida em ordem cronológica,
+    como o chat exibe; o cursor `before` continua apontando para as
+    linhas mais antigas.
+    """
+    ordering = ('-timestamp', '-id')
+    page_size = 50
+    max_page_size = 200
+    reverse_page = False
+    cursor_query_param = 'before'
+    page_size_query_param = 'limit'
+
+    def _fields(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def encode_cursor(self, obj):
+        values = [getattr(obj, field) for field in self._fields()]
+        raw = json.dumps([values[0].isoformat(), values[1]])
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            moment, pk = json.loads(base64.urlsafe_b64decode(padded))
+            moment = parse_datetime(moment)
+            if moment is None:
+                raise ValueError
+            return moment, int(pk)
+        except (ValueError, TypeError):
+            raise ValidationError({'error': 'Cursor inválido'})
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(
+                self.page_size_query_param, self.page_size
+            ))
+        except ValueError:
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def filter_before(self, queryset, cursor):
+        moment, pk = self.decode_cursor(cursor)
+        date_field, id_field = self._fields()
+        # O filtro redundante <= deixa o banco usar o índice como limite da
+        # varredura; o OR resolve os empates de data pelo id
+        return queryset.filter(
+            Q(**{f'{date_field}__lt': moment})
+            | Q(**{date_field: moment, f'{id_field}__lt': pk}),
+            **{f'{date_field}__lte': moment}
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor = request.query_params.get(self.cursor_query_param)
+        return self.paginate(queryset, cursor, self.get_page_size(request))
+
+    def paginate(self, queryset, cursor=None, size=None):
+        """Uma página a partir do cursor (ou a mais recente)"""
+        size = size or self.page_size
+        queryset = queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = self.filter_before(queryset, cursor)
+
+        rows = self.fetch(queryset, cursor, size + 1)
+        self.has_more = len(rows) > size
+        rows = rows[:size]
+        self.before = (
+            self.encode_cursor(rows[-1]) if self.has_more and rows else None
+        )
+        if self.reverse_page:
+            rows.reverse()
+        return rows
+
+    def fetch(self, queryset, cursor, limit):
+        return list(queryset[:limit])
+
+    def get_paginated_response(self, data):
+        return Response({
+            'results': data,
+            'before': self.before,
+            'has_more': self.has_more,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'results': schema,
+                'before': {'type': 'string', 'nullable': True},
+                'has_more': {'type': 'boolean'},
+            },
+        }
+
+
+class MessagePagination(KeysetPagination):
+    """
+    Mensagens: última página primeiro, em ordem do chat. Com `session`, a
+    página é completada com as mensagens arquivadas da sessão quando as da
+    tabela quente acabam (chatbot.archive).
+    """
+    ordering = ('-timestamp', '-id')
+    page_size = 50
+    reverse_page = True
+
+    def __init__(self, session=None):
+        self.session = session
+
+    def fetch(self, queryset, cursor, limit):
+        rows = super().fetch(queryset, cursor, limit)
+        if self.session is None or len(rows) >= limit:
+            return rows
+
+        from .archive import archived_before
+        if rows:
+            before = (rows[-1].timestamp, rows[-1].id)
+        else:
+            before = self.decode_cursor(cursor) if cursor else None
+        return rows + archived_before(
+            self.session, before, limit - len(rows)
+        )
+
+
+class SessionPagination(KeysetPagination):
+    """Sessões do usuário, das atualizadas mais recentemente"""
+    ordering = ('-updated_at', '-id')
+    page_size = 20
@@ -0,0 +1,327 @@
+"""
+Backends de LLM do chatbot.
+
+ChatbotService conversa apenas com a interface LLMProvider; o backend real
+(Groq) e o mock local são escolhidos por get_provider() a partir das
+settings. O mock permite testar o fluxo completo, inclusive carga e
+latência de cauda, sem rede e sem custo.
+"""
+import hashlib
+import logging
+import random
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+from .history import count_message_tokens, count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderError(Exception):
+    """Falha do backend de LLM"""
+
+    def __init__(self, message, status_code=None, retryable=False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+
+
+class ProviderTimeout(ProviderError):
+    """O backend não respondeu dentro do prazo"""
+
+    def __init__(self, message="Tempo limite excedido"):
+        super().__init__(message, status_code=504, retryable=True)
+
+
+class ProviderCancelled(ProviderError):
+    """Chamada abandonada (ex: perdeu a corrida de um pedido hedged)"""
+
+    def __init__(self, message="Chamada cancelada"):
+        super().__init__(message, retryable=False)
+
+
+@dataclass
+class LLMResponse:
+    content: str
+    model: str
+    backend: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # Se um pedido duplicado foi enviado a outro backend (ver hedging.py)
+    hedged: bool = False
+    # Se a resposta veio de uma chamada idêntica em andamento (coalescing.py)
+    coalesced: bool = False
+
+    @property
+    def tokens_used(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def label(self):
+        """Identificação do backend que respondeu, ex: "groq:llama-3.1-8b" """
+        return f"{self.backend}:{self.model}"
+
+
+class LLMProvider:
+    """
+    Interface comum dos backends.
+
+    timeout é o prazo da chamada em segundos; cancel_event (um
+    threading.Event) pede que a chamada seja abandonada assim que possível,
+    com ProviderCancelled.
+    """
+    name = None
+
+    def __init__(self, model):
+        self.model = model
+
+    def complete(self, messages, max_tokens, temperature, timeout=None,
+                 cancel_event=None):
+        """Resposta completa (LLMResponse)"""
+        raise NotImplementedError
+
+    def stream(self, messages, max_tokens, temperature, timeout=None,
+               cancel_event=None):
+        """Gera os pedaços de texto da resposta conforme chegam"""
+        raise NotImplementedError
+
+
+class GroqProvider(LLMProvider):
+    name = 'groq'
+
+    def __init__(self, model):
+        super().__init__(model)
+        if not getattr(settings, 'GROQ_API_KEY', None):
+            raise ValidationError(
+                "GROQ_API_KEY não configurada nas settings"
+            )
+        from groq import Groq
+        # Sem retentativas no cliente: o prazo por chamada e as novas
+        # tentativas ficam com ResilientProvider e a fila de jobs
+        self.client = Groq(api_key=settings.GROQ_API_KEY, max_retries=0)
+
+    def _call(self, timeout, **kwargs):
+        import groq
+        try:
+            return self.client.chat.completions.create(
+                model=self.model, timeout=timeout, **kwargs
+            )
+        except groq.APITimeoutError as e:
+            raise ProviderTimeout(str(e)) from e
+        except groq.APIConnectionError as e:
+            raise ProviderError(str(e), retryable=True) from e
+        except groq.APIStatusError as e:
+            raise ProviderError(
+                str(e),
+                status_code=e.status_code,
+                retryable=e.status_code == 429 or e.status_code >= 500
+            ) from e
+
+    def complete(self, messages, max_tokens, temperature, timeout=None,
+                 cancel_event=None):
+        # Uma chamada síncrona ao Groq não pode ser interrompida; o
+        # resultado de uma chamada cancelada é apenas descartado
+        response = self._call(
+            timeout,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+        usage = getattr(response, 'usage', None)
+        return LLMResponse(
+            content=response.choices[0].message.content,
+            model=self.model,
+            backend=self.name,
+            prompt_tokens=getattr(usage, 'prompt_tokens', 0) or 0,
+            completion_tokens=getattr(usage, 'completion_tokens', 0) or 0,
+        )
+
+    def stream(self, messages, max_tokens, temperature, timeout=None,
+               cancel_event=None):
+        chunks = self._call(
+            timeout,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+        )
+        for chunk in chunks:
+            if cancel_event is not None and cancel_event.is_set():
+                chunks.close()
+                raise ProviderCancelled()
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+
+MOCK_REPLIES = [
+    (
+        ('substitu', 'trocar', 'alternativa', 'ao invés', 'no lugar'),
+        "🔄 Algumas substituições saudáveis:\n"
+        "- Arroz branco → arroz integral ou quinoa\n"
+        "- Açúcar → frutas ou canela\n"
+        "- Refrigerante → água com gás e limão\n\n"
+        "Para ajustes específicos, consulte um nutricionista."
+    ),
+    (
+        ('emagrecer', 'engordar', 'ganhar peso', 'perder peso', 'dieta',
+         'massa muscular'),
+        "🎯 Para o seu objetivo, o mais importante é a consistência:\n"
+        "- Ajuste as calorias gradualmente\n"
+        "- Garanta proteína em todas as refeições\n"
+        "- Priorize alimentos in natura\n\n"
+        "Um nutricionista pode montar um plano individualizado."
+    ),
+    (
+        ('aveia', 'ovo', 'frango', 'banana', 'arroz', 'feijão', 'leite'),
+        "🍎 Esse alimento pode fazer parte de uma dieta equilibrada. "
+        "Confira os valores por 100g na tabela TACO e combine com "
+        "vegetais e uma fonte de proteína."
+    ),
+    (
+        ('caloria', 'proteína', 'carboidrato', 'gordura', 'nutrição',
+         'vitamina'),
+        "🥗 Macronutrientes em resumo:\n"
+        "- Carboidratos: 4 kcal/g, principal fonte de energia\n"
+        "- Proteínas: 4 kcal/g, construção e reparo muscular\n"
+        "- Gorduras: 9 kcal/g, hormônios e absorção de vitaminas"
+    ),
+]
+MOCK_DEFAULT_REPLY = (
+    "👋 Olá! Sou o assistente nutricional do NutriApp. Posso ajudar com "
+    "valores nutricionais, substituições de alimentos e dicas para o seu "
+    "objetivo. Sobre o que você quer conversar?"
+)
+
+
+def parse_latency(spec):
+    """
+    Distribuição de latência do mock a partir de uma string:
+    "none", "fixed:0.5", "uniform:1,3" ou "lognormal:mu,sigma" (segundos).
+    Retorna uma função rng -> segundos.
+    """
+    kind, _, params = (spec or 'none').partition(':')
+    values = [float(v) for v in params.split(',') if v.strip()]
+    if kind == 'none':
+        return lambda rng: 0.0
+    if kind == 'fixed':
+        return lambda rng: values[0]
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == 'lognormal':
+        return lambda rng: rng.lognormvariate(values[0], values[1])
+    raise ValueError(f"Distribuição de latência inválida: {spec}")
+
+
+class MockProvider(LLMProvider):
+    """
+    Backend local para desenvolvimento e testes de carga.
+
+    As respostas são escolhidas por palavras-chave da última mensagem do
+    usuário. Latência e erros seguem as settings CHATBOT_MOCK_*; com
+    deterministic=True o sorteio é semeado pelo conteúdo da conversa, de
+    modo que a mesma pergunta produz sempre a mesma resposta e latência.
+    """
+    name = 'mock'
+
+    def __init__(self, model, latency=None, error_rate=None,
+                 deterministic=None, stream_chunk_delay=None):
+        super().__init__(model)
+        self.latency = parse_latency(
+            latency if latency is not None else settings.CHATBOT_MOCK_LATENCY
+        )
+        self.error_rate = (
+            error_rate if error_rate is not None
+            else settings.CHATBOT_MOCK_ERROR_RATE
+        )
+        self.deterministic = (
+            deterministic if deterministic is not None
+            else settings.CHATBOT_MOCK_DETERMINISTIC
+        )
+        self.stream_chunk_delay = (
+            stream_chunk_delay if stream_chunk_delay is not None
+            else settings.CHATBOT_MOCK_STREAM_CHUNK_DELAY
+        )
+
+    def _rng(self, messages):
+        if not self.deterministic:
+            return random.Random()
+        digest = hashlib.sha256(
+            "\n".join(m["content"] for m in messages).encode()
+        ).digest()
+        return random.Random(digest)
+
+    def _reply(self, messages):
+        question = next(
+            (m["content"] for m in reversed(messages) if m["role"] == "user"),
+            ""
+        ).lower()
+        for keywords, reply in MOCK_REPLIES:
+            if any(keyword in question for keyword in keywords):
+                return reply
+        return MOCK_DEFAULT_REPLY
+
+    def _wait(self, seconds, cancel_event):
+        if cancel_event is None:
+            time.sleep(seconds)
+        elif cancel_event.wait(seconds):
+            raise ProviderCancelled()
+
+    def _simulate(self, messages, timeout, cancel_event):
+        rng = self._rng(messages)
+        delay = self.latency(rng)
+        if timeout is not None and delay > timeout:
+            self._wait(timeout, cancel_event)
+            raise ProviderTimeout()
+        self._wait(delay, cancel_event)
+        if rng.random() < self.error_rate:
+            raise ProviderError(
+                "Mock: limite de requisições excedido",
+                status_code=429,
+                retryable=True
+            )
+
+    def complete(self, messages, max_tokens, temperature, timeout=None,
+                 cancel_event=None):
+        self._simulate(messages, timeout, cancel_event)
+        content = self._reply(messages)
+        return LLMResponse(
+            content=content,
+            model=self.model,
+            backend=self.name,
+            prompt_tokens=sum(count_message_tokens(m) for m in messages),
+            completion_tokens=min(count_tokens(content), max_tokens),
+        )
+
+    def stream(self, messages, max_tokens, temperature, timeout=None,
+               cancel_event=None):
+        self._simulate(messages, timeout, cancel_event)
+        for word in self._reply(messages).split(' '):
+            if self.stream_chunk_delay:
+                self._wait(self.stream_chunk_delay, cancel_event)
+            yield word + ' '
+
+
+PROVIDERS = {
+    GroqProvider.name: GroqProvider,
+    MockProvider.name: MockProvider,
+}
+
+
+def get_provider(model, name=None, **options):
+    """
+    Backend para o modelo informado: `name` ou o configurado nas settings
+    (CHATBOT_USE_MOCK=1 força o mock). options vão para o construtor.
+    """
+    if settings.CHATBOT_USE_MOCK:
+        name = 'mock'
+    name = name or settings.CHATBOT_PROVIDER
+    try:
+        provider_class = PROVIDERS[name]
+    except KeyError:
+        raise ValidationError(f"Backend de LLM desconhecido: {name}")
+    logger.info(f"Using {name} backend for chatbot (model: {model})")
+    return provider_class(model, **options)
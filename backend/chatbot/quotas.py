@@ -0,0 +1,172 @@
+"""
+Limites por usuário do chatbot, verificados antes da chamada ao LLM.
+
+- Taxa de mensagens: token bucket com CHATBOT_RATE_LIMIT_BURST mensagens de
+  folga, reabastecido a CHATBOT_RATE_LIMIT_PER_MINUTE por minuto.
+- Tokens do LLM por dia: CHATBOT_DAILY_TOKEN_QUOTA, somando tokens_used das
+  respostas do dia.
+
+Os contadores ficam no cache do Django, que deve ser compartilhado entre os
+processos (Redis, Memcached) para o limite valer globalmente. Se o contador
+diário sumir do cache, ele é reconstruído a partir de ChatMessage. Valor 0
+desativa o respectivo limite.
+"""
+import math
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, time as dt_time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import ChatMessage
+
+DAY = 24 * 60 * 60
+
+
+@dataclass
+class LimitStatus:
+    allowed: bool
+    error: str = ""
+    retry_after: int = 0
+    rate_remaining: int = None
+    tokens_used: int = 0
+
+    def headers(self):
+        """Cabeçalhos com a cota restante, incluídos nas respostas"""
+        headers = {}
+        if self.rate_remaining is not None:
+            headers['X-RateLimit-Limit'] = str(
+                settings.CHATBOT_RATE_LIMIT_PER_MINUTE
+            )
+            headers['X-RateLimit-Remaining'] = str(self.rate_remaining)
+        quota = settings.CHATBOT_DAILY_TOKEN_QUOTA
+        if quota:
+            headers['X-Token-Quota-Limit'] = str(quota)
+            headers['X-Token-Quota-Remaining'] = str(
+                max(0, quota - self.tokens_used)
+            )
+            headers['X-Token-Quota-Reset'] = str(_seconds_until_midnight())
+        if self.retry_after:
+            headers['Retry-After'] = str(self.retry_after)
+        return headers
+
+
+def _seconds_until_midnight():
+    now = timezone.localtime()
+    midnight = timezone.make_aware(
+        datetime.combine(now.date() + timedelta(days=1), dt_time.min)
+    )
+    return int((midnight - now).total_seconds())
+
+
+class _CacheLock:
+    """Lock curto no cache para o read-modify-write do bucket"""
+
+    def __init__(self, key, timeout=2, wait=0.2):
+        self.key = f"{key}:lock"
+        self.timeout = timeout
+        self.wait = wait
+        self.token = uuid.uuid4().hex
+        self.acquired = False
+
+    def __enter__(self):
+        deadline = time.monotonic() + self.wait
+        while not cache.add(self.key, self.token, timeout=self.timeout):
+            if time.monotonic() >= deadline:
+                # Melhor esforço: segue sem o lock em vez de travar o pedido
+                return self
+            time.sleep(0.01)
+        self.acquired = True
+        return self
+
+    def __exit__(self, *exc):
+        # Sem o lock, ou com ele expirado e tomado por outro, a chave não é
+        # nossa e não pode ser apagada
+        if self.acquired and cache.get(self.key) == self.token:
+            cache.delete(self.key)
+
+
+def take_request(user_id):
+    """
+    Consome uma mensagem do bucket do usuário.
+    Retorna (permitido, restantes, segundos até a próxima ficha).
+    """
+    per_minute = settings.CHATBOT_RATE_LIMIT_PER_MINUTE
+    capacity = settings.CHATBOT_RATE_LIMIT_BURST or per_minute
+    rate = per_minute / 60
+    key = f"chatbot:ratelimit:{user_id}"
+
+    with _CacheLock(key):
+        now = time.time()
+        tokens, updated = cache.get(key) or (capacity, now)
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        cache.set(key, (tokens, now), timeout=math.ceil(capacity / rate) + 60)
+
+    retry_after = 0 if allowed else math.ceil((1 - tokens) / rate)
+    return allowed, int(tokens), retry_after
+
+
+def _tokens_key(user_id):
+    return f"chatbot:tokens:{user_id}:{timezone.localdate().isoformat()}"
+
+
+def _tokens_from_db(user_id):
+    start = timezone.make_aware(
+        datetime.combine(timezone.localdate(), dt_time.min)
+    )
+    return ChatMessage.objects.filter(
+        session__user_id=user_id, role='assistant', timestamp__gte=start
+    ).aggregate(total=Sum('tokens_used'))['total'] or 0
+
+
+def tokens_used_today(user_id):
+    key = _tokens_key(user_id)
+    used = cache.get(key)
+    if used is None:
+        used = _tokens_from_db(user_id)
+        cache.add(key, used, timeout=DAY + 60)
+    return used
+
+
+def record_tokens(user_id, tokens):
+    """
+    Soma os tokens de uma resposta à cota do dia. Deve ser chamada depois
+    que a mensagem foi salva (a reconstrução pelo banco já a inclui).
+    """
+    if not settings.CHATBOT_DAILY_TOKEN_QUOTA or not tokens:
+        return
+    try:
+        cache.incr(_tokens_key(user_id), tokens)
+    except ValueError:
+        tokens_used_today(user_id)
+
+
+def check_limits(user):
+    """Verifica taxa e cota do usuário antes de chamar o LLM"""
+    status = LimitStatus(allowed=True)
+
+    quota = settings.CHATBOT_DAILY_TOKEN_QUOTA
+    if quota:
+        status.tokens_used = tokens_used_today(user.id)
+        if status.tokens_used >= quota:
+            status.allowed = False
+            status.error = "Cota diária de tokens do chatbot esgotada"
+            status.retry_after = _seconds_until_midnight()
+            return status
+
+    if settings.CHATBOT_RATE_LIMIT_PER_MINUTE:
+        allowed, remaining, retry_after = take_request(user.id)
+        status.rate_remaining = remaining
+        if not allowed:
+            status.allowed = False
+            status.error = "Muitas mensagens em pouco tempo, aguarde"
+            status.retry_after = retry_after
+
+    return status
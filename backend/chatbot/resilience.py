@@ -0,0 +1,220 @@
+"""
+Proteções em volta do backend de LLM: prazo por chamada e circuit breaker.
+
+Com o backend lento ou limitando requisições (429), cada chamada deixaria
+um worker preso até o timeout do cliente. O breaker observa as últimas
+chamadas do processo e, acima dos limites de erro ou lentidão, abre: as
+chamadas seguintes falham na hora com CircuitOpenError e o serviço responde
+em modo degradado. Após o cooldown uma chamada de teste decide se fecha.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+from .providers import LLMProvider, ProviderCancelled, ProviderError
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(ProviderError):
+    """Chamada recusada porque o circuito está aberto"""
+
+    def __init__(self, name):
+        super().__init__(
+            f"Circuito do backend {name} aberto",
+            status_code=503,
+            retryable=True
+        )
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, window=None, min_calls=None, failure_rate=None,
+                 slow_call=None, slow_rate=None, cooldown=None):
+        self.name = name
+        self.window = window or settings.CHATBOT_BREAKER_WINDOW
+        self.min_calls = min_calls or settings.CHATBOT_BREAKER_MIN_CALLS
+        self.failure_rate = (
+            failure_rate or settings.CHATBOT_BREAKER_FAILURE_RATE
+        )
+        self.slow_call = slow_call or settings.CHATBOT_BREAKER_SLOW_CALL
+        self.slow_rate = slow_rate or settings.CHATBOT_BREAKER_SLOW_RATE
+        self.cooldown = cooldown or settings.CHATBOT_BREAKER_COOLDOWN
+
+        self._lock = threading.Lock()
+        self._calls = deque(maxlen=self.window)  # (falhou, lenta)
+        self._state = self.CLOSED
+        self._opened_at = None
+        self._probe_running = False
+        self.stats = {
+            'successes': 0,
+            'failures': 0,
+            'slow_calls': 0,
+            'rejected': 0,
+            'times_opened': 0,
+        }
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if (self._state == self.OPEN
+                and time.monotonic() - self._opened_at >= self.cooldown):
+            self._state = self.HALF_OPEN
+            self._probe_running = False
+        return self._state
+
+    def allow(self):
+        """Se a próxima chamada pode ir ao backend"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probe_running:
+                self._probe_running = True
+                return True
+            self.stats['rejected'] += 1
+            return False
+
+    def record(self, failed, elapsed):
+        with self._lock:
+            slow = elapsed >= self.slow_call
+            self.stats['failures' if failed else 'successes'] += 1
+            if slow:
+                self.stats['slow_calls'] += 1
+
+            if self._current_state() == self.HALF_OPEN:
+                self._probe_running = False
+                if failed or slow:
+                    self._open()
+                else:
+                    self._state = self.CLOSED
+                    self._calls.clear()
+                    logger.info(f"Circuito {self.name} fechado")
+                return
+
+            self._calls.append((failed, slow))
+            if len(self._calls) < self.min_calls:
+                return
+            total = len(self._calls)
+            failure_ratio = sum(1 for f, _ in self._calls if f) / total
+            slow_ratio = sum(1 for _, s in self._calls if s) / total
+            if (failure_ratio >= self.failure_rate
+                    or slow_ratio >= self.slow_rate):
+                self._open()
+
+    def release(self):
+        """
+        Chamada cancelada (ex: perdedora de um hedge): não conta como
+        sucesso nem falha, só devolve a vaga de teste do half-open
+        """
+        with self._lock:
+            if self._current_state() == self.HALF_OPEN:
+                self._probe_running = False
+
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._calls.clear()
+        self.stats['times_opened'] += 1
+        logger.warning(f"Circuito {self.name} aberto")
+
+    def snapshot(self):
+        with self._lock:
+            state = self._current_state()
+            data = {'name': self.name, 'state': state, **self.stats}
+            data['open_for'] = (
+                round(time.monotonic() - self._opened_at, 1)
+                if state == self.OPEN else 0
+            )
+            return data
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    """Breaker do processo para o backend/modelo informado"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def breakers_snapshot():
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [breaker.snapshot() for breaker in breakers]
+
+
+class ResilientProvider(LLMProvider):
+    """
+    Envolve um backend com prazo por chamada (CHATBOT_LLM_TIMEOUT) e
+    circuit breaker
+    """
+
+    def __init__(self, provider, breaker=None, timeout=None):
+        super().__init__(provider.model)
+        self.provider = provider
+        self.name = provider.name
+        self.breaker = breaker or get_breaker(
+            f"{provider.name}:{provider.model}"
+        )
+        self.timeout = timeout or settings.CHATBOT_LLM_TIMEOUT
+
+    def complete(self, messages, max_tokens, temperature, timeout=None,
+                 cancel_event=None):
+        if not self.breaker.allow():
+            raise CircuitOpenError(self.breaker.name)
+
+        started = time.monotonic()
+        try:
+            response = self.provider.complete(
+                messages, max_tokens, temperature,
+                timeout=min(timeout or self.timeout, self.timeout),
+                cancel_event=cancel_event
+            )
+        except ProviderCancelled:
+            # Cancelada antes de terminar: não diz nada sobre o backend
+            self.breaker.release()
+            raise
+        except ProviderError as e:
+            # Erros do cliente (4xx exceto 429) não indicam backend doente
+            self.breaker.record(e.retryable, time.monotonic() - started)
+            raise
+        except Exception:
+            self.breaker.record(True, time.monotonic() - started)
+            raise
+        self.breaker.record(False, time.monotonic() - started)
+        return response
+
+    def stream(self, messages, max_tokens, temperature, timeout=None,
+               cancel_event=None):
+        if not self.breaker.allow():
+            raise CircuitOpenError(self.breaker.name)
+
+        started = time.monotonic()
+        try:
+            yield from self.provider.stream(
+                messages, max_tokens, temperature,
+                timeout=min(timeout or self.timeout, self.timeout),
+                cancel_event=cancel_event
+            )
+        except ProviderCancelled:
+            self.breaker.release()
+            raise
+        except Exception as e:
+            self.breaker.record(
+                getattr(e, 'retryable', True), time.monotonic() - started
+            )
+            raise
+        self.breaker.record(False, time.monotonic() - started)
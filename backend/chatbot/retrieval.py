@@ -0,0 +1,37 @@
+from api.catalogo import get_indice
+
+
+def find_foods(text, limit=5):
+    """Alimentos do catálogo TACO citados no texto (índice em memória)"""
+    return [alimento for alimento, _ in get_indice().buscar(text, limite=limit)]
+
+
+def _fmt(value):
+    if value is None:
+        return "-"
+    return f"{value:.1f}".rstrip('0').rstrip('.')
+
+
+def build_food_table(foods):
+    """Tabela compacta com os valores por 100g para o prompt"""
+    if not foods:
+        return ""
+    lines = ["Alimento | kcal | carb (g) | prot (g) | gord (g) | fibra (g)"]
+    for food in foods:
+        lines.append(
+            f"{food.nome} | {_fmt(food.energia_kcal)} | "
+            f"{_fmt(food.carboidratos_g)} | {_fmt(food.proteinas_g)} | "
+            f"{_fmt(food.lipideos_g)} | {_fmt(food.fibra_g)}"
+        )
+    return "\n".join(lines)
+
+
+def build_food_summary(foods):
+    """Valores por 100g em linhas legíveis para o usuário"""
+    return "\n".join(
+        f"- {food.nome}: {_fmt(food.energia_kcal)} kcal, "
+        f"{_fmt(food.carboidratos_g)} g de carboidratos, "
+        f"{_fmt(food.proteinas_g)} g de proteínas, "
+        f"{_fmt(food.lipideos_g)} g de gorduras"
+        for food in foods
+    )
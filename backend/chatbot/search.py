@@ -0,0 +1,54 @@
+"""
+Busca textual no histórico de chat do usuário.
+
+Usa a coluna ChatMessage.search_vector (tsvector em português, gerada pelo
+PostgreSQL) e o índice GIN sobre ela; a consulta aceita a sintaxe de busca
+web (aspas para frases, "or", "-termo"). Mensagens já arquivadas
+(chatbot.archive) não entram na busca.
+"""
+from django.contrib.postgres.search import (
+    SearchHeadline, SearchQuery, SearchRank
+)
+from django.db.models import F
+from django.utils.html import escape
+
+from .models import ChatMessage
+
+CONFIG = 'portuguese'
+# Marcadores de destaque trocados por <mark> depois de escapar o texto
+_START, _STOP = '\x02', '\x03'
+
+
+def search_messages(user, text, limit=20, session_id=None):
+    """
+    Até `limit` mensagens do usuário que casam com `text`, da mais
+    relevante para a menos, com `rank` e `snippet` (HTML com <mark>)
+    """
+    query = SearchQuery(text, config=CONFIG, search_type='websearch')
+    messages = ChatMessage.objects.filter(
+        session__user=user, search_vector=query
+    )
+    if session_id:
+        messages = messages.filter(session_id=session_id)
+
+    results = list(
+        messages.select_related('session')
+        .defer('search_vector')
+        .annotate(
+            rank=SearchRank(F('search_vector'), query),
+            headline=SearchHeadline(
+                'content', query, config=CONFIG,
+                start_sel=_START, stop_sel=_STOP,
+                max_words=30, min_words=10, max_fragments=2,
+                fragment_delimiter=' … '
+            )
+        )
+        .order_by('-rank', '-timestamp', '-id')[:limit]
+    )
+    for message in results:
+        message.snippet = (
+            escape(message.headline)
+            .replace(_START, '<mark>')
+            .replace(_STOP, '</mark>')
+        )
+    return results
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import ChatSession, ChatMessage, ChatbotConfig
+from .models import ChatSession, ChatMessage, ChatJob, ChatbotConfig
+from .pagination import MessagePagination
 
 
 class ChatMessageSerializer(serializers.ModelSerializer):
@@ -7,49 +8,72 @@ class ChatMessageSerializer(serializers.ModelSerializer):
         model = ChatMessage
         fields = [
             'id', 'role', 'content', 'timestamp',
-            'tokens_used', 'response_time'
+            'tokens_used', 'response_time', 'source'
+        ]
+        read_only_fields = [
+            'id', 'timestamp', 'tokens_used', 'response_time', 'source'
+        ]
+
+
+class ChatMessageSearchSerializer(ChatMessageSerializer):
+    """Resultado da busca no histórico, com relevância e trecho destacado"""
+    session_id = serializers.IntegerField(read_only=True)
+    session_title = serializers.CharField(
+        source='session.title', read_only=True
+    )
+    rank = serializers.FloatField(read_only=True)
+    snippet = serializers.CharField(read_only=True)
+
+    class Meta(ChatMessageSerializer.Meta):
+        fields = ChatMessageSerializer.Meta.fields + [
+            'session_id', 'session_title', 'rank', 'snippet'
         ]
-        read_only_fields = ['id', 'timestamp', 'tokens_used', 'response_time']
 
 
 class ChatSessionSerializer(serializers.ModelSerializer):
-    messages = ChatMessageSerializer(many=True, read_only=True)
-    message_count = serializers.SerializerMethodField()
+    """
+    Sessão com a última página de mensagens; as anteriores vêm de
+    /sessions/<id>/messages/?before=<messages_before>
+    """
 
     class Meta:
         model = ChatSession
         fields = [
             'id', 'title', 'created_at', 'updated_at',
-            'is_active', 'messages', 'message_count'
+            'is_active', 'message_count'
+        ]
+        read_only_fields = [
+            'id', 'created_at', 'updated_at', 'message_count'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
 
-    def get_message_count(self, obj):
-        return obj.messages.count()
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        paginator = MessagePagination(session=instance)
+        page = paginator.paginate(instance.messages.all())
+        data['messages'] = ChatMessageSerializer(page, many=True).data
+        data['messages_before'] = paginator.before
+        return data
 
 
 class ChatSessionListSerializer(serializers.ModelSerializer):
-    """Serializer simplificado para listagem de sessões"""
-    message_count = serializers.SerializerMethodField()
+    """
+    Serializer simplificado para listagem de sessões (só campos da própria
+    sessão, sem consultar as mensagens)
+    """
     last_message = serializers.SerializerMethodField()
 
     class Meta:
         model = ChatSession
         fields = [
             'id', 'title', 'created_at', 'updated_at',
-            'is_active', 'message_count', 'last_message'
+            'is_active', 'message_count', 'last_message', 'last_message_at'
         ]
 
-    def get_message_count(self, obj):
-        return obj.messages.count()
-
     def get_last_message(self, obj):
-        last_msg = obj.messages.filter(role='user').last()
-        if last_msg:
+        if obj.last_user_message_preview:
             return {
-                'content': last_msg.content[:100] + '...'
-                if len(last_msg.content) > 100 else last_msg.content,
-                'timestamp': last_msg.timestamp
+                'content': obj.last_user_message_preview,
+                'timestamp': obj.last_user_message_at
             }
         return None
 
@@ -59,6 +83,10 @@ class SendMessageSerializer(serializers.Serializer):
     session_id = serializers.IntegerField(required=False, allow_null=True)
     message = serializers.CharField(max_length=5000)
     create_new_session = serializers.BooleanField(default=False)
+    background = serializers.BooleanField(
+        default=False,
+        help_text="Enfileira a mensagem e retorna o id do job"
+    )
 
     def validate_message(self, value):
         if not value.strip():
@@ -68,6 +96,19 @@ class SendMessageSerializer(serializers.Serializer):
         return value.strip()
 
 
+class ChatJobSerializer(serializers.ModelSerializer):
+    user_message = ChatMessageSerializer(read_only=True)
+    assistant_message = ChatMessageSerializer(read_only=True)
+
+    class Meta:
+        model = ChatJob
+        fields = [
+            'id', 'session', 'status', 'attempts', 'user_message',
+            'assistant_message', 'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
+
+
 class ChatbotConfigSerializer(serializers.ModelSerializer):
     class Meta:
         model = ChatbotConfig
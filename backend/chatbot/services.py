@@ -1,37 +1,72 @@
-from groq import Groq
+import threading
 import time
 from django.conf import settings
-from django.core.exceptions import ValidationError
-from .models import ChatSession, ChatMessage, ChatbotConfig
+from django.db import connection
+from django.utils import timezone
+from .admission import get_admission
+from .coalescing import CoalescingProvider
+from .config import get_active_config
+from .fast_path import try_answer
+from .hedging import HedgedProvider
+from .history import HistoryBuilder, truncate_to_tokens
+from .models import ChatSession, ChatMessage
+from .providers import get_provider
+from .quotas import record_tokens
+from .resilience import ResilientProvider
+from .retrieval import build_food_summary, build_food_table, find_foods
+from . import telemetry
+from nutrition import tracing
+from nutrition.profiling import record_timing
 from user.models import UserProfile
 from api.models import Alimento
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Sessões com resumo sendo atualizado neste processo
+_summary_lock = threading.Lock()
+_summaries_running = set()
+
 
 class ChatbotService:
     """
-    Serviço principal do chatbot nutricional com Groq
+    Serviço principal do chatbot nutricional
     """
 
-    def __init__(self):
-        self.config = self._get_active_config()
-        
-        if not hasattr(settings, 'GROQ_API_KEY') or not settings.GROQ_API_KEY:
-            raise ValidationError(
-                "GROQ_API_KEY não configurada nas settings"
-            )
-        self.client = Groq(api_key=settings.GROQ_API_KEY)
-        self.model = "llama-3.1-8b-instant"
-        logger.info("Using Groq API for chatbot")
+    def __init__(self, provider=None):
+        # Cópia em memória, sem consulta ao banco (ver config.py)
+        self.config = get_active_config()
+        self.model = self.config.model_name
 
-    def _get_active_config(self):
-        """Obtém a configuração ativa do chatbot"""
-        try:
-            return ChatbotConfig.objects.filter(is_active=True).first()
-        except ChatbotConfig.DoesNotExist:
-            return ChatbotConfig.objects.create()
+        # Backend de LLM (Groq ou mock local, conforme as settings), com
+        # prazo por chamada e circuit breaker
+        self.provider = provider or self._build_provider()
+        self.history_builder = HistoryBuilder(
+            settings.CHATBOT_HISTORY_TOKEN_BUDGET
+        )
+
+    def _build_provider(self):
+        provider = ResilientProvider(get_provider(self.model))
+        if settings.CHATBOT_HEDGE_ENABLED:
+            provider = self._hedged(provider)
+        if settings.CHATBOT_COALESCE_ENABLED:
+            # Pedidos idênticos simultâneos compartilham uma chamada
+            provider = CoalescingProvider(provider)
+        return provider
+
+    def _hedged(self, primary):
+        name = (
+            'mock' if settings.CHATBOT_USE_MOCK
+            else settings.CHATBOT_HEDGE_PROVIDER or settings.CHATBOT_PROVIDER
+        )
+        options = {}
+        if name == 'mock' and settings.CHATBOT_HEDGE_MOCK_LATENCY:
+            # Perfil de latência próprio para testar o hedge localmente
+            options['latency'] = settings.CHATBOT_HEDGE_MOCK_LATENCY
+        secondary = ResilientProvider(get_provider(
+            settings.CHATBOT_HEDGE_MODEL or self.model, name, **options
+        ))
+        return HedgedProvider(primary, secondary)
 
     def _build_context_prompt(self, user):
         """Constrói o prompt de contexto baseado no perfil do usuário"""
@@ -79,8 +114,14 @@ class ChatbotService:
 
         return context
 
-    def _prepare_messages(self, session, user_message):
-        """Prepara as mensagens para envio à API"""
+    @tracing.traced('chatbot.prepare_messages')
+    def _prepare_messages(self, session, user_message, before_id=None):
+        """
+        Prepara as mensagens para envio à API.
+
+        before_id limita o histórico às mensagens anteriores a ela (usado
+        quando a mensagem do usuário já foi salva, como nos jobs)
+        """
         messages = []
         
         # System prompt personalizado
@@ -110,32 +151,139 @@ class ChatbotService:
         
         ⚠️ IMPORTANTE: Você oferece informações educativas, não substitui consulta médica ou nutricional profissional.
         """
+
+        # Valores exatos da TACO para os alimentos citados na mensagem
+        food_table = build_food_table(find_foods(user_message))
+        if food_table:
+            system_prompt += f"""
+        📚 DADOS DA TABELA TACO (valores por 100g; use exatamente estes números):
+{food_table}
+
+        Como os valores já estão acima, responda de forma breve (máximo 150 palavras).
+        """
         
         messages.append({"role": "system", "content": system_prompt})
         
-        # Adiciona histórico das últimas 8 mensagens da sessão
-        recent_messages = ChatMessage.objects.filter(
-            session=session
-        ).order_by('-timestamp')[:8]
-        
-        for msg in reversed(recent_messages):
-            messages.append({
-                "role": msg.role,
-                "content": msg.content
-            })
-        
+        # Adiciona o histórico que cabe no orçamento de tokens; o que ficou
+        # de fora entra no resumo da sessão, atualizado em segundo plano
+        history, summarize_until_id = self.history_builder.build(
+            session, before_id=before_id
+        )
+        messages.extend(history)
+        if summarize_until_id:
+            self._schedule_summary_refresh(session, summarize_until_id)
+
         # Adiciona a mensagem atual do usuário
         messages.append({"role": "user", "content": user_message})
         
         return messages
 
+    def _schedule_summary_refresh(self, session, until_id):
+        """Dispara a atualização do resumo da sessão em uma thread"""
+        with _summary_lock:
+            if session.id in _summaries_running:
+                return
+            _summaries_running.add(session.id)
+
+        thread = threading.Thread(
+            target=self._refresh_summary,
+            args=(session.id, until_id),
+            daemon=True
+        )
+        thread.start()
+
+    def _refresh_summary(self, session_id, until_id):
+        """
+        Incorpora ao resumo da sessão as mensagens até until_id que ainda
+        não foram resumidas
+        """
+        try:
+            session = ChatSession.objects.get(id=session_id)
+            pending = ChatMessage.objects.filter(
+                session_id=session_id, id__lte=until_id
+            )
+            if session.summary_until_id:
+                pending = pending.filter(id__gt=session.summary_until_id)
+            pending = list(
+                pending.order_by('timestamp', 'id')
+                .only('id', 'role', 'content')[:40]
+            )
+            if not pending:
+                return
+
+            labels = {'user': 'Usuário', 'assistant': 'Assistente'}
+            transcript = "\n".join(
+                f"{labels.get(msg.role, msg.role)}: "
+                f"{truncate_to_tokens(msg.content, 300)}"
+                for msg in pending
+            )
+            previous = session.summary or "(sem resumo anterior)"
+
+            response = self.provider.complete(
+                messages=[
+                    {
+                        "role": "system",
+                        "content": (
+                            "Resuma a conversa entre um usuário e um "
+                            "assistente nutricional em português, em no "
+                            "máximo 150 palavras. Preserve dados do usuário, "
+                            "alimentos, quantidades e decisões tomadas."
+                        )
+                    },
+                    {
+                        "role": "user",
+                        "content": (
+                            f"Resumo anterior:\n{previous}\n\n"
+                            f"Novas mensagens:\n{transcript}"
+                        )
+                    },
+                ],
+                max_tokens=settings.CHATBOT_SUMMARY_MAX_TOKENS,
+                temperature=0.2,
+            )
+            summary = response.content.strip()
+
+            # update() não mexe em updated_at nem sobrescreve outros campos
+            ChatSession.objects.filter(id=session_id).update(
+                summary=summary,
+                summary_until_id=pending[-1].id,
+                summary_updated_at=timezone.now()
+            )
+            logger.info(
+                f"Resumo da sessão {session_id} atualizado até a "
+                f"mensagem {pending[-1].id}"
+            )
+
+        except Exception as e:
+            logger.error(f"Erro ao atualizar resumo da sessão: {str(e)}")
+
+        finally:
+            with _summary_lock:
+                _summaries_running.discard(session_id)
+            connection.close()
+
     def send_message(self, session, user_message):
         """
         Envia mensagem para o chatbot e retorna a resposta
         """
         start_time = time.time()
 
+        # Consultas simples ao catálogo são respondidas sem chamar o modelo
+        fast_result = self._send_fast_path(session, user_message, start_time)
+        if fast_result:
+            return fast_result
+
+        # Limita as chamadas simultâneas ao LLM; sem vaga dentro da espera
+        # permitida, AdmissionRejected sobe para a view (503)
+        with get_admission().slot():
+            return self._send_with_llm(session, user_message, start_time)
+
+    def _send_with_llm(self, session, user_message, start_time):
         try:
+            # Prepara as mensagens para a API (antes de salvar a mensagem
+            # atual, para que ela não entre duplicada no histórico)
+            messages = self._prepare_messages(session, user_message)
+
             # Salva a mensagem do usuário
             user_msg = ChatMessage.objects.create(
                 session=session,
@@ -143,28 +291,49 @@ class ChatbotService:
                 content=user_message
             )
 
-            # Prepara as mensagens para a API
-            messages = self._prepare_messages(session, user_message)
-
             try:
-                # Groq API call
-                logger.info(f"Calling Groq API with model: {self.model}")
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    max_tokens=self.config.max_tokens,
-                    temperature=self.config.temperature,
+                logger.info(
+                    f"Calling {self.provider.name} backend with model: "
+                    f"{self.model}"
                 )
-                
-                # Extrai a resposta do Groq
-                assistant_content = response.choices[0].message.content
-                tokens_used = (response.usage.total_tokens
-                               if hasattr(response, 'usage') else 0)
-                logger.info(f"Groq response received, tokens: {tokens_used}")
-                        
+                with record_timing('llm'), tracing.span(
+                    'llm.complete', backend=self.provider.name,
+                    model=self.model
+                ) as llm_span:
+                    response = self.provider.complete(
+                        messages=messages,
+                        max_tokens=self.config.max_tokens,
+                        temperature=self.config.temperature,
+                    )
+                if llm_span is not None:
+                    llm_span.attributes.update(
+                        label=response.label,
+                        prompt_tokens=response.prompt_tokens,
+                        completion_tokens=response.completion_tokens,
+                        coalesced=response.coalesced,
+                        hedged=response.hedged,
+                    )
+                # Sem streaming, o primeiro token chega com a resposta
+                first_token_time = time.time() - start_time
+
+                assistant_content = response.content
+                tokens_used = response.tokens_used
+                backend = response.label
+                hedged = response.hedged
+                logger.info(
+                    f"{self.provider.name} response received, "
+                    f"tokens: {tokens_used}"
+                    + (" (coalesced)" if response.coalesced else "")
+                )
+
             except Exception as api_error:
-                logger.error(f"Groq API error: {api_error}")
-                raise api_error
+                logger.error(f"{self.provider.name} API error: {api_error}")
+                telemetry.record_error(self.provider.name, 'sync')
+                # Backend lento, fora do ar ou com circuito aberto: responde
+                # na hora em modo degradado em vez de prender o worker
+                return self._send_fallback(
+                    session, user_msg, user_message, start_time
+                )
 
             response_time = time.time() - start_time
 
@@ -174,11 +343,22 @@ class ChatbotService:
                 role='assistant',
                 content=assistant_content,
                 tokens_used=tokens_used,
-                response_time=response_time
+                response_time=response_time,
+                backend=backend,
+                hedged=hedged
+            )
+            record_tokens(session.user_id, tokens_used)
+            telemetry.record(
+                backend, response_time,
+                ttft=first_token_time,
+                prompt_tokens=response.prompt_tokens,
+                completion_tokens=response.completion_tokens,
+                cache_hit=response.coalesced
             )
 
-            # Atualiza o timestamp da sessão
-            session.save()
+            # Atualiza o timestamp da sessão (sem sobrescrever o resumo, que
+            # pode ter sido atualizado em paralelo)
+            session.save(update_fields=['updated_at'])
 
             return {
                 'success': True,
@@ -207,6 +387,88 @@ class ChatbotService:
                 'response_time': time.time() - start_time
             }
 
+    def _send_fast_path(self, session, user_message, start_time):
+        """
+        Responde direto do catálogo quando a pergunta é uma consulta ou
+        comparação de alimentos; retorna None para seguir com o modelo
+        """
+        try:
+            answer = try_answer(user_message)
+        except Exception as e:
+            logger.error(f"Erro na resposta direta: {str(e)}")
+            return None
+
+        if answer is None:
+            return None
+
+        user_msg = ChatMessage.objects.create(
+            session=session,
+            role='user',
+            content=user_message
+        )
+        response_time = time.time() - start_time
+        assistant_msg = ChatMessage.objects.create(
+            session=session,
+            role='assistant',
+            content=answer,
+            tokens_used=0,
+            response_time=response_time,
+            source='fast_path'
+        )
+        session.save(update_fields=['updated_at'])
+        telemetry.record(
+            '', response_time, ttft=response_time, fast_path=True
+        )
+        logger.info(
+            f"Resposta direta do catálogo em {response_time * 1000:.1f}ms"
+        )
+
+        return {
+            'success': True,
+            'user_message': user_msg,
+            'assistant_message': assistant_msg,
+            'tokens_used': 0,
+            'response_time': response_time
+        }
+
+    def _fallback_reply(self, user_message):
+        """Resposta degradada, usando o catálogo quando possível"""
+        foods = find_foods(user_message, limit=3)
+        if foods:
+            return (
+                "⚠️ O assistente está instável no momento, mas aqui estão "
+                "os valores da Tabela TACO (por 100g) dos alimentos "
+                "citados:\n\n"
+                f"{build_food_summary(foods)}\n\n"
+                "Tente novamente em alguns instantes para uma resposta "
+                "completa."
+            )
+        return (
+            "⚠️ O assistente está temporariamente indisponível. "
+            "Tente novamente em alguns instantes."
+        )
+
+    def _send_fallback(self, session, user_msg, user_message, start_time):
+        response_time = time.time() - start_time
+        assistant_msg = ChatMessage.objects.create(
+            session=session,
+            role='assistant',
+            content=self._fallback_reply(user_message),
+            tokens_used=0,
+            response_time=response_time,
+            source='fallback'
+        )
+        session.save(update_fields=['updated_at'])
+
+        return {
+            'success': True,
+            'degraded': True,
+            'user_message': user_msg,
+            'assistant_message': assistant_msg,
+            'tokens_used': 0,
+            'response_time': response_time
+        }
+
     def create_session(self, user, title=None):
         """Cria uma nova sessão de chat"""
         if not title:
@@ -0,0 +1,33 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .config import invalidate_config
+from .models import ChatbotConfig, ChatMessage, ChatSession, message_preview
+
+
+@receiver(post_save, sender=ChatMessage)
+def atualizar_contadores_sessao(sender, instance, created, **kwargs):
+    """
+    Mantém os campos desnormalizados da sessão, usados na listagem sem
+    carregar as mensagens. F() evita perder incrementos concorrentes.
+    """
+    if not created:
+        return
+    campos = {
+        'message_count': F('message_count') + 1,
+        'last_message_at': instance.timestamp,
+    }
+    if instance.role == 'user':
+        campos['last_user_message_preview'] = message_preview(
+            instance.content
+        )
+        campos['last_user_message_at'] = instance.timestamp
+    ChatSession.objects.filter(id=instance.session_id).update(**campos)
+
+
+@receiver(post_save, sender=ChatbotConfig)
+@receiver(post_delete, sender=ChatbotConfig)
+def invalidar_configuracao(sender, **kwargs):
+    """Processos recarregam a configuração do chatbot após o commit"""
+    transaction.on_commit(invalidate_config)
@@ -0,0 +1,263 @@
+"""
+Telemetria de latência e tokens do chatbot.
+
+Cada resposta do assistente alimenta histogramas em memória (no estilo HDR:
+baldes log-lineares com erro relativo < 1%, memória constante) de:
+
+- latency: tempo total da resposta (o mesmo response_time de ChatMessage)
+- ttft: tempo até o primeiro token; com complete() o texto chega inteiro,
+  então é o momento em que o backend respondeu
+- prompt_tokens / completion_tokens
+
+Os histogramas são separados por modelo, cache_hit (resposta compartilhada
+de uma chamada idêntica, ver coalescing.py) e fast_path (resposta direta do
+catálogo). Cada série guarda fatias de CHATBOT_TELEMETRY_SLOT segundos, e os
+percentis são calculados sobre as janelas deslizantes de
+CHATBOT_TELEMETRY_WINDOWS. Os números são do processo; o histórico completo
+fica em ChatMessage (historical_percentiles, comando chatbot_percentiles).
+"""
+import math
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Aggregate, Count, FloatField
+from django.utils import timezone
+
+from nutrition import metrics
+
+from .models import ChatMessage
+
+METRICS = ('latency', 'ttft', 'prompt_tokens', 'completion_tokens')
+PERCENTILES = (0.5, 0.95, 0.99)
+
+# Contadores para o /metrics (nutrition/metrics.py), somados entre processos
+metrics.register(
+    'nutriapp_llm_replies_total', 'counter',
+    'Respostas do assistente por modelo, cache_hit e fast_path'
+)
+metrics.register(
+    'nutriapp_llm_latency_seconds', 'histogram',
+    'Tempo total das respostas do assistente'
+)
+metrics.register(
+    'nutriapp_llm_tokens_total', 'counter',
+    'Tokens consumidos por modelo (kind=prompt|completion)'
+)
+metrics.register(
+    'nutriapp_llm_errors_total', 'counter',
+    'Falhas ao chamar o LLM (source=sync|job)'
+)
+
+
+class Histogram:
+    """
+    Histograma log-linear: cada potência de 2 é dividida em `sub_buckets`
+    baldes iguais, então o erro relativo de um percentil fica abaixo de
+    1 / sub_buckets. Só guarda os baldes usados.
+    """
+
+    def __init__(self, sub_buckets=128):
+        self.sub_buckets = sub_buckets
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _index(self, value):
+        if value <= 0:
+            return None
+        mantissa, exponent = math.frexp(value)
+        # mantissa em [0.5, 1): posição linear dentro da potência de 2
+        return exponent, int((mantissa - 0.5) * 2 * self.sub_buckets)
+
+    def _value(self, index):
+        exponent, sub = index
+        return math.ldexp(0.5 + (sub + 0.5) / (2 * self.sub_buckets), exponent)
+
+    def add(self, value, count=1):
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(q * self.count))
+        # Zeros (None) vêm antes de todos os baldes
+        seen = self.counts.get(None, 0)
+        if seen >= rank:
+            return 0.0
+        for index in sorted(i for i in self.counts if i is not None):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._value(index), self.max)
+        return self.max
+
+    def summary(self, digits=4):
+        if not self.count:
+            return {'count': 0}
+        data = {'count': self.count}
+        for q in PERCENTILES:
+            data[f'p{round(q * 100)}'] = round(self.percentile(q), digits)
+        data['mean'] = round(self.total / self.count, digits)
+        data['max'] = round(self.max, digits)
+        return data
+
+
+class SlidingHistogram:
+    """Fatias de `slot` segundos cobrindo a maior janela"""
+
+    def __init__(self, slot, span):
+        self.slot = slot
+        self._slots = deque(maxlen=max(1, math.ceil(span / slot)) + 1)
+
+    def add(self, value, now):
+        start = int(now // self.slot) * self.slot
+        if not self._slots or self._slots[-1][0] != start:
+            self._slots.append((start, Histogram()))
+        self._slots[-1][1].add(value)
+
+    def window(self, seconds, now):
+        merged = Histogram()
+        cutoff = now - seconds
+        for start, histogram in self._slots:
+            if start + self.slot > cutoff:
+                merged.merge(histogram)
+        return merged
+
+
+def _windows():
+    return [
+        int(seconds)
+        for seconds in settings.CHATBOT_TELEMETRY_WINDOWS.split(',')
+        if seconds.strip()
+    ]
+
+
+_lock = threading.Lock()
+_series = {}
+
+
+def record(model, latency, ttft=None, prompt_tokens=None,
+           completion_tokens=None, cache_hit=False, fast_path=False):
+    """Registra uma resposta do assistente"""
+    values = {
+        'latency': latency,
+        'ttft': ttft,
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+    }
+    tags = (model or '', bool(cache_hit), bool(fast_path))
+    now = time.time()
+    span = max(_windows())
+    with _lock:
+        for metric, value in values.items():
+            if value is None:
+                continue
+            key = (metric, tags)
+            if key not in _series:
+                _series[key] = SlidingHistogram(
+                    settings.CHATBOT_TELEMETRY_SLOT, span
+                )
+            _series[key].add(value, now)
+
+    labels = {
+        'model': model or '',
+        'cache_hit': str(bool(cache_hit)).lower(),
+        'fast_path': str(bool(fast_path)).lower(),
+    }
+    metrics.inc('nutriapp_llm_replies_total', **labels)
+    metrics.observe('nutriapp_llm_latency_seconds', latency, **labels)
+    for kind, tokens in (('prompt', prompt_tokens),
+                         ('completion', completion_tokens)):
+        if tokens:
+            metrics.inc(
+                'nutriapp_llm_tokens_total', tokens,
+                model=model or '', kind=kind
+            )
+
+
+def record_error(backend, source):
+    """Registra uma chamada ao LLM que falhou"""
+    metrics.inc('nutriapp_llm_errors_total', backend=backend, source=source)
+
+
+def telemetry_snapshot(windows=None):
+    """
+    Percentis por métrica e por combinação de tags, em cada janela, mais
+    o total da métrica ('all')
+    """
+    windows = windows or _windows()
+    now = time.time()
+    snapshot = {}
+    with _lock:
+        for metric in METRICS:
+            series = []
+            totals = {seconds: Histogram() for seconds in windows}
+            keys = sorted(key for key in _series if key[0] == metric)
+            for key in keys:
+                model, cache_hit, fast_path = key[1]
+                per_window = {}
+                for seconds in windows:
+                    histogram = _series[key].window(seconds, now)
+                    totals[seconds].merge(histogram)
+                    per_window[str(seconds)] = histogram.summary()
+                series.append({
+                    'model': model,
+                    'cache_hit': cache_hit,
+                    'fast_path': fast_path,
+                    'windows': per_window,
+                })
+            snapshot[metric] = {
+                'all': {
+                    str(seconds): histogram.summary()
+                    for seconds, histogram in totals.items()
+                },
+                'series': series,
+            }
+    return snapshot
+
+
+class PercentileCont(Aggregate):
+    """percentile_cont do PostgreSQL (percentil com interpolação)"""
+    function = 'percentile_cont'
+    template = (
+        '%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    )
+    output_field = FloatField()
+
+    def __init__(self, expression, fraction, **extra):
+        super().__init__(expression, fraction=float(fraction), **extra)
+
+
+def historical_percentiles(days=7, group_by=('backend', 'source')):
+    """
+    p50/p95/p99 de response_time e tokens_used das respostas do assistente
+    dos últimos `days` dias, calculados no banco
+    """
+    messages = ChatMessage.objects.filter(
+        role='assistant', timestamp__gte=timezone.now() - timedelta(days=days)
+    )
+    aggregates = {'replies': Count('id')}
+    for field in ('response_time', 'tokens_used'):
+        for q in PERCENTILES:
+            aggregates[f'{field}_p{round(q * 100)}'] = PercentileCont(
+                field, q
+            )
+    return list(
+        messages.values(*group_by)
+        .annotate(**aggregates)
+        .order_by(*group_by)
+    )
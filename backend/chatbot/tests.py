@@ -1,3 +1,1252 @@
-from django.test import TestCase
+import importlib
+import threading
+import time
+from contextlib import ExitStack
+from io import StringIO
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.test import APIClient
+
+from api.catalogo import invalidar_indice
+from api.models import Alimento
+from nutrition.singleflight import SingleFlight
+from nutrition.testing import QueryBudgetMixin
+from user.models import User
+from user.views import get_tokens_for_user
+from .admission import SLOT_KEY, AdmissionController, AdmissionRejected
+from .archive import archive_session, unpack
+from .coalescing import CoalescingProvider
+from . import config as chatbot_config
+from .config import get_active_config, invalidate_config
+from .fast_path import try_answer
+from . import hedging
+from .hedging import HedgedProvider, hedging_snapshot
+from .history import HistoryBuilder
+from .jobs import (
+    ERROR_REPLY,
+    _persist_reply,
+    claim_jobs,
+    enqueue_message,
+    process_job,
+)
+from .models import (
+    ChatArchive, ChatbotConfig, ChatJob, ChatMessage, ChatSession
+)
+from .providers import (
+    GroqProvider, MockProvider, ProviderCancelled, get_provider
+)
+from .quotas import _CacheLock
+from .resilience import CircuitBreaker, CircuitOpenError, ResilientProvider
+from .retrieval import find_foods
+from .services import ChatbotService
+from .telemetry import PERCENTILES, Histogram, historical_percentiles
+
+
+@override_settings(
+    QUERY_BUDGET_RAISE=True,
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    CHATBOT_USE_MOCK=True,
+    CHATBOT_MOCK_LATENCY='none',
+    CHATBOT_MOCK_ERROR_RATE=0,
+)
+class ConsultasPorEndpointTests(QueryBudgetMixin, TestCase):
+    """
+    Número de consultas de cada endpoint do chatbot, com várias sessões e
+    mensagens para um N+1 aparecer
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='chat@teste.com', name='Chat',
+            password=make_password('Senha123'), is_staff=True
+        )
+        cls.sessions = [
+            ChatSession.objects.create(user=cls.user, title=f'Sessão {i}')
+            for i in range(5)
+        ]
+        for session in cls.sessions:
+            for i in range(6):
+                ChatMessage.objects.create(
+                    session=session, role='user',
+                    content=f'Quantas calorias tem a banana {i}?'
+                )
+                ChatMessage.objects.create(
+                    session=session, role='assistant',
+                    content='A banana tem cerca de 90 kcal por 100g.',
+                    tokens_used=40, response_time=0.5
+                )
+        cls.session = cls.sessions[0]
+
+    def setUp(self):
+        # Configuração e contadores no cache começam do mesmo estado em
+        # todos os testes; a configuração fica carregada antes da medição
+        cache.clear()
+        get_active_config()
+        self.client = APIClient(SERVER_NAME='localhost')
+        token = get_tokens_for_user(self.user)['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_lista_sessoes(self):
+        with self.assertMaxQueries(2):
+            response = self.client.get('/api/chatbot/sessions/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 5)
+
+    def test_detalhe_sessao(self):
+        # Sessão, última página e a consulta ao arquivo (página incompleta)
+        with self.assertMaxQueries(4):
+            response = self.client.get(
+                f'/api/chatbot/sessions/{self.session.id}/'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['messages']), 12)
+
+    def test_mensagens_da_sessao(self):
+        with self.assertMaxQueries(3):
+            response = self.client.get(
+                f'/api/chatbot/sessions/{self.session.id}/messages/?limit=5'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['has_more'])
+
+    def test_cria_sessao(self):
+        with self.assertMaxQueries(4):
+            response = self.client.post(
+                '/api/chatbot/sessions/', {'title': 'Nova'}, format='json'
+            )
+        self.assertEqual(response.status_code, 201)
+
+    def test_atualiza_titulo(self):
+        with self.assertMaxQueries(5):
+            response = self.client.patch(
+                f'/api/chatbot/sessions/{self.session.id}/update_title/',
+                {'title': 'Renomeada'}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_ativa_desativa_sessao(self):
+        with self.assertMaxQueries(5):
+            response = self.client.post(
+                f'/api/chatbot/sessions/{self.session.id}/toggle_active/'
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_remove_sessao(self):
+        with self.assertMaxQueries(10):
+            response = self.client.delete(
+                f'/api/chatbot/sessions/{self.session.id}/'
+            )
+        self.assertEqual(response.status_code, 204)
+
+    def test_envia_mensagem(self):
+        with self.assertMaxQueries(14):
+            response = self.client.post(
+                '/api/chatbot/sessions/send_message/',
+                {'message': 'Me ajuda a montar uma dieta para emagrecer',
+                 'session_id': self.session.id},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['degraded'])
+
+    def test_envia_mensagem_em_segundo_plano(self):
+        with self.assertMaxQueries(8):
+            response = self.client.post(
+                '/api/chatbot/sessions/send_message/',
+                {'message': 'Posso trocar arroz por quinoa?',
+                 'session_id': self.session.id, 'background': True},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 202)
+
+    def test_sugestoes_de_alimentos(self):
+        with self.assertMaxQueries(2):
+            response = self.client.get(
+                '/api/chatbot/sessions/food_suggestions/?q=banana'
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_lista_mensagens(self):
+        with self.assertMaxQueries(2):
+            response = self.client.get('/api/chatbot/messages/?limit=20')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 20)
+
+    def test_busca_mensagens(self):
+        with self.assertMaxQueries(2):
+            response = self.client.get('/api/chatbot/messages/?q=banana')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['results'])
+
+        response = self.client.get(
+            f'/api/chatbot/messages/?q=banana&session={self.session.id}'
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            '/api/chatbot/messages/?q=banana&session=abc'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_acompanha_job(self):
+        job = enqueue_message(self.session, 'Quanto de proteína no ovo?')
+        with self.assertMaxQueries(2):
+            response = self.client.get(f'/api/chatbot/jobs/{job.id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_configuracoes(self):
+        with self.assertMaxQueries(2):
+            response = self.client.get('/api/chatbot/config/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_consumo(self):
+        with self.assertMaxQueries(3):
+            response = self.client.get('/api/chatbot/usage/?all_users=1')
+        self.assertEqual(response.status_code, 200)
+
+    def test_status_e_telemetria(self):
+        for url in ('/api/chatbot/status/', '/api/chatbot/telemetry/'):
+            with self.assertMaxQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+
+class HistoricoTests(TestCase):
+    """Janela de mensagens dentro do orçamento de tokens e o resumo"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='historico@teste.com', name='H')
+        cls.session = ChatSession.objects.create(user=cls.user)
+        # "um dois tres": 3 tokens + 4 de overhead = 7 por mensagem
+        cls.messages = [
+            ChatMessage.objects.create(
+                session=cls.session, role=role, content=f'um dois {i}'
+            )
+            for i, role in enumerate(['user', 'assistant'] * 3)
+        ]
+
+    def test_janela_cabe_no_orcamento(self):
+        messages, summarize_until_id = HistoryBuilder(21).build(self.session)
+        self.assertEqual(
+            [m['content'] for m in messages],
+            ['um dois 3', 'um dois 4', 'um dois 5']
+        )
+        # A mais recente que ficou de fora ainda precisa entrar no resumo
+        self.assertEqual(summarize_until_id, self.messages[2].id)
+
+    def test_limite_de_mensagens(self):
+        messages, summarize_until_id = HistoryBuilder(
+            1000, max_messages=2
+        ).build(self.session)
+        self.assertEqual(len(messages), 2)
+        self.assertEqual(summarize_until_id, self.messages[3].id)
+
+    def test_resumo_substitui_mensagens_antigas(self):
+        self.session.summary = 'Usuário quer emagrecer.'
+        self.session.summary_until = self.messages[3]
+        messages, summarize_until_id = HistoryBuilder(1000).build(
+            self.session
+        )
+        self.assertEqual(messages[0]['role'], 'system')
+        self.assertIn('Usuário quer emagrecer.', messages[0]['content'])
+        self.assertEqual(
+            [m['content'] for m in messages[1:]], ['um dois 4', 'um dois 5']
+        )
+        self.assertIsNone(summarize_until_id)
+
+    def test_mensagem_maior_que_o_orcamento_entra_truncada(self):
+        ChatMessage.objects.create(
+            session=self.session, role='user', content='palavra ' * 50
+        )
+        messages, summarize_until_id = HistoryBuilder(20).build(self.session)
+        self.assertEqual(len(messages), 1)
+        self.assertTrue(messages[0]['content'].endswith('...'))
+        self.assertIsNotNone(summarize_until_id)
+
+
+class RespostaDiretaTests(TestCase):
+    """Perguntas respondidas pelo catálogo sem chamar o modelo"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Alimento.objects.bulk_create([
+            Alimento(
+                nome=nome, energia_kcal=kcal, carboidratos_g=carbo,
+                proteinas_g=proteina, lipideos_g=gordura
+            )
+            for nome, kcal, carbo, proteina, gordura in (
+                ('Arroz, integral, cozido', 124, 25.8, 2.6, 1.0),
+                ('Arroz, integral, cru', 360, 77.5, 7.3, 1.9),
+                ('Ovo, de galinha, inteiro, cozido', 146, 0.6, 13.3, 9.5),
+            )
+        ])
+
+    def setUp(self):
+        invalidar_indice()
+
+    def tearDown(self):
+        invalidar_indice()
+
+    def test_calorias_com_quantidade(self):
+        resposta = try_answer(
+            'Quantas calorias tem 150g de arroz integral cozido?'
+        )
+        self.assertIn('150 g de Arroz, integral, cozido', resposta)
+        self.assertIn('**186 kcal**', resposta)
+
+    def test_quantidade_em_kg_com_virgula(self):
+        resposta = try_answer('Quanta proteína tem 1,5 kg de ovo?')
+        self.assertIn('1500 g de Ovo', resposta)
+        self.assertIn('**199.5 g**', resposta)
+
+    def test_comparacao(self):
+        resposta = try_answer(
+            'O que tem mais proteína: arroz integral cozido ou ovo?'
+        )
+        self.assertIn('**Ovo, de galinha, inteiro, cozido** tem mais', resposta)
+
+    def test_alimento_ambiguo_vai_para_o_modelo(self):
+        # "arroz integral" pode ser o cru ou o cozido
+        self.assertIsNone(try_answer('Quantas calorias tem arroz integral?'))
+
+    def test_mais_de_um_alimento_vai_para_o_modelo(self):
+        for pergunta in (
+            'Quantas calorias tem ovo e arroz integral cozido?',
+            'quantas calorias tem 100g de ovo com arroz integral cozido',
+        ):
+            with self.subTest(pergunta=pergunta):
+                self.assertIsNone(try_answer(pergunta))
+
+    def test_preparo_fora_do_catalogo_vai_para_o_modelo(self):
+        # Só há o ovo cozido: o frito não pode receber os valores dele
+        self.assertIsNone(try_answer('quantas calorias tem o ovo frito'))
+        self.assertIn('Ovo, de galinha', try_answer(
+            'quantas calorias tem o ovo cozido'
+        ))
+
+    def test_perguntas_que_vao_para_o_modelo(self):
+        for pergunta in (
+            'Quantas calorias tem 2 ovos?',
+            'Posso comer arroz integral cozido na dieta?',
+            'Quantas calorias tem uma xícara de feijão?',
+            'Oi, tudo bem?',
+        ):
+            with self.subTest(pergunta=pergunta):
+                self.assertIsNone(try_answer(pergunta))
+
+
+@override_settings(CHATBOT_CONFIG_CHECK_INTERVAL=0, CHATBOT_CONFIG_MAX_AGE=60)
+class ConfiguracaoTests(TestCase):
+    """Cópia da ChatbotConfig em memória e sua invalidação"""
+
+    def setUp(self):
+        cache.clear()
+        invalidate_config()
+        self.addCleanup(invalidate_config)
+        with self.assertLogs('chatbot.config', 'WARNING'):
+            self.config = get_active_config()
+
+    def test_salvar_invalida_a_copia(self):
+        with self.settings(CHATBOT_CONFIG_CHECK_INTERVAL=3600):
+            config = ChatbotConfig.objects.get(id=self.config.id)
+            config.max_tokens = 123
+            with self.captureOnCommitCallbacks(execute=True):
+                config.save()
+            self.assertEqual(get_active_config().max_tokens, 123)
+
+    def test_idade_maxima_sem_cache_compartilhado(self):
+        # Alteração feita por outro processo, com outro cache local: a
+        # versão daqui não muda
+        ChatbotConfig.objects.filter(id=self.config.id).update(
+            max_tokens=321
+        )
+        self.assertNotEqual(get_active_config().max_tokens, 321)
+
+        agora = time.monotonic() + 61
+        with mock.patch.object(
+            chatbot_config.time, 'monotonic', return_value=agora
+        ):
+            self.assertEqual(get_active_config().max_tokens, 321)
+
+
+class ContextoTacoTests(TestCase):
+    """Valores da TACO dos alimentos citados entram no prompt do modelo"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='taco@teste.com', name='T')
+        cls.session = ChatSession.objects.create(user=cls.user)
+        Alimento.objects.bulk_create([
+            Alimento(
+                nome=nome, energia_kcal=kcal, carboidratos_g=22,
+                proteinas_g=1.3, lipideos_g=0.1, fibra_g=2
+            )
+            for nome, kcal in (
+                ('Banana, prata, crua', 98),
+                ('Maçã, fuji, com casca, crua', 56),
+                ('Mamão, papaia, cru', 40),
+                ('Manga, palmer, crua', 72),
+                ('Laranja, pera, crua', 37),
+                ('Abacaxi, cru', 48),
+            )
+        ])
+
+    def setUp(self):
+        invalidar_indice()
+        self.service = ChatbotService(provider=MockProvider('mock'))
+
+    def tearDown(self):
+        invalidar_indice()
+
+    def prompt(self, texto):
+        with mock.patch('builtins.print'):
+            mensagens = self.service._prepare_messages(self.session, texto)
+        return mensagens[0]['content']
+
+    def test_alimento_citado(self):
+        prompt = self.prompt('Banana prata engorda?')
+        self.assertIn('DADOS DA TABELA TACO', prompt)
+        self.assertIn('Banana, prata, crua | 98 | 22 | 1.3 | 0.1 | 2', prompt)
+        self.assertNotIn('Abacaxi', prompt)
+
+    def test_sem_alimento(self):
+        self.assertNotIn('TABELA TACO', self.prompt('Oi, tudo bem?'))
+
+    def test_limite_de_alimentos(self):
+        prompt = self.prompt(
+            'Salada com banana, maçã, mamão, manga, laranja e abacaxi'
+        )
+        linhas = [linha for linha in prompt.splitlines() if ' | ' in linha]
+        # Cabeçalho e no máximo 5 alimentos
+        self.assertEqual(len(linhas), 6)
+        self.assertEqual(len(find_foods('banana maçã mamão', limit=2)), 2)
+
+
+@override_settings(
+    CHATBOT_USE_MOCK=False, CHATBOT_PROVIDER='groq', GROQ_API_KEY='teste',
+    CHATBOT_HEDGE_PROVIDER='', CHATBOT_HEDGE_MODEL='',
+    CHATBOT_HEDGE_MOCK_LATENCY='',
+)
+class ProvedoresTests(TestCase):
+    """get_provider escolhe o backend pelas settings"""
+
+    def test_groq_por_padrao(self):
+        provider = get_provider('modelo')
+        self.assertIsInstance(provider, GroqProvider)
+        self.assertEqual(provider.model, 'modelo')
+        self.assertIsInstance(get_provider('modelo', 'mock'), MockProvider)
+
+    def test_mock_forcado(self):
+        with self.settings(CHATBOT_USE_MOCK=True):
+            self.assertIsInstance(get_provider('modelo'), MockProvider)
+            self.assertIsInstance(
+                get_provider('modelo', 'groq'), MockProvider
+            )
+        with self.settings(CHATBOT_PROVIDER='mock'):
+            self.assertIsInstance(get_provider('modelo'), MockProvider)
+
+    def test_backend_invalido(self):
+        with self.assertRaises(ValidationError):
+            get_provider('modelo', 'openai')
+        with self.settings(GROQ_API_KEY=''):
+            with self.assertRaises(ValidationError):
+                get_provider('modelo')
+
+    def test_secundario_do_hedge(self):
+        primario = MockProvider('mock')
+        service = ChatbotService(provider=primario)
+        # Sem CHATBOT_HEDGE_PROVIDER, o secundário usa o backend principal
+        hedged = service._hedged(primario)
+        self.assertIsInstance(hedged.secondary.provider, GroqProvider)
+        with self.settings(
+            CHATBOT_USE_MOCK=True, CHATBOT_HEDGE_MOCK_LATENCY='none'
+        ):
+            hedged = service._hedged(primario)
+        self.assertIsInstance(hedged.secondary.provider, MockProvider)
+
+
+@override_settings(
+    CHATBOT_USE_MOCK=True,
+    CHATBOT_MOCK_LATENCY='none',
+    CHATBOT_MOCK_ERROR_RATE=0,
+    CHATBOT_JOB_MAX_ATTEMPTS=3,
+    CHATBOT_JOB_BACKOFF_BASE=2,
+)
+class JobsTests(TestCase):
+    """Reprocessamento com backoff e gravação idempotente da resposta"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='jobs@teste.com', name='Jobs')
+        cls.session = ChatSession.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def service(self, error_rate):
+        return ChatbotService(provider=MockProvider(
+            'mock', latency='none', error_rate=error_rate
+        ))
+
+    def test_falha_temporaria_volta_para_a_fila_com_backoff(self):
+        job = enqueue_message(self.session, 'Quanto de proteína no ovo?')
+        self.assertEqual(claim_jobs('w1', 10), [job.id])
+        antes = timezone.now()
+        with self.assertLogs('chatbot.jobs', 'WARNING'):
+            process_job(job.id, self.service(error_rate=1))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ChatJob.STATUS_PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('limite de requisições', job.error)
+        # base * 2^0, com até 25% de jitter
+        espera = (job.next_attempt_at - antes).total_seconds()
+        self.assertGreaterEqual(espera, 2)
+        self.assertLess(espera, 3)
+        self.assertEqual(claim_jobs('w1', 10), [])
+
+    def test_desiste_depois_do_maximo_de_tentativas(self):
+        job = enqueue_message(self.session, 'Quanto de proteína no ovo?')
+        service = self.service(error_rate=1)
+        for _ in range(3):
+            ChatJob.objects.filter(id=job.id).update(
+                next_attempt_at=timezone.now()
+            )
+            self.assertEqual(claim_jobs('w1', 10), [job.id])
+            with self.assertLogs('chatbot.jobs', 'WARNING'):
+                process_job(job.id, service)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ChatJob.STATUS_FAILED)
+        self.assertEqual(job.attempts, 3)
+        self.assertEqual(job.assistant_message.content, ERROR_REPLY)
+
+    def test_reprocessar_nao_duplica_a_resposta(self):
+        job = enqueue_message(self.session, 'Quanto de proteína no ovo?')
+        claim_jobs('w1', 10)
+        with self.assertLogs('chatbot.jobs', 'INFO'):
+            process_job(job.id, self.service(error_rate=0))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ChatJob.STATUS_DONE)
+
+        # Worker que reservou o mesmo job (lock expirado) e termina depois
+        _persist_reply(job.id, 'Outra resposta', ChatJob.STATUS_DONE)
+        process_job(job.id, self.service(error_rate=0))
+        respostas = ChatMessage.objects.filter(
+            session=self.session, role='assistant'
+        )
+        self.assertEqual(respostas.count(), 1)
+        self.assertEqual(respostas.get().id, job.assistant_message_id)
+
+    def test_retoma_job_abandonado(self):
+        job = enqueue_message(self.session, 'Quanto de proteína no ovo?')
+        claim_jobs('w1', 10)
+        self.assertEqual(claim_jobs('w2', 10), [])
+        ChatJob.objects.filter(id=job.id).update(
+            locked_at=timezone.now() - timedelta(seconds=600)
+        )
+        self.assertEqual(claim_jobs('w2', 10), [job.id])
+        job.refresh_from_db()
+        self.assertEqual((job.locked_by, job.attempts), ('w2', 2))
+
+    def test_worker_registra_excecoes_das_threads(self):
+        worker = importlib.import_module(
+            'chatbot.management.commands.chatbot_worker'
+        )
+        erro = RuntimeError('cache fora do ar')
+        with ExitStack() as stack:
+            # A conexão do TestCase não pode ser fechada no meio do teste
+            stack.enter_context(mock.patch.object(worker, 'connection'))
+            stack.enter_context(
+                mock.patch.object(worker, 'process_job', side_effect=erro)
+            )
+            stack.enter_context(mock.patch.object(
+                worker, 'archive_old_sessions', side_effect=erro
+            ))
+            logs = stack.enter_context(
+                self.assertLogs(worker.__name__, 'ERROR')
+            )
+            worker._run_job(42)
+            worker._run_archive()
+        self.assertIn('job 42', logs.output[0])
+        self.assertIn('arquivamento', logs.output[1])
+        self.assertIn('cache fora do ar', '\n'.join(logs.output))
+
+
+class ReservaDeJobsTests(TransactionTestCase):
+    """SKIP LOCKED: workers simultâneos nunca reservam o mesmo job"""
+
+    def test_pula_jobs_travados_por_outro_worker(self):
+        user = User.objects.create(email='skip@teste.com', name='Skip')
+        session = ChatSession.objects.create(user=user)
+        primeiro = enqueue_message(session, 'Primeira pergunta')
+        segundo = enqueue_message(session, 'Segunda pergunta')
+
+        travado = threading.Event()
+        liberar = threading.Event()
+
+        def outro_worker():
+            # Segura o lock do primeiro job, como um claim em andamento
+            try:
+                with transaction.atomic():
+                    list(ChatJob.objects.select_for_update().filter(
+                        id=primeiro.id
+                    ))
+                    travado.set()
+                    liberar.wait(5)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=outro_worker)
+        thread.start()
+        try:
+            self.assertTrue(travado.wait(5))
+            self.assertEqual(claim_jobs('w1', 10), [segundo.id])
+        finally:
+            liberar.set()
+            thread.join()
+        self.assertEqual(claim_jobs('w1', 10), [primeiro.id])
+
+
+class CircuitBreakerTests(TestCase):
+    """Transições do breaker e a resposta degradada com o circuito aberto"""
+
+    def breaker(self):
+        return CircuitBreaker(
+            'teste', window=4, min_calls=4, failure_rate=0.5,
+            slow_call=10, slow_rate=1, cooldown=0.05
+        )
+
+    def abrir(self, breaker):
+        for failed in (True, False, True, False):
+            breaker.record(failed, 0.1)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def esperar_cooldown(self, breaker):
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+
+    def test_abre_com_muitas_falhas_e_recusa_chamadas(self):
+        breaker = self.breaker()
+        for failed in (True, False, False):
+            breaker.record(failed, 0.1)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        with self.assertLogs('chatbot.resilience', 'WARNING'):
+            breaker.record(True, 0.1)
+        provider = ResilientProvider(
+            MockProvider('mock', latency='none', error_rate=0),
+            breaker=breaker
+        )
+        with self.assertRaises(CircuitOpenError):
+            provider.complete([{'role': 'user', 'content': 'oi'}], 10, 0.5)
+        self.assertEqual(breaker.stats['rejected'], 1)
+
+    def test_half_open_libera_uma_chamada_de_teste(self):
+        breaker = self.breaker()
+        with self.assertLogs('chatbot.resilience', 'INFO'):
+            self.abrir(breaker)
+            self.esperar_cooldown(breaker)
+            self.assertTrue(breaker.allow())
+            self.assertFalse(breaker.allow())
+            breaker.record(False, 0.1)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_falha_no_half_open_reabre(self):
+        breaker = self.breaker()
+        with self.assertLogs('chatbot.resilience', 'WARNING'):
+            self.abrir(breaker)
+            self.esperar_cooldown(breaker)
+            self.assertTrue(breaker.allow())
+            breaker.record(True, 0.1)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(breaker.stats['times_opened'], 2)
+
+    def test_chamada_cancelada_nao_fecha_o_circuito(self):
+        breaker = self.breaker()
+        provider = ResilientProvider(
+            MockProvider('mock', latency='fixed:1', error_rate=0),
+            breaker=breaker
+        )
+        cancel_event = threading.Event()
+        cancel_event.set()
+        with self.assertLogs('chatbot.resilience', 'WARNING'):
+            self.abrir(breaker)
+        self.esperar_cooldown(breaker)
+
+        with self.assertRaises(ProviderCancelled):
+            provider.complete(
+                [{'role': 'user', 'content': 'oi'}], 10, 0.5,
+                cancel_event=cancel_event
+            )
+        # Continua em teste, e a vaga de teste foi devolvida
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.stats['successes'], 2)
+
+    @override_settings(CHATBOT_ADMISSION_WAIT=0)
+    def test_resposta_degradada_com_circuito_aberto(self):
+        Alimento.objects.create(
+            nome='Banana, prata, crua', energia_kcal=98, carboidratos_g=26,
+            proteinas_g=1.3, lipideos_g=0.1
+        )
+        invalidar_indice()
+        self.addCleanup(invalidar_indice)
+        user = User.objects.create(email='degradado@teste.com', name='D')
+        session = ChatSession.objects.create(user=user)
+        breaker = self.breaker()
+        with self.assertLogs('chatbot', 'WARNING'):
+            self.abrir(breaker)
+            service = ChatbotService(provider=ResilientProvider(
+                MockProvider('mock', latency='none', error_rate=0),
+                breaker=breaker
+            ))
+            result = service.send_message(
+                session, 'Posso comer banana prata no café da manhã?'
+            )
+
+        self.assertTrue(result['degraded'])
+        resposta = result['assistant_message']
+        self.assertEqual(resposta.source, 'fallback')
+        self.assertIn('Banana, prata, crua', resposta.content)
+
+
+class HedgingTests(TestCase):
+    """Corrida entre dois backends simulados com latências diferentes"""
+
+    def hedged(self, nome, primario, secundario):
+        # Modelo próprio por teste: latências e contadores são por backend
+        return HedgedProvider(
+            MockProvider(nome, latency=primario, error_rate=0),
+            MockProvider(f'{nome}-secundario', latency=secundario,
+                         error_rate=0),
+            min_delay=0.02, max_delay=0.05, initial_delay=0.02
+        )
+
+    def perguntar(self, provider, vezes):
+        return [
+            provider.complete(
+                [{'role': 'user', 'content': f'Pergunta {i}'}], 50, 0.5
+            )
+            for i in range(vezes)
+        ]
+
+    def stats(self, provider):
+        return next(
+            item for item in hedging_snapshot()
+            if item['primary'] == provider.label
+        )
+
+    def test_principal_rapido_nao_duplica(self):
+        provider = self.hedged('rapido', 'none', 'none')
+        respostas = self.perguntar(provider, 5)
+        self.assertFalse(any(resposta.hedged for resposta in respostas))
+        self.assertEqual(
+            {resposta.model for resposta in respostas}, {'rapido'}
+        )
+        self.assertEqual(self.stats(provider)['hedge_rate'], 0)
+
+    def test_principal_lento_perde_para_o_secundario(self):
+        provider = self.hedged('lento', 'fixed:0.3', 'none')
+        respostas = self.perguntar(provider, 3)
+        self.assertTrue(all(resposta.hedged for resposta in respostas))
+        self.assertEqual(
+            {resposta.model for resposta in respostas}, {'lento-secundario'}
+        )
+        stats = self.stats(provider)
+        self.assertEqual(stats['hedge_rate'], 1)
+        self.assertEqual(stats['secondary_wins'], 3)
+        # A latência do principal que perdeu também entra no percentil (é
+        # registrada quando a chamada cancelada termina, logo depois)
+        for _ in range(100):
+            if len(provider.tracker._samples) == 3:
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(provider.tracker._samples), 3)
+        self.assertGreaterEqual(provider.tracker.percentile(0), 0.02)
+
+    def test_pool_cheio_nao_duplica(self):
+        provider = self.hedged('pool-cheio', 'fixed:0.1', 'none')
+        hedging._get_executor()
+        with mock.patch.object(hedging, '_slots', threading.Semaphore(0)):
+            resposta = self.perguntar(provider, 1)[0]
+        self.assertFalse(resposta.hedged)
+        self.assertEqual(resposta.model, 'pool-cheio')
+        self.assertEqual(self.stats(provider)['pool_full'], 1)
+
+
+@override_settings(SINGLEFLIGHT_POLL_INTERVAL=0.01)
+class CoalescenciaTests(TestCase):
+    """Chamadas idênticas compartilhadas entre processos (cache)"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_so_apaga_o_proprio_lock(self):
+        flight = SingleFlight('teste.lock', shared=True, wait=0.05)
+        lock_key = 'singleflight:teste.lock:chave:lock'
+        # Outro processo calculando há mais tempo que a espera
+        cache.set(lock_key, 'outro-processo')
+        self.assertEqual(flight.do('chave', lambda: 42), (42, False))
+        self.assertEqual(cache.get(lock_key), 'outro-processo')
+
+    def test_resultado_vai_para_quem_esperava(self):
+        # Duas instâncias fazem o papel de dois processos
+        lider = SingleFlight('teste.espera', shared=True, wait=5,
+                             concurrent_only=True)
+        seguidor = SingleFlight('teste.espera', shared=True, wait=5,
+                                concurrent_only=True)
+        calculando = threading.Event()
+        resultado = {}
+
+        def calcular():
+            calculando.set()
+            time.sleep(0.1)
+            return 'resposta'
+
+        thread = threading.Thread(
+            target=lambda: resultado.update(lider=lider.do('k', calcular))
+        )
+        thread.start()
+        calculando.wait(5)
+        self.assertEqual(seguidor.do('k', lambda: 'outra'), ('resposta', True))
+        thread.join()
+        self.assertEqual(resultado['lider'], ('resposta', False))
+
+        # A mesma pergunta repetida depois não reaproveita a resposta
+        self.assertEqual(seguidor.do('k', lambda: 'nova'), ('nova', False))
+
+    def test_sem_concurrent_only_reaproveita_dentro_do_ttl(self):
+        flight = SingleFlight('teste.ttl', shared=True, wait=1)
+        flight.do('k', lambda: 1)
+        self.assertEqual(flight.do('k', lambda: 2), (1, True))
+
+    def test_so_quem_chamou_o_modelo_gasta_cota(self):
+        provider = CoalescingProvider(
+            MockProvider('coalescencia', latency='fixed:0.1', error_rate=0)
+        )
+        messages = [{'role': 'user', 'content': 'Quanto de fibra na aveia?'}]
+        respostas = []
+
+        def perguntar():
+            respostas.append(provider.complete(messages, 50, 0.5))
+
+        threads = [threading.Thread(target=perguntar) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        lideres = [r for r in respostas if not r.coalesced]
+        seguidores = [r for r in respostas if r.coalesced]
+        self.assertEqual((len(lideres), len(seguidores)), (1, 2))
+        self.assertGreater(lideres[0].tokens_used, 0)
+        # tokens_used é o que vai para record_tokens e para a mensagem
+        self.assertEqual({r.tokens_used for r in seguidores}, {0})
+        self.assertEqual(
+            {r.content for r in respostas}, {lideres[0].content}
+        )
+
+
+@override_settings(
+    CHATBOT_USE_MOCK=True,
+    CHATBOT_MOCK_LATENCY='none',
+    CHATBOT_MOCK_ERROR_RATE=0,
+    CHATBOT_RATE_LIMIT_PER_MINUTE=2,
+    CHATBOT_RATE_LIMIT_BURST=2,
+    CHATBOT_DAILY_TOKEN_QUOTA=0,
+)
+class LimitesTests(TestCase):
+    """Taxa de mensagens e cota diária de tokens por usuário"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='limites@teste.com', name='L')
+        cls.session = ChatSession.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient(SERVER_NAME='localhost')
+        token = get_tokens_for_user(self.user)['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def enviar(self):
+        return self.client.post(
+            '/api/chatbot/sessions/send_message/',
+            {'message': 'Me ajuda a montar um cardápio?',
+             'session_id': self.session.id},
+            format='json'
+        )
+
+    def test_taxa_de_mensagens(self):
+        restantes = []
+        for _ in range(2):
+            response = self.enviar()
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['X-RateLimit-Limit'], '2')
+            restantes.append(response['X-RateLimit-Remaining'])
+        self.assertEqual(restantes, ['1', '0'])
+
+        response = self.enviar()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['X-RateLimit-Remaining'], '0')
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertIn('Muitas mensagens', response.json()['error'])
+
+    @override_settings(CHATBOT_DAILY_TOKEN_QUOTA=100)
+    def test_cota_diaria_de_tokens(self):
+        ChatMessage.objects.create(
+            session=self.session, role='assistant', content='...',
+            tokens_used=100
+        )
+        response = self.enviar()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['X-Token-Quota-Limit'], '100')
+        self.assertEqual(response['X-Token-Quota-Remaining'], '0')
+        self.assertIn('Cota diária', response.json()['error'])
+
+    def test_lock_de_outro_processo_nao_e_liberado(self):
+        cache.set('bucket:lock', 'outro-processo')
+        with _CacheLock('bucket', wait=0.02) as lock:
+            self.assertFalse(lock.acquired)
+        self.assertEqual(cache.get('bucket:lock'), 'outro-processo')
+
+        cache.delete('bucket:lock')
+        with _CacheLock('bucket') as lock:
+            self.assertTrue(lock.acquired)
+        self.assertIsNone(cache.get('bucket:lock'))
+
+
+class AdmissaoTests(TestCase):
+    """Limite global de chamadas ao LLM entre processos (vagas no cache)"""
+
+    def setUp(self):
+        cache.clear()
+
+    def processo(self):
+        # Cada controlador faz o papel de um processo do servidor
+        return AdmissionController(limit=0, global_limit=2, wait=0)
+
+    def test_limite_global_entre_processos(self):
+        a, b = self.processo(), self.processo()
+        with ExitStack() as vagas:
+            vagas.enter_context(a.slot())
+            vagas.enter_context(a.slot())
+            with self.assertLogs('chatbot.admission', 'WARNING'):
+                with self.assertRaises(AdmissionRejected):
+                    with b.slot():
+                        pass
+            self.assertEqual(b.snapshot()['global_in_flight'], 2)
+        with b.slot():
+            self.assertEqual(b.snapshot()['global_in_flight'], 1)
+        self.assertEqual(b.snapshot()['global_in_flight'], 0)
+
+    def test_vaga_expirada_nao_libera_as_outras(self):
+        a, b = self.processo(), self.processo()
+        with a.slot():
+            # Vaga de um processo que morreu durante a chamada
+            livre = next(
+                SLOT_KEY.format(i) for i in range(2)
+                if cache.get(SLOT_KEY.format(i)) is None
+            )
+            cache.add(livre, 'processo-morto', timeout=0.05)
+            with self.assertLogs('chatbot.admission', 'WARNING'):
+                with self.assertRaises(AdmissionRejected):
+                    with b.slot():
+                        pass
+
+            time.sleep(0.1)
+            # Só a vaga do processo morto volta; a chamada de `a` continua
+            # contando
+            with b.slot():
+                with self.assertLogs('chatbot.admission', 'WARNING'):
+                    with self.assertRaises(AdmissionRejected):
+                        with self.processo().slot():
+                            pass
+
+
+    def test_erro_no_cache_devolve_a_vaga_local(self):
+        controle = AdmissionController(limit=1, global_limit=2, wait=0)
+        erro = ConnectionError('cache fora do ar')
+        with mock.patch.object(cache, 'add', side_effect=erro):
+            for _ in range(2):
+                with self.assertRaises(ConnectionError):
+                    with controle.slot():
+                        pass
+        with controle.slot():
+            self.assertEqual(controle.snapshot()['global_in_flight'], 1)
+
+
+class ContadoresDaSessaoTests(TestCase):
+    """Campos desnormalizados da sessão usados na listagem"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='contadores@teste.com', name='C')
+        cls.session = ChatSession.objects.create(user=cls.user)
+        cls.longa = 'Quero montar um cardápio ' * 10
+        cls.pergunta = ChatMessage.objects.create(
+            session=cls.session, role='user', content=cls.longa
+        )
+        cls.ultima = ChatMessage.objects.create(
+            session=cls.session, role='assistant', content='Claro!'
+        )
+
+    def test_sinal_atualiza_contadores(self):
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.message_count, 2)
+        self.assertEqual(self.session.last_message_at, self.ultima.timestamp)
+        # A prévia é da última mensagem do usuário, cortada em 100
+        self.assertEqual(
+            self.session.last_user_message_preview,
+            self.longa[:100] + '...'
+        )
+
+        client = APIClient(SERVER_NAME='localhost')
+        token = get_tokens_for_user(self.user)['access']
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        sessao = client.get('/api/chatbot/sessions/').json()['results'][0]
+        self.assertEqual(sessao['message_count'], 2)
+        self.assertEqual(
+            sessao['last_message']['content'], self.longa[:100] + '...'
+        )
+        # A data é a da mensagem do usuário, não a da resposta
+        self.assertEqual(
+            parse_datetime(sessao['last_message']['timestamp']),
+            self.pergunta.timestamp
+        )
+        self.assertEqual(
+            parse_datetime(sessao['last_message_at']), self.ultima.timestamp
+        )
+
+    def test_migracao_preenche_sessoes_existentes(self):
+        ChatSession.objects.update(
+            message_count=0, last_message_at=None,
+            last_user_message_preview=''
+        )
+        migracao = importlib.import_module(
+            'chatbot.migrations.0008_chatsession_counters'
+        )
+        migracao.preencher_contadores(apps, None)
+
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.message_count, 2)
+        self.assertEqual(self.session.last_message_at, self.ultima.timestamp)
+        self.assertEqual(
+            self.session.last_user_message_preview,
+            self.longa[:100] + '...'
+        )
+
+        ChatSession.objects.update(last_user_message_at=None)
+        importlib.import_module(
+            'chatbot.migrations.0013_chatsession_last_user_message_at'
+        ).preencher_ultima_do_usuario(apps, None)
+        self.session.refresh_from_db()
+        self.assertEqual(
+            self.session.last_user_message_at, self.pergunta.timestamp
+        )
+
+
+class PaginacaoPorCursorTests(TestCase):
+    """Páginas do histórico continuam do cursor mesmo com novas mensagens"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='cursor@teste.com', name='C')
+        cls.session = ChatSession.objects.create(user=cls.user)
+        ChatMessage.objects.bulk_create([
+            ChatMessage(session=cls.session, role='user', content=str(i))
+            for i in range(10)
+        ])
+        # Metade com a mesma data: o empate é decidido pelo id
+        empatadas = ChatMessage.objects.order_by('id')[:5]
+        ChatMessage.objects.filter(id__in=empatadas.values('id')).update(
+            timestamp=empatadas[0].timestamp
+        )
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME='localhost')
+        token = get_tokens_for_user(self.user)['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.url = f'/api/chatbot/sessions/{self.session.id}/messages/'
+
+    def pagina(self, before=None):
+        params = {'limit': 4}
+        if before:
+            params['before'] = before
+        data = self.client.get(self.url, params).json()
+        return [m['content'] for m in data['results']], data
+
+    def test_paginas_estaveis_com_insercoes(self):
+        conteudos, data = self.pagina()
+        self.assertEqual(conteudos, ['6', '7', '8', '9'])
+
+        # Mensagens novas entre uma página e outra não deslocam as seguintes
+        for i in range(3):
+            ChatMessage.objects.create(
+                session=self.session, role='user', content=f'nova {i}'
+            )
+        conteudos, data = self.pagina(data['before'])
+        self.assertEqual(conteudos, ['2', '3', '4', '5'])
+        self.assertTrue(data['has_more'])
+
+        conteudos, data = self.pagina(data['before'])
+        self.assertEqual(conteudos, ['0', '1'])
+        self.assertFalse(data['has_more'])
+        self.assertIsNone(data['before'])
+
+    def test_cursor_invalido(self):
+        response = self.client.get(self.url, {'before': 'nao-e-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ArquivamentoTests(TestCase):
+    """Mensagens arquivadas voltam iguais e o histórico dos jobs fica"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='arquivo@teste.com', name='A')
+
+    def setUp(self):
+        self.session = ChatSession.objects.create(user=self.user)
+        for i in range(5):
+            pergunta = ChatMessage.objects.create(
+                session=self.session, role='user', content=f'pergunta {i}'
+            )
+            resposta = ChatMessage.objects.create(
+                session=self.session, role='assistant',
+                content=f'resposta {i}', tokens_used=10 + i,
+                response_time=0.5, source='llm', backend='groq'
+            )
+            ChatJob.objects.create(
+                session=self.session, user_message=pergunta,
+                assistant_message=resposta, status=ChatJob.STATUS_DONE
+            )
+        self.session.summary = 'Resumo'
+        self.session.summary_until = resposta
+        self.session.save()
+        self.client = APIClient(SERVER_NAME='localhost')
+        token = get_tokens_for_user(self.user)['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_ida_e_volta(self):
+        originais = list(
+            ChatMessage.objects.filter(session=self.session)
+            .order_by('timestamp', 'id')
+        )
+        self.assertEqual(archive_session(self.session, batch_size=4), 10)
+        self.assertFalse(
+            ChatMessage.objects.filter(session=self.session).exists()
+        )
+
+        lotes = ChatArchive.objects.filter(session=self.session).order_by(
+            'first_timestamp', 'first_message_id'
+        )
+        self.assertEqual(lotes.count(), 3)
+        voltaram = [m for lote in lotes for m in unpack(lote)]
+        campos = [
+            'id', 'role', 'content', 'timestamp', 'tokens_used',
+            'response_time', 'source', 'backend', 'hedged',
+        ]
+        self.assertEqual(
+            [[getattr(m, campo) for campo in campos] for m in voltaram],
+            [[getattr(m, campo) for campo in campos] for m in originais]
+        )
+
+        # Os jobs continuam, só sem a mensagem do usuário
+        jobs = ChatJob.objects.filter(session=self.session)
+        self.assertEqual(jobs.count(), 5)
+        self.assertFalse(jobs.filter(user_message__isnull=False).exists())
+        self.assertEqual(
+            set(jobs.values_list('status', flat=True)), {ChatJob.STATUS_DONE}
+        )
+        # E o resumo continua valendo até a mesma mensagem
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.summary_until_id, originais[-1].id)
+
+    def test_paginacao_continua_no_arquivo(self):
+        archive_session(self.session, batch_size=4)
+        for i in range(2):
+            ChatMessage.objects.create(
+                session=self.session, role='user', content=f'nova {i}'
+            )
+        url = f'/api/chatbot/sessions/{self.session.id}/messages/'
+
+        conteudos, before = [], None
+        while True:
+            params = {'limit': 3}
+            if before:
+                params['before'] = before
+            data = self.client.get(url, params).json()
+            conteudos[:0] = [m['content'] for m in data['results']]
+            before = data['before']
+            if not data['has_more']:
+                break
+        self.assertEqual(conteudos, [
+            texto for i in range(5)
+            for texto in (f'pergunta {i}', f'resposta {i}')
+        ] + ['nova 0', 'nova 1'])
+        self.assertIsNone(before)
+
+    def test_sessao_com_job_pendente_nao_e_arquivada(self):
+        pergunta = ChatMessage.objects.create(
+            session=self.session, role='user', content='pendente'
+        )
+        ChatJob.objects.create(session=self.session, user_message=pergunta)
+        with self.assertLogs('chatbot.archive', 'INFO'):
+            self.assertEqual(archive_session(self.session), 0)
+        self.assertEqual(
+            ChatMessage.objects.filter(session=self.session).count(), 11
+        )
+
+
+class PercentisTests(TestCase):
+    """Histograma em memória e percentile_cont do banco concordam"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(email='percentis@teste.com', name='P')
+        session = ChatSession.objects.create(user=user)
+        cls.tempos = [i / 10 for i in range(1, 201)]
+        ChatMessage.objects.bulk_create([
+            ChatMessage(
+                session=session, role='assistant', content='resposta',
+                response_time=tempo, tokens_used=round(tempo * 100),
+                source='llm', backend='groq'
+            )
+            for tempo in cls.tempos
+        ])
+
+    def test_histograma_contra_percentile_cont(self):
+        histograma = Histogram()
+        for tempo in self.tempos:
+            histograma.add(tempo)
+        [linha] = historical_percentiles(days=1, group_by=('backend',))
+        self.assertEqual(linha['replies'], 200)
+        for q in PERCENTILES:
+            with self.subTest(q=q):
+                banco = linha[f'response_time_p{round(q * 100)}']
+                # Balde com erro de 1/128 mais a interpolação do banco
+                self.assertAlmostEqual(
+                    histograma.percentile(q), banco, delta=banco / 64
+                )
+
+    def test_comando(self):
+        saida = StringIO()
+        call_command('chatbot_percentiles', days=1, by=['backend'],
+                     stdout=saida)
+        linhas = saida.getvalue().splitlines()
+        self.assertEqual(len(linhas), 2)
+        self.assertTrue(linhas[1].startswith('groq'))
+        self.assertIn('1005/1900/1980', linhas[1])
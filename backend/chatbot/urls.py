@@ -3,14 +3,24 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     ChatSessionViewSet,
     ChatMessageViewSet,
-    ChatbotConfigViewSet
+    ChatJobViewSet,
+    ChatbotConfigViewSet,
+    ChatbotStatusView,
+    ChatTelemetryView,
+    ChatUsageView
 )
 
 router = DefaultRouter()
 router.register(r'sessions', ChatSessionViewSet, basename='chatsession')
 router.register(r'messages', ChatMessageViewSet, basename='chatmessage')
+router.register(r'jobs', ChatJobViewSet, basename='chatjob')
 router.register(r'config', ChatbotConfigViewSet, basename='chatbotconfig')
 
 urlpatterns = [
+    path('status/', ChatbotStatusView.as_view(), name='chatbot-status'),
+    path(
+        'telemetry/', ChatTelemetryView.as_view(), name='chatbot-telemetry'
+    ),
+    path('usage/', ChatUsageView.as_view(), name='chatbot-usage'),
     path('', include(router.urls)),
 ]
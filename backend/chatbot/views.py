@@ -1,18 +1,36 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.views import APIView
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
 from django.shortcuts import get_object_or_404
-from .models import ChatSession, ChatMessage, ChatbotConfig
+from django.utils import timezone
+from .models import ChatSession, ChatMessage, ChatJob, ChatbotConfig
 from .serializers import (
     ChatSessionSerializer,
     ChatSessionListSerializer,
     ChatMessageSerializer,
+    ChatMessageSearchSerializer,
+    ChatJobSerializer,
     SendMessageSerializer,
     ChatbotConfigSerializer
 )
+from nutrition.singleflight import singleflight_snapshot
+from .admission import AdmissionRejected, get_admission
+from .hedging import hedging_snapshot
+from .jobs import enqueue_message
+from .pagination import MessagePagination, SessionPagination
+from .quotas import check_limits, tokens_used_today
+from .search import search_messages
+from .resilience import breakers_snapshot
 from .services import ChatbotService
+from .telemetry import telemetry_snapshot
+from datetime import timedelta
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +40,7 @@ class ChatSessionViewSet(viewsets.ModelViewSet):
     ViewSet para gerenciar sessões de chat
     """
     permission_classes = [IsAuthenticated]
+    pagination_class = SessionPagination
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -29,13 +48,26 @@ class ChatSessionViewSet(viewsets.ModelViewSet):
         return ChatSessionSerializer
 
     def get_queryset(self):
-        return ChatSession.objects.filter(
-            user=self.request.user
-        ).prefetch_related('messages')
+        # Contadores e prévia ficam na própria sessão; as mensagens são
+        # paginadas (ChatSessionSerializer traz só a última página)
+        return ChatSession.objects.filter(user=self.request.user)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        limits = getattr(request, 'chat_limits', None)
+        if limits is not None:
+            # Cota restante já considerando a resposta desta mensagem
+            if limits.allowed and settings.CHATBOT_DAILY_TOKEN_QUOTA:
+                limits.tokens_used = tokens_used_today(request.user.id)
+            for header, value in limits.headers().items():
+                response[header] = value
+        return response
+
     @action(detail=False, methods=['post'])
     def send_message(self, request):
         """
@@ -53,6 +85,14 @@ class ChatSessionViewSet(viewsets.ModelViewSet):
         session_id = data.get('session_id')
         create_new = data.get('create_new_session', False)
 
+        # Taxa de mensagens e cota diária de tokens do usuário
+        request.chat_limits = check_limits(request.user)
+        if not request.chat_limits.allowed:
+            return Response(
+                {'error': request.chat_limits.error},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+
         try:
             chatbot_service = ChatbotService()
 
@@ -66,6 +106,19 @@ class ChatSessionViewSet(viewsets.ModelViewSet):
                     user=request.user
                 )
 
+            # Modo assíncrono: o worker chama o LLM e o cliente acompanha
+            # o job por long-poll em /jobs/<id>/?wait=
+            if data.get('background'):
+                job = enqueue_message(session, message)
+                return Response({
+                    'session_id': session.id,
+                    'job_id': job.id,
+                    'status': job.status,
+                    'user_message': ChatMessageSerializer(
+                        job.user_message
+                    ).data
+                }, status=status.HTTP_202_ACCEPTED)
+
             # Envia a mensagem
             result = chatbot_service.send_message(session, message)
 
@@ -79,17 +132,24 @@ class ChatSessionViewSet(viewsets.ModelViewSet):
                         result['assistant_message']
                     ).data,
                     'tokens_used': result['tokens_used'],
-                    'response_time': result['response_time']
+                    'response_time': result['response_time'],
+                    'degraded': result.get('degraded', False)
                 }, status=status.HTTP_200_OK)
             else:
                 return Response({
                     'session_id': session.id,
                     'error': result['error'],
                     'error_message': ChatMessageSerializer(
-                        result['error_message']
+                        result['assistant_message']
                     ).data
                 }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        except AdmissionRejected as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(e.retry_after)}
+            )
         except Exception as e:
             logger.error(f"Erro no endpoint send_message: {str(e)}")
             return Response(
@@ -97,6 +157,22 @@ class ChatSessionViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=True, methods=['get'])
+    def messages(self, request, pk=None):
+        """
+        Histórico da sessão paginado por cursor: sem `before`, a página mais
+        recente; com `before`, as mensagens anteriores a ele
+        """
+        session = self.get_object()
+        # Mensagens antigas podem estar arquivadas (chatbot.archive)
+        paginator = MessagePagination(session=session)
+        page = paginator.paginate_queryset(
+            session.messages.all(), request, self
+        )
+        return paginator.get_paginated_response(
+            ChatMessageSerializer(page, many=True).data
+        )
+
     @action(detail=True, methods=['patch'])
     def update_title(self, request, pk=None):
         """
@@ -112,7 +188,7 @@ class ChatSessionViewSet(viewsets.ModelViewSet):
             )
 
         session.title = title
-        session.save()
+        session.save(update_fields=['title', 'updated_at'])
 
         return Response(
             ChatSessionSerializer(session).data,
@@ -126,7 +202,7 @@ class ChatSessionViewSet(viewsets.ModelViewSet):
         """
         session = self.get_object()
         session.is_active = not session.is_active
-        session.save()
+        session.save(update_fields=['is_active', 'updated_at'])
 
         return Response(
             ChatSessionSerializer(session).data,
@@ -165,15 +241,80 @@ class ChatSessionViewSet(viewsets.ModelViewSet):
 
 class ChatMessageViewSet(viewsets.ReadOnlyModelViewSet):
     """
-    ViewSet somente leitura para mensagens de chat
+    ViewSet somente leitura para mensagens de chat.
+    Com ?q= faz busca textual no histórico (ordenada por relevância).
     """
     serializer_class = ChatMessageSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = MessagePagination
 
     def get_queryset(self):
         return ChatMessage.objects.filter(
             session__user=self.request.user
-        ).select_related('session')
+        ).defer('search_vector')
+
+    def list(self, request, *args, **kwargs):
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return super().list(request, *args, **kwargs)
+
+        session_id = request.query_params.get('session')
+        if session_id is not None:
+            try:
+                session_id = int(session_id)
+            except ValueError:
+                return Response(
+                    {'error': 'session deve ser um número inteiro'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        paginator = self.pagination_class()
+        limit = paginator.get_page_size(request)
+        results = search_messages(
+            request.user, text, limit=limit + 1, session_id=session_id
+        )
+        return Response({
+            'results': ChatMessageSearchSerializer(
+                results[:limit], many=True
+            ).data,
+            'has_more': len(results) > limit,
+        }, status=status.HTTP_200_OK)
+
+
+class ChatJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Acompanhamento das mensagens enfileiradas.
+
+    GET /jobs/<id>/?wait=20 segura a requisição (long-poll) até o job
+    terminar ou o tempo acabar, limitado a CHATBOT_JOB_MAX_WAIT segundos.
+    """
+    serializer_class = ChatJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return ChatJob.objects.filter(
+            session__user=self.request.user
+        ).select_related('user_message', 'assistant_message')
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            wait = float(request.query_params.get('wait', 0))
+        except ValueError:
+            wait = 0
+        deadline = time.monotonic() + min(
+            max(wait, 0), settings.CHATBOT_JOB_MAX_WAIT
+        )
+
+        job = self.get_object()
+        pending = (ChatJob.STATUS_PENDING, ChatJob.STATUS_RUNNING)
+        while job.status in pending and time.monotonic() < deadline:
+            time.sleep(0.5)
+            job = self.get_object()
+
+        return Response(
+            self.get_serializer(job).data,
+            status=status.HTTP_200_OK
+        )
 
 
 class ChatbotConfigViewSet(viewsets.ReadOnlyModelViewSet):
@@ -189,3 +330,112 @@ class ChatbotConfigViewSet(viewsets.ReadOnlyModelViewSet):
         if self.request.user.is_staff:
             return ChatbotConfig.objects.all()
         return ChatbotConfig.objects.none()
+
+
+class ChatbotStatusView(APIView):
+    """
+    Estado dos circuit breakers, do hedging, da coalescência e do controle
+    de admissão das chamadas ao LLM neste processo (admin only)
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(
+            {
+                'breakers': breakers_snapshot(),
+                'hedging': hedging_snapshot(),
+                'singleflight': singleflight_snapshot(),
+                'admission': get_admission().snapshot(),
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+class ChatTelemetryView(APIView):
+    """
+    Percentis (p50/p95/p99) de latência, tempo até o primeiro token e tokens
+    das respostas deste processo, por modelo, cache_hit e fast_path, nas
+    janelas deslizantes das settings ou em ?window=<segundos> (admin only)
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        windows = None
+        if 'window' in request.query_params:
+            try:
+                windows = [int(request.query_params['window'])]
+            except ValueError:
+                return Response(
+                    {'error': 'window deve ser um número inteiro'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        return Response(
+            telemetry_snapshot(windows), status=status.HTTP_200_OK
+        )
+
+
+class ChatUsageView(APIView):
+    """
+    Consumo do chatbot por dia (mensagens e tokens), em uma única consulta
+    agrupada. ?days= define o período (padrão 30); staff pode usar
+    ?all_users=1 para ver o consumo de todos os usuários.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            days = min(max(int(request.query_params.get('days', 30)), 1), 366)
+        except ValueError:
+            return Response(
+                {'error': 'days deve ser um número inteiro'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        all_users = (
+            request.user.is_staff
+            and request.query_params.get('all_users') == '1'
+        )
+        start = timezone.localdate() - timedelta(days=days - 1)
+        messages = ChatMessage.objects.filter(
+            role='assistant', timestamp__date__gte=start
+        )
+        group_by = ['day']
+        if all_users:
+            group_by.insert(0, 'session__user_id')
+        else:
+            messages = messages.filter(session__user=request.user)
+
+        rows = (
+            messages.annotate(day=TruncDate('timestamp'))
+            .values(*group_by)
+            .annotate(
+                replies=Count('id'),
+                llm_calls=Count('id', filter=Q(source='llm')),
+                tokens=Coalesce(Sum('tokens_used'), 0),
+            )
+            .order_by(*group_by)
+        )
+        usage = [
+            {
+                **({'user_id': row['session__user_id']} if all_users else {}),
+                'day': row['day'],
+                'replies': row['replies'],
+                'llm_calls': row['llm_calls'],
+                'tokens': row['tokens'],
+            }
+            for row in rows
+        ]
+
+        quota = settings.CHATBOT_DAILY_TOKEN_QUOTA or None
+        used_today = tokens_used_today(request.user.id)
+        return Response({
+            'days': days,
+            'usage': usage,
+            'today': {
+                'tokens_used': used_today,
+                'token_quota': quota,
+                'tokens_remaining': (
+                    max(0, quota - used_today) if quota else None
+                ),
+            },
+        }, status=status.HTTP_200_OK)
@@ -0,0 +1,150 @@
+"""
+Execução de benchmarks dos endpoints e comparação com uma baseline.
+
+Cada cenário é uma função `(client, rng) -> response` chamada repetidamente
+com o cliente de teste do DRF, dentro do processo (middlewares, ORM e banco
+reais, sem rede). Para cada cenário são medidos vazão, latência (p50/p99) e
+consultas SQL por requisição. A baseline é um JSON com os mesmos números;
+piora acima da tolerância em latência ou vazão, ou qualquer consulta a mais
+por requisição, é apontada como regressão.
+
+Usado pelo comando benchmark (api/management/commands/benchmark.py).
+"""
+import json
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.db import connections
+
+from .querycount import QueryCounter
+
+
+def percentile(values, fraction):
+    """Percentil por posição (nearest-rank) de uma lista ordenada"""
+    if not values:
+        return None
+    index = max(math.ceil(fraction * len(values)) - 1, 0)
+    return values[index]
+
+
+def run_scenario(make_client, scenario, iterations, threads=1, warmup=0,
+                 seed=0):
+    """
+    Executa `iterations` chamadas do cenário divididas entre `threads`
+    threads, depois de `warmup` chamadas descartadas
+    """
+    latencies = []
+    queries = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(index, count):
+        client = make_client()
+        rng = random.Random(seed * 1000 + index)
+        for _ in range(count):
+            counter = QueryCounter()
+            started = time.perf_counter()
+            with counter.capture():
+                response = scenario(client, rng)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                queries.append(counter.count)
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+
+    def thread_worker(index, count):
+        try:
+            worker(index, count)
+        finally:
+            # Cada thread abriu as suas conexões
+            connections.close_all()
+
+    warm_client = make_client()
+    warm_rng = random.Random(seed)
+    for _ in range(warmup):
+        scenario(warm_client, warm_rng)
+
+    shares = [
+        iterations // threads + (1 if i < iterations % threads else 0)
+        for i in range(threads)
+    ]
+    started = time.perf_counter()
+    if threads == 1:
+        worker(0, iterations)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for future in [
+                pool.submit(thread_worker, i, share)
+                for i, share in enumerate(shares) if share
+            ]:
+                future.result()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'threads': threads,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput': round(len(latencies) / wall, 2) if wall else None,
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+        'queries_per_request': round(sum(queries) / len(queries), 2),
+    }
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Regressões em relação à baseline: lista de (cenário, métrica, baseline,
+    atual). Só compara cenários medidos com o mesmo número de threads.
+    """
+    regressions = []
+    for name, current in results.items():
+        before = baseline.get(name)
+        if not before or before.get('threads') != current['threads']:
+            continue
+        for metric in ('p50_ms', 'p99_ms'):
+            if current[metric] > before[metric] * (1 + tolerance):
+                regressions.append(
+                    (name, metric, before[metric], current[metric])
+                )
+        if current['throughput'] < before['throughput'] * (1 - tolerance):
+            regressions.append(
+                (name, 'throughput', before['throughput'],
+                 current['throughput'])
+            )
+        # Consultas por requisição não dependem da máquina: qualquer
+        # aumento (além de arredondamento) é regressão
+        if current['queries_per_request'] > before['queries_per_request'] + 0.5:
+            regressions.append(
+                (name, 'queries_per_request', before['queries_per_request'],
+                 current['queries_per_request'])
+            )
+    return regressions
+
+
+def load_baseline(path):
+    path = Path(path)
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding='utf-8')).get('scenarios', {})
+
+
+def save_baseline(path, results, metadata=None):
+    """Grava (ou atualiza) a baseline dos cenários executados"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    scenarios = load_baseline(path)
+    scenarios.update(results)
+    path.write_text(
+        json.dumps(
+            {'metadata': metadata or {}, 'scenarios': scenarios},
+            indent=2, ensure_ascii=False, sort_keys=True
+        ) + '\n',
+        encoding='utf-8'
+    )
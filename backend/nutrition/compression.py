@@ -0,0 +1,157 @@
+"""
+Compressão das respostas (gzip, ou brotli se o pacote brotli estiver
+instalado), também para respostas em streaming.
+
+Só são comprimidas respostas de tipos textuais (COMPRESSION_TYPES e text/*)
+com pelo menos COMPRESSION_MIN_SIZE bytes; respostas em streaming não têm
+tamanho conhecido e são sempre comprimidas, pedaço a pedaço e com flush a
+cada pedaço, então os primeiros bytes continuam saindo antes do fim. O gzip
+das respostas comuns usa compress_string do Django, com o preenchimento
+aleatório contra BREACH do GZipMiddleware.
+"""
+import re
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bytes aleatórios no cabeçalho gzip, como no GZipMiddleware do Django
+MAX_RANDOM_BYTES = 100
+
+_ACCEPT_RE = re.compile(r'\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*')
+
+
+def accepted_encodings(header):
+    """Codificações aceitas no Accept-Encoding (q > 0)"""
+    accepted = set()
+    for part in header.split(','):
+        match = _ACCEPT_RE.fullmatch(part)
+        if not match:
+            continue
+        name, quality = match.groups()
+        try:
+            if quality is not None and float(quality) <= 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(name.lower())
+    return accepted
+
+
+def _compressible(response):
+    content_type = response.get('Content-Type', '').split(';')[0].strip()
+    return (
+        content_type.startswith('text/')
+        or content_type in settings.COMPRESSION_TYPES
+    )
+
+
+def _gzip_sequence(sequence):
+    # wbits=31: formato gzip (cabeçalho e CRC) em vez de zlib puro
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in sequence:
+        data = (
+            compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        )
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+    for chunk in sequence:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not settings.COMPRESSION_ENABLED or not _compressible(response):
+            return response
+        # A resposta varia com o Accept-Encoding mesmo quando não é
+        # comprimida (caches intermediários)
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        if (
+            response.has_header('Content-Encoding')
+            or response.status_code in (204, 206, 304)
+            or (
+                not response.streaming
+                and len(response.content) < settings.COMPRESSION_MIN_SIZE
+            )
+        ):
+            return response
+
+        accepted = accepted_encodings(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+        )
+        # Em respostas assíncronas cada pedaço é um membro gzip separado;
+        # brotli não permite isso
+        use_brotli = (
+            brotli is not None and 'br' in accepted
+            and not getattr(response, 'is_async', False)
+        )
+        if use_brotli:
+            encoding = 'br'
+        elif 'gzip' in accepted:
+            encoding = 'gzip'
+        else:
+            return response
+
+        if response.streaming:
+            self._compress_stream(response, encoding)
+        else:
+            if encoding == 'br':
+                content = brotli.compress(
+                    response.content,
+                    quality=settings.COMPRESSION_BROTLI_QUALITY
+                )
+            else:
+                content = compress_string(
+                    response.content, max_random_bytes=MAX_RANDOM_BYTES
+                )
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        # Uma ETag forte deixa de valer para o corpo comprimido
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+    def _compress_stream(self, response, encoding):
+        if getattr(response, 'is_async', False):
+            original = response.streaming_content
+
+            async def gzip_chunks():
+                async for chunk in original:
+                    yield compress_string(
+                        chunk, max_random_bytes=MAX_RANDOM_BYTES
+                    )
+
+            response.streaming_content = gzip_chunks()
+        elif encoding == 'br':
+            response.streaming_content = _brotli_sequence(
+                response.streaming_content
+            )
+        else:
+            response.streaming_content = _gzip_sequence(
+                response.streaming_content
+            )
+        del response['Content-Length']
@@ -0,0 +1,17 @@
+"""
+Tratamento de exceções da API (REST_FRAMEWORK['EXCEPTION_HANDLER']).
+
+Views com `wrap_errors = True` (as de usuário) devolvem os erros de
+validação e de autenticação dentro de {"errors": ...}; as demais mantêm o
+formato padrão do DRF.
+"""
+from rest_framework.views import exception_handler as drf_exception_handler
+
+
+def exception_handler(exc, context):
+    response = drf_exception_handler(exc, context)
+    if response is not None and getattr(
+        context.get('view'), 'wrap_errors', False
+    ):
+        response.data = {'errors': response.data}
+    return response
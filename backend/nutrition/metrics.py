@@ -0,0 +1,360 @@
+"""
+Métricas operacionais no formato texto do Prometheus, sem dependências.
+
+Contadores e histogramas ficam em um arquivo mapeado em memória (mmap) por
+processo em METRICS_DIR; GET /metrics soma os arquivos de todos os
+processos, então com vários workers do gunicorn qualquer um deles responde
+pelo conjunto. O endpoint só existe com METRICS_TOKEN definido, exigido
+como Bearer no scrape. Sem METRICS_DIR os valores ficam só na memória do processo
+(runserver, testes). A pasta deve ser esvaziada quando o servidor inicia
+(ex: no entrypoint), como no modo multiprocesso do prometheus_client.
+
+MetricsMiddleware conta as requisições por rota (nome da view), método e
+status, com histogramas de duração e de consultas SQL.
+
+Uso:
+    metrics.inc('nutriapp_cache_requests_total', cache='catalogo',
+                result='hit')
+    metrics.observe('nutriapp_llm_latency_seconds', 1.2, model='groq:...')
+"""
+import hmac
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+)
+
+# nome -> (tipo, descrição, buckets)
+_registry = {}
+
+
+def register(name, kind, description, buckets=None):
+    """Declara uma métrica (counter ou histogram) para o /metrics"""
+    if kind == 'histogram':
+        buckets = tuple(sorted(buckets or DEFAULT_BUCKETS))
+    _registry[name] = (kind, description, buckets)
+
+
+register(
+    'nutriapp_http_requests_total', 'counter',
+    'Requisições HTTP por rota, método e status'
+)
+register(
+    'nutriapp_http_request_duration_seconds', 'histogram',
+    'Duração das requisições HTTP por rota'
+)
+register(
+    'nutriapp_http_request_db_queries', 'histogram',
+    'Consultas SQL por requisição',
+    buckets=(0, 1, 2, 3, 5, 8, 13, 20, 50, 100)
+)
+register(
+    'nutriapp_http_db_seconds_total', 'counter',
+    'Tempo gasto no banco pelas requisições, por rota'
+)
+register(
+    'nutriapp_cache_requests_total', 'counter',
+    'Acessos aos caches em memória (result=hit|miss)'
+)
+
+
+class _MemoryStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def items(self):
+        with self._lock:
+            return list(self._values.items())
+
+
+class _MmapStore:
+    """
+    Chave -> double em um arquivo mapeado. Layout: 8 bytes com o tamanho
+    usado, seguido de entradas [tamanho da chave][chave][alinhamento][valor].
+    Só o próprio processo escreve; o valor é gravado no lugar, e uma entrada
+    nova só passa a contar depois de escrita por inteiro.
+    """
+    INITIAL_SIZE = 1024 * 1024
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+b')
+        size = max(os.fstat(self._file.fileno()).st_size, self.INITIAL_SIZE)
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._used = struct.unpack_from('i', self._map, 0)[0] or 8
+        self._offsets = {
+            key: offset for key, offset, _ in _read_entries(self._map)
+        }
+
+    def _entry(self, key):
+        encoded = key.encode()
+        padded = len(encoded) + (8 - (4 + len(encoded)) % 8)
+        length = 4 + padded + 8
+        while self._used + length > len(self._map):
+            self._map.resize(len(self._map) * 2)
+        offset = self._used
+        struct.pack_into(
+            f'i{padded}sd', self._map, offset, len(encoded), encoded, 0.0
+        )
+        self._used += length
+        struct.pack_into('i', self._map, 0, self._used)
+        self._offsets[key] = offset + 4 + padded
+        return self._offsets[key]
+
+    def inc(self, key, amount):
+        with self._lock:
+            offset = self._offsets.get(key)
+            if offset is None:
+                offset = self._entry(key)
+            value = struct.unpack_from('d', self._map, offset)[0]
+            struct.pack_into('d', self._map, offset, value + amount)
+
+    def items(self):
+        with self._lock:
+            return [
+                (key, value) for key, _, value in _read_entries(self._map)
+            ]
+
+
+def _read_entries(data):
+    used = struct.unpack_from('i', data, 0)[0]
+    position = 8
+    while position < used:
+        length = struct.unpack_from('i', data, position)[0]
+        padded = length + (8 - (4 + length) % 8)
+        key = bytes(data[position + 4:position + 4 + length]).decode()
+        offset = position + 4 + padded
+        yield key, offset, struct.unpack_from('d', data, offset)[0]
+        position = offset + 8
+
+
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def _get_store():
+    """Store do processo (recriado depois de um fork)"""
+    global _store, _store_pid
+    pid = os.getpid()
+    if _store_pid != pid:
+        with _store_lock:
+            if _store_pid != pid:
+                directory = settings.METRICS_DIR
+                if directory:
+                    Path(directory).mkdir(parents=True, exist_ok=True)
+                    _store = _MmapStore(Path(directory) / f'{pid}.db')
+                else:
+                    _store = _MemoryStore()
+                _store_pid = pid
+    return _store
+
+
+def _key(sample, labels):
+    return json.dumps([sample, sorted(labels.items())], ensure_ascii=False)
+
+
+def inc(name, amount=1, **labels):
+    """Soma `amount` ao contador"""
+    if settings.METRICS_ENABLED:
+        _get_store().inc(_key(name, labels), amount)
+
+
+def observe(name, value, **labels):
+    """Registra um valor no histograma declarado com register()"""
+    if not settings.METRICS_ENABLED:
+        return
+    buckets = _registry[name][2]
+    le = next((b for b in buckets if value <= b), math.inf)
+    store = _get_store()
+    store.inc(_key(f'{name}_bucket', {**labels, 'le': le}), 1)
+    store.inc(_key(f'{name}_sum', labels), value)
+    store.inc(_key(f'{name}_count', labels), 1)
+
+
+def collect():
+    """Valores somados de todos os processos: {chave: valor}"""
+    totals = {}
+    directory = settings.METRICS_DIR
+    if directory:
+        for path in Path(directory).glob('*.db'):
+            with open(path, 'rb') as file:
+                data = file.read()
+            if len(data) < 8:
+                continue
+            for key, _, value in _read_entries(data):
+                totals[key] = totals.get(key, 0.0) + value
+    else:
+        for key, value in _get_store().items():
+            totals[key] = value
+    return totals
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return (
+        str(value).replace('\\', '\\\\').replace('"', '\\"')
+        .replace('\n', '\\n')
+    )
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = (
+        f'{name}="{_format_value(value) if name == "le" else _escape(value)}"'
+        for name, value in labels
+    )
+    return '{' + ','.join(pairs) + '}'
+
+
+def render():
+    """Texto no formato de exposição do Prometheus (versão 0.0.4)"""
+    samples = {}
+    for key, value in collect().items():
+        sample, labels = json.loads(key)
+        samples.setdefault(sample, []).append((labels, value))
+
+    lines = []
+    names = sorted(
+        set(_registry) | {
+            name for name in samples
+            if not any(
+                name == f'{base}{suffix}' for base in _registry
+                for suffix in ('_bucket', '_sum', '_count')
+            )
+        }
+    )
+    for name in names:
+        kind, description, buckets = _registry.get(
+            name, ('untyped', '', None)
+        )
+        if kind == 'histogram':
+            body = _render_histogram(name, samples)
+        else:
+            body = [
+                f'{name}{_format_labels(labels)} {_format_value(value)}'
+                for labels, value in sorted(samples.get(name, []))
+            ]
+        if not body:
+            continue
+        if description:
+            lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(body)
+    return '\n'.join(lines) + '\n'
+
+
+def _render_histogram(name, samples):
+    buckets = _registry[name][2]
+    series = {}
+    for labels, value in samples.get(f'{name}_bucket', []):
+        labels = dict(labels)
+        le = float(labels.pop('le'))
+        counts = series.setdefault(tuple(sorted(labels.items())), {})
+        counts[le] = counts.get(le, 0) + value
+    sums = {
+        tuple(map(tuple, labels)): value
+        for labels, value in samples.get(f'{name}_sum', [])
+    }
+    totals = {
+        tuple(map(tuple, labels)): value
+        for labels, value in samples.get(f'{name}_count', [])
+    }
+
+    lines = []
+    for labels in sorted(series):
+        counts = series[labels]
+        cumulative = 0
+        for le in (*buckets, math.inf):
+            cumulative += counts.get(le, 0)
+            lines.append(
+                f'{name}_bucket'
+                f'{_format_labels(list(labels) + [("le", le)])} '
+                f'{_format_value(cumulative)}'
+            )
+        lines.append(
+            f'{name}_sum{_format_labels(labels)} '
+            f'{_format_value(sums.get(labels, 0))}'
+        )
+        lines.append(
+            f'{name}_count{_format_labels(labels)} '
+            f'{_format_value(totals.get(labels, cumulative))}'
+        )
+    return lines
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def metrics_view(request):
+    """
+    GET /metrics com Authorization: Bearer <METRICS_TOKEN>. Sem token
+    configurado o endpoint não existe: as métricas expõem rotas, volume de
+    tráfego e consumo do LLM
+    """
+    token = settings.METRICS_TOKEN
+    if not settings.METRICS_ENABLED or not token:
+        raise Http404
+    sent = request.META.get('HTTP_AUTHORIZATION', '')
+    if not hmac.compare_digest(sent, f'Bearer {token}'):
+        return JsonResponse({'error': 'Token inválido'}, status=401)
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            self._record(request, status, time.perf_counter() - started)
+
+    def _record(self, request, status, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else 'unmatched'
+        inc('nutriapp_http_requests_total', route=route,
+            method=request.method, status=status)
+        observe('nutriapp_http_request_duration_seconds', elapsed,
+                route=route)
+
+        # Contador de QueryBudgetMiddleware (ausente com o orçamento
+        # desligado)
+        counter = getattr(request, 'query_counter', None)
+        if counter is not None:
+            observe('nutriapp_http_request_db_queries', counter.count,
+                    route=route)
+            inc('nutriapp_http_db_seconds_total', counter.duration,
+                route=route)
@@ -0,0 +1,175 @@
+"""
+Tempo por etapa das requisições (Server-Timing) e perfis cProfile por
+amostragem.
+
+ProfilingMiddleware mede o total da requisição, o tempo no banco (o mesmo
+contador de nutrition.querycount), a renderização da resposta (serialize) e
+as etapas marcadas no código com `record_timing('llm')`, e os envia no
+cabeçalho Server-Timing, que o DevTools do navegador mostra na aba Network.
+O cabeçalho vai só para usuários staff que mandam `X-Profile: 1`, ou para
+todos com PROFILING_SERVER_TIMING (desenvolvimento).
+
+Uma fração PROFILING_SAMPLE_RATE das requisições, e as com o cabeçalho
+`X-Profile: 1` de usuários staff, rodam sob cProfile. O usuário vem do token
+JWT, resolvido antes da view para que o cabeçalho de quem não é staff nem
+ligue o profiler; o perfil vai para
+PROFILING_DIR/<nome da view>/ como .prof (abrir com snakeviz ou pstats).
+Cada view guarda no máximo PROFILING_MAX_BYTES; os perfis mais antigos são
+apagados primeiro.
+"""
+import cProfile
+import logging
+import os
+import random
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .querycount import QueryCounter
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+
+_timings = ContextVar('request_timings', default=None)
+
+
+@contextmanager
+def record_timing(name):
+    """Soma a duração do bloco na etapa `name` da requisição atual"""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = (
+            timings.get(name, 0.0) + time.perf_counter() - started
+        )
+
+
+def server_timing(timings, counter=None):
+    """Valor do cabeçalho Server-Timing (durações em ms)"""
+    parts = []
+    if counter is not None:
+        parts.append(
+            f'db;dur={counter.duration * 1000:.1f};'
+            f'desc="{counter.count} consultas"'
+        )
+    for name, seconds in timings.items():
+        parts.append(f'{name};dur={seconds * 1000:.1f}')
+    return ', '.join(parts)
+
+
+def _safe_name(view_name):
+    return re.sub(r'[^\w.-]+', '_', view_name).strip('_') or 'sem_nome'
+
+
+def save_profile(profiler, view_name):
+    """Grava o perfil da view e apaga os mais antigos acima do limite"""
+    directory = Path(settings.PROFILING_DIR) / _safe_name(view_name)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / (
+        f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.prof"
+    )
+    profiler.dump_stats(path)
+
+    files = sorted(directory.glob('*.prof'), key=os.path.getmtime)
+    total = sum(file.stat().st_size for file in files)
+    while total > settings.PROFILING_MAX_BYTES and len(files) > 1:
+        oldest = files.pop(0)
+        total -= oldest.stat().st_size
+        oldest.unlink(missing_ok=True)
+    return path
+
+
+def is_staff_request(request):
+    """
+    Se o token JWT da requisição é de um usuário staff. Serve aos
+    middlewares que rodam antes da autenticação do DRF
+    """
+    try:
+        authenticated = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return authenticated is not None and authenticated[0].is_staff
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = {}
+        token = _timings.set(timings)
+        # Só quem manda o cabeçalho paga a consulta do usuário
+        staff = (
+            request.META.get(PROFILE_HEADER) == '1' and is_staff_request(request)
+        )
+        sampled = random.random() < settings.PROFILING_SAMPLE_RATE
+        profiler = cProfile.Profile() if staff or sampled else None
+        started = time.perf_counter()
+        try:
+            if profiler is not None:
+                try:
+                    profiler.enable()
+                except ValueError:
+                    # Outro profiler já ativo nesta thread
+                    profiler = None
+            try:
+                response, counter = self._get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+            timings['total'] = time.perf_counter() - started
+        finally:
+            _timings.reset(token)
+
+        if settings.PROFILING_SERVER_TIMING or staff:
+            response['Server-Timing'] = server_timing(timings, counter)
+
+        if profiler is not None:
+            match = getattr(request, 'resolver_match', None)
+            view_name = match.view_name if match else request.path
+            try:
+                path = save_profile(profiler, view_name)
+            except OSError as e:
+                logger.warning(f"Perfil de {view_name} não gravado: {e}")
+            else:
+                if staff:
+                    response['X-Profile-File'] = path.name
+        return response
+
+    def _get_response(self, request):
+        if settings.QUERY_BUDGET_ENABLED:
+            # QueryBudgetMiddleware (mais interno) já conta as consultas
+            response = self.get_response(request)
+            return response, getattr(request, 'query_counter', None)
+        counter = QueryCounter()
+        with counter.capture():
+            return self.get_response(request), counter
+
+    def process_template_response(self, request, response):
+        # Respostas do DRF são renderizadas depois da view: o tempo entre
+        # este ponto e o fim da renderização é a serialização
+        timings = _timings.get()
+        if timings is not None:
+            started = time.perf_counter()
+
+            def done(rendered):
+                timings['serialize'] = (
+                    timings.get('serialize', 0.0)
+                    + time.perf_counter() - started
+                )
+
+            response.add_post_render_callback(done)
+        return response
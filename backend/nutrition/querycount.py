@@ -0,0 +1,130 @@
+"""
+Contagem de consultas SQL por requisição e detecção de N+1.
+
+QueryBudgetMiddleware instala um connection.execute_wrapper em todas as
+conexões enquanto a requisição é processada e soma quantidade e tempo das
+consultas. Consultas com o mesmo formato (o SQL sem os parâmetros, com
+listas IN e literais normalizados) repetidas QUERY_REPEAT_THRESHOLD vezes ou
+mais na mesma requisição são a assinatura de um N+1. Passar do orçamento da
+view (QUERY_BUDGETS[view_name], senão QUERY_BUDGET_DEFAULT) ou repetir
+consultas gera um aviso no log; com QUERY_BUDGET_RAISE=1 (útil nos testes)
+gera QueryBudgetExceeded.
+
+O mesmo contador é usado nos testes por nutrition.testing.QueryBudgetMixin.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r'\bIN \((?:%s, )*%s\)', re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """Formato da consulta, sem valores: "... WHERE id IN (...)" """
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+class QueryBudgetExceeded(Exception):
+    """Requisição passou do orçamento de consultas ou repetiu consultas"""
+
+
+class QueryCounter:
+    """execute_wrapper que conta as consultas e o tempo gasto no banco"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self._statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self._statements[sql] += 1
+
+    @contextmanager
+    def capture(self):
+        """Conta as consultas de todas as conexões dentro do bloco"""
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    def repeated(self, threshold=None):
+        """Formatos executados `threshold` vezes ou mais, do mais repetido"""
+        threshold = threshold or settings.QUERY_REPEAT_THRESHOLD
+        shapes = Counter()
+        for sql, count in self._statements.items():
+            shapes[normalize_sql(sql)] += count
+        return [
+            (shape, count) for shape, count in shapes.most_common()
+            if count >= threshold
+        ]
+
+    def report(self, threshold=None, limit=3, width=200):
+        """Resumo legível das consultas repetidas"""
+        return '\n'.join(
+            f"  {count}x {shape[:width]}"
+            for shape, count in self.repeated(threshold)[:limit]
+        )
+
+
+def budget_for(view_name):
+    return settings.QUERY_BUDGETS.get(view_name, settings.QUERY_BUDGET_DEFAULT)
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_BUDGET_ENABLED:
+            return self.get_response(request)
+
+        counter = QueryCounter()
+        with counter.capture():
+            response = self.get_response(request)
+        request.query_counter = counter
+        self._check(request, counter)
+        return response
+
+    def _check(self, request, counter):
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else request.path
+        budget = budget_for(view_name)
+
+        problems = []
+        if budget is not None and counter.count > budget:
+            problems.append(
+                f"{counter.count} consultas (orçamento {budget})"
+            )
+        repeated = counter.report()
+        if repeated:
+            problems.append(f"consultas repetidas (N+1?):\n{repeated}")
+        if not problems:
+            return
+
+        message = (
+            f"{request.method} {request.path} [{view_name}] "
+            f"{counter.duration * 1000:.1f}ms no banco: "
+            + '; '.join(problems)
+        )
+        if settings.QUERY_BUDGET_RAISE:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
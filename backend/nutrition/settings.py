@@ -53,6 +53,11 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'nutrition.metrics.MetricsMiddleware',
+    'nutrition.tracing.TracingMiddleware',
+    'nutrition.compression.CompressionMiddleware',
+    'nutrition.profiling.ProfilingMiddleware',
+    'nutrition.querycount.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -64,6 +69,8 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'nutrition.urls'
 
+TEST_RUNNER = 'nutrition.testing.TestRunner'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -105,6 +112,21 @@ DATABASES = {
     }
 }
 
+# Cache do Django. Com vários processos (gunicorn) ele precisa ser
+# compartilhado para a versão da ChatbotConfig, os limites por usuário e as
+# vagas globais do LLM valerem entre os processos, ex.:
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache (pacote redis)
+# e CACHE_LOCATION=redis://localhost:6379/1. O padrão (memória local) é
+# por processo.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -179,8 +201,9 @@ REST_FRAMEWORK = {
     # ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'nutrition.renderers.ORJSONRenderer',
     ],
+    'EXCEPTION_HANDLER': 'nutrition.exceptions.exception_handler',
 }
 
 SPECTACULAR_SETTINGS = {
@@ -219,9 +242,247 @@ else:
     DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL')
 
 
+# Single-flight (nutrition/singleflight.py): com SHARED=1 a coalescência
+# também vale entre processos, via cache (o resultado fica RESULT_TTL s)
+SINGLEFLIGHT_SHARED = os.environ.get('SINGLEFLIGHT_SHARED', '0') == '1'
+SINGLEFLIGHT_RESULT_TTL = int(os.environ.get('SINGLEFLIGHT_RESULT_TTL', 5))
+SINGLEFLIGHT_POLL_INTERVAL = float(
+    os.environ.get('SINGLEFLIGHT_POLL_INTERVAL', 0.05)
+)
+
+# Orçamento de consultas SQL por requisição (nutrition/querycount.py):
+# passar do orçamento da view ou repetir o mesmo formato de consulta
+# QUERY_REPEAT_THRESHOLD vezes (N+1) gera aviso no log, ou exceção com
+# QUERY_BUDGET_RAISE=1. QUERY_BUDGETS usa o nome da view na URL.
+QUERY_BUDGET_ENABLED = os.environ.get('QUERY_BUDGET_ENABLED', '1') == '1'
+QUERY_BUDGET_RAISE = os.environ.get('QUERY_BUDGET_RAISE', '0') == '1'
+QUERY_BUDGET_DEFAULT = int(os.environ.get('QUERY_BUDGET_DEFAULT', 20))
+QUERY_REPEAT_THRESHOLD = int(os.environ.get('QUERY_REPEAT_THRESHOLD', 5))
+QUERY_BUDGETS = {
+    'alimento-list': 2,
+    'refeicao-create': 8,
+    'refeicao-detail': 10,
+    'refeicao-texto': 8,
+    'profile': 9,
+    'chatsession-list': 4,
+    'chatsession-detail': 10,
+    'chatsession-messages': 4,
+    'chatsession-send-message': 20,
+    'chatmessage-list': 3,
+    'chatbot-usage': 3,
+}
+
+# Server-Timing e perfis cProfile (nutrition/profiling.py): Server-Timing
+# para todos os usuários (sem ele, só staff com X-Profile: 1), fração das
+# requisições perfiladas (além das com X-Profile: 1 de staff), pasta dos
+# .prof e limite de espaço por view (bytes)
+PROFILING_SERVER_TIMING = (
+    os.environ.get('PROFILING_SERVER_TIMING', '0') == '1'
+)
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_DIR = os.environ.get('PROFILING_DIR', BASE_DIR / 'profiles')
+PROFILING_MAX_BYTES = int(
+    os.environ.get('PROFILING_MAX_BYTES', 20 * 1024 * 1024)
+)
+
+# Métricas no formato do Prometheus em /metrics (nutrition/metrics.py).
+# Com vários workers (gunicorn), METRICS_DIR guarda um arquivo por processo
+# e deve ser esvaziada a cada início do servidor; vazio = só em memória.
+# GET /metrics só responde com METRICS_TOKEN definido, exigido como Bearer
+# no scrape; sem ele as métricas são coletadas mas não expostas.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Tracing das requisições (nutrition/tracing.py): fração amostrada, tempo (s)
+# acima do qual a requisição é sempre exportada (0 desliga), se a flag
+# sampled do traceparent recebido vale (só atrás de um proxy que controla o
+# cabeçalho) e destino dos traces: 'jsonl' (TRACING_FILE, girado acima de
+# TRACING_MAX_BYTES) ou 'otlp' (coletor OpenTelemetry local). Os testes
+# rodam sem tracing (nutrition.testing.TestRunner)
+TRACING_ENABLED = os.environ.get('TRACING_ENABLED', '1') == '1'
+TRACING_SAMPLE_RATE = float(os.environ.get('TRACING_SAMPLE_RATE', 0.01))
+TRACING_SLOW_SECONDS = float(os.environ.get('TRACING_SLOW_SECONDS', 2))
+TRACING_TRUST_TRACEPARENT = (
+    os.environ.get('TRACING_TRUST_TRACEPARENT', '0') == '1'
+)
+TRACING_MAX_SPANS = int(os.environ.get('TRACING_MAX_SPANS', 500))
+TRACING_EXPORTER = os.environ.get('TRACING_EXPORTER', 'jsonl')
+TRACING_FILE = os.environ.get('TRACING_FILE', BASE_DIR / 'traces.jsonl')
+TRACING_MAX_BYTES = int(
+    os.environ.get('TRACING_MAX_BYTES', 50 * 1024 * 1024)
+)
+TRACING_OTLP_ENDPOINT = os.environ.get(
+    'TRACING_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces'
+)
+TRACING_SERVICE_NAME = os.environ.get('TRACING_SERVICE_NAME', 'nutriapp')
+
+# Exportação (GET /api/exportar/): linhas lidas do banco por vez
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 1000))
+
+# Compressão das respostas (nutrition/compression.py): gzip, ou brotli com o
+# pacote brotli instalado. Respostas menores que MIN_SIZE bytes não são
+# comprimidas; as em streaming sempre são
+COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', '1') == '1'
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_BROTLI_QUALITY = int(
+    os.environ.get('COMPRESSION_BROTLI_QUALITY', 4)
+)
+COMPRESSION_TYPES = [
+    'application/json',
+    'application/x-ndjson',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+]
+
+# Baseline do comando benchmark (vazão, latência e consultas por cenário)
+BENCHMARK_BASELINE = os.environ.get(
+    'BENCHMARK_BASELINE', BASE_DIR / 'benchmarks' / 'baseline.json'
+)
+
+# Tempo (s) até o índice de alimentos em memória ser reconstruído
+CATALOGO_INDICE_TTL = int(os.environ.get('CATALOGO_INDICE_TTL', 600))
+
 # Configurações do Chatbot
 GROQ_API_KEY = os.environ.get('GROQ_API_KEY')
 
+# Backend de LLM: 'groq' ou 'mock' (CHATBOT_USE_MOCK=1 força o mock local)
+CHATBOT_PROVIDER = os.environ.get('CHATBOT_PROVIDER', 'groq')
+CHATBOT_USE_MOCK = os.environ.get('CHATBOT_USE_MOCK', '0') == '1'
+
+# Mock: latência "none", "fixed:s", "uniform:min,max" ou "lognormal:mu,sigma"
+CHATBOT_MOCK_LATENCY = os.environ.get('CHATBOT_MOCK_LATENCY', 'uniform:1,3')
+CHATBOT_MOCK_ERROR_RATE = float(os.environ.get('CHATBOT_MOCK_ERROR_RATE', 0))
+CHATBOT_MOCK_DETERMINISTIC = (
+    os.environ.get('CHATBOT_MOCK_DETERMINISTIC', '1') == '1'
+)
+CHATBOT_MOCK_STREAM_CHUNK_DELAY = float(
+    os.environ.get('CHATBOT_MOCK_STREAM_CHUNK_DELAY', 0.02)
+)
+
+# Prazo (s) de cada chamada ao LLM e circuit breaker do backend: abre com
+# FAILURE_RATE de erros ou SLOW_RATE de chamadas acima de SLOW_CALL segundos
+# nas últimas WINDOW chamadas (mínimo MIN_CALLS) e tenta de novo após COOLDOWN
+CHATBOT_LLM_TIMEOUT = float(os.environ.get('CHATBOT_LLM_TIMEOUT', 15))
+CHATBOT_BREAKER_WINDOW = int(os.environ.get('CHATBOT_BREAKER_WINDOW', 20))
+CHATBOT_BREAKER_MIN_CALLS = int(os.environ.get('CHATBOT_BREAKER_MIN_CALLS', 5))
+CHATBOT_BREAKER_FAILURE_RATE = float(
+    os.environ.get('CHATBOT_BREAKER_FAILURE_RATE', 0.5)
+)
+CHATBOT_BREAKER_SLOW_CALL = float(
+    os.environ.get('CHATBOT_BREAKER_SLOW_CALL', 8)
+)
+CHATBOT_BREAKER_SLOW_RATE = float(
+    os.environ.get('CHATBOT_BREAKER_SLOW_RATE', 0.5)
+)
+CHATBOT_BREAKER_COOLDOWN = float(
+    os.environ.get('CHATBOT_BREAKER_COOLDOWN', 30)
+)
+
+# Hedging: se o backend principal não responder em PERCENTILE das suas
+# latências recentes (limitado a MIN_DELAY..MAX_DELAY s; INITIAL_DELAY antes
+# de haver amostras), o pedido é duplicado para HEDGE_PROVIDER/HEDGE_MODEL
+# (vazio = mesmo backend/modelo) e a primeira resposta vence
+CHATBOT_HEDGE_ENABLED = os.environ.get('CHATBOT_HEDGE_ENABLED', '0') == '1'
+CHATBOT_HEDGE_PROVIDER = os.environ.get('CHATBOT_HEDGE_PROVIDER', '')
+CHATBOT_HEDGE_MODEL = os.environ.get('CHATBOT_HEDGE_MODEL', '')
+CHATBOT_HEDGE_PERCENTILE = float(
+    os.environ.get('CHATBOT_HEDGE_PERCENTILE', 0.95)
+)
+CHATBOT_HEDGE_MIN_DELAY = float(os.environ.get('CHATBOT_HEDGE_MIN_DELAY', 0.5))
+CHATBOT_HEDGE_MAX_DELAY = float(os.environ.get('CHATBOT_HEDGE_MAX_DELAY', 5))
+CHATBOT_HEDGE_INITIAL_DELAY = float(
+    os.environ.get('CHATBOT_HEDGE_INITIAL_DELAY', 2)
+)
+# Chamadas simultâneas no pool do hedge, contando as perdedoras que ainda
+# não terminaram; com o pool cheio o pedido não é duplicado
+CHATBOT_HEDGE_POOL_SIZE = int(os.environ.get('CHATBOT_HEDGE_POOL_SIZE', 32))
+# Latência do mock usado como secundário (vazio = CHATBOT_MOCK_LATENCY)
+CHATBOT_HEDGE_MOCK_LATENCY = os.environ.get('CHATBOT_HEDGE_MOCK_LATENCY', '')
+
+# Limites por usuário: mensagens por minuto (BURST de folga) e tokens do LLM
+# por dia; 0 desativa. Os contadores ficam no cache, que deve ser
+# compartilhado entre os processos em produção
+CHATBOT_RATE_LIMIT_PER_MINUTE = int(
+    os.environ.get('CHATBOT_RATE_LIMIT_PER_MINUTE', 10)
+)
+CHATBOT_RATE_LIMIT_BURST = int(os.environ.get('CHATBOT_RATE_LIMIT_BURST', 5))
+CHATBOT_DAILY_TOKEN_QUOTA = int(
+    os.environ.get('CHATBOT_DAILY_TOKEN_QUOTA', 50000)
+)
+
+# Controle de admissão: máximo de chamadas simultâneas ao LLM por processo
+# e no total via cache (0 = sem limite). Sem vaga em ADMISSION_WAIT s, a API
+# responde 503 com Retry-After
+CHATBOT_MAX_INFLIGHT = int(os.environ.get('CHATBOT_MAX_INFLIGHT', 8))
+CHATBOT_MAX_INFLIGHT_GLOBAL = int(
+    os.environ.get('CHATBOT_MAX_INFLIGHT_GLOBAL', 0)
+)
+CHATBOT_ADMISSION_WAIT = float(os.environ.get('CHATBOT_ADMISSION_WAIT', 2))
+CHATBOT_ADMISSION_RETRY_AFTER = int(
+    os.environ.get('CHATBOT_ADMISSION_RETRY_AFTER', 5)
+)
+
+# Chamadas idênticas e simultâneas ao LLM compartilham uma só requisição
+CHATBOT_COALESCE_ENABLED = (
+    os.environ.get('CHATBOT_COALESCE_ENABLED', '1') == '1'
+)
+
+# ChatbotConfig fica em memória; a versão no cache é conferida a cada
+# intervalo (segundos) para perceber alterações feitas por outros processos.
+# Depois de MAX_AGE segundos a cópia é relida do banco mesmo sem nova
+# versão (sem cache compartilhado, é assim que os outros processos veem a
+# alteração)
+CHATBOT_CONFIG_CHECK_INTERVAL = float(
+    os.environ.get('CHATBOT_CONFIG_CHECK_INTERVAL', 5)
+)
+CHATBOT_CONFIG_MAX_AGE = float(os.environ.get('CHATBOT_CONFIG_MAX_AGE', 60))
+
+# Telemetria em memória (chatbot/telemetry.py): janelas deslizantes dos
+# percentis, em segundos, e a duração de cada fatia dos histogramas
+CHATBOT_TELEMETRY_WINDOWS = os.environ.get(
+    'CHATBOT_TELEMETRY_WINDOWS', '60,300,900'
+)
+CHATBOT_TELEMETRY_SLOT = int(os.environ.get('CHATBOT_TELEMETRY_SLOT', 10))
+
+# Fila de mensagens (ChatJob) processada por manage.py chatbot_worker
+CHATBOT_WORKER_CONCURRENCY = int(
+    os.environ.get('CHATBOT_WORKER_CONCURRENCY', 4)
+)
+CHATBOT_JOB_MAX_ATTEMPTS = int(os.environ.get('CHATBOT_JOB_MAX_ATTEMPTS', 4))
+CHATBOT_JOB_BACKOFF_BASE = float(
+    os.environ.get('CHATBOT_JOB_BACKOFF_BASE', 2)
+)
+# Job em execução há mais que isso (s) é considerado abandonado
+CHATBOT_JOB_LOCK_TIMEOUT = int(os.environ.get('CHATBOT_JOB_LOCK_TIMEOUT', 120))
+# Espera máxima (s) do long-poll em /api/chatbot/jobs/<id>/?wait=
+CHATBOT_JOB_MAX_WAIT = int(os.environ.get('CHATBOT_JOB_MAX_WAIT', 25))
+
+# Arquivamento: mensagens de sessões sem atividade há AFTER_DAYS dias vão
+# para lotes comprimidos (ChatArchive) de BATCH_SIZE mensagens. CODEC 'zlib'
+# ou 'zstd' (requer o pacote zstandard). O worker arquiva a cada INTERVAL
+# segundos (0 = só pelo comando archive_chat_messages)
+CHATBOT_ARCHIVE_AFTER_DAYS = int(
+    os.environ.get('CHATBOT_ARCHIVE_AFTER_DAYS', 90)
+)
+CHATBOT_ARCHIVE_BATCH_SIZE = int(
+    os.environ.get('CHATBOT_ARCHIVE_BATCH_SIZE', 500)
+)
+CHATBOT_ARCHIVE_CODEC = os.environ.get('CHATBOT_ARCHIVE_CODEC', 'zlib')
+CHATBOT_ARCHIVE_INTERVAL = int(
+    os.environ.get('CHATBOT_ARCHIVE_INTERVAL', 24 * 60 * 60)
+)
+
+# Orçamento de tokens do histórico enviado ao modelo; mensagens mais antigas
+# são substituídas pelo resumo da sessão
+CHATBOT_HISTORY_TOKEN_BUDGET = int(
+    os.environ.get('CHATBOT_HISTORY_TOKEN_BUDGET', 1200)
+)
+CHATBOT_SUMMARY_MAX_TOKENS = int(
+    os.environ.get('CHATBOT_SUMMARY_MAX_TOKENS', 250)
+)
+
 # Logging configuration
 LOGGING = {
     'version': 1,
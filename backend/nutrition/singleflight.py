@@ -0,0 +1,152 @@
+"""
+Single-flight: chamadas idênticas e simultâneas compartilham um só cálculo.
+
+Dentro do processo, a primeira chamada para uma chave executa a função e as
+demais esperam pelo mesmo resultado (ou pela mesma exceção). Com
+SINGLEFLIGHT_SHARED=1 a coordenação também passa pelo cache do Django: o
+processo que consegue o lock (cache.add) calcula e publica o resultado por
+SINGLEFLIGHT_RESULT_TTL segundos, e os outros processos o leem do cache.
+Para isso o cache precisa ser compartilhado (Redis, Memcached, banco). Com
+concurrent_only=True o resultado publicado só serve a quem chegou antes da
+publicação, ou seja, a quem estava de fato esperando por ele; uma chamada
+repetida depois calcula de novo.
+"""
+import hashlib
+import json
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+
+
+def make_key(*parts):
+    """Chave estável (sha1) para partes serializáveis em JSON"""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Grupo de chamadas coalescidas. `wait` é o máximo (s) que um processo
+    espera pelo resultado de outro antes de calcular por conta própria.
+    """
+
+    def __init__(self, name, shared=None, wait=30, concurrent_only=False):
+        self.name = name
+        self.shared = (
+            settings.SINGLEFLIGHT_SHARED if shared is None else shared
+        )
+        self.wait = wait
+        self.concurrent_only = concurrent_only
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {'calls': 0, 'executed': 0, 'coalesced': 0,
+                      'shared_hits': 0}
+        _groups[name] = self
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def do(self, key, fn):
+        """
+        Executa fn() uma única vez por chave entre as chamadas simultâneas.
+        Retorna (resultado, compartilhado).
+        """
+        with self._lock:
+            self.stats['calls'] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.stats['coalesced'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            self._report(True)
+            return call.result, True
+
+        try:
+            call.result, shared = self._run(key, fn)
+            self._report(shared)
+            return call.result, shared
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _report(self, shared):
+        # Resultado compartilhado conta como acerto no cache do grupo
+        metrics.inc('nutriapp_cache_requests_total', cache=self.name,
+                    result='hit' if shared else 'miss')
+
+    def _run(self, key, fn):
+        if not self.shared:
+            self._count('executed')
+            return fn(), False
+
+        result_key = f"singleflight:{self.name}:{key}:result"
+        lock_key = f"singleflight:{self.name}:{key}:lock"
+        token = uuid.uuid4().hex
+        arrived = time.time()
+        deadline = time.monotonic() + self.wait
+        owner = False
+        while True:
+            published = cache.get(result_key)
+            if published is not None and (
+                not self.concurrent_only or published[0] >= arrived
+            ):
+                self._count('shared_hits')
+                self._count('coalesced')
+                return published[1], True
+            if cache.add(lock_key, token, timeout=self.wait):
+                owner = True
+                break
+            # Outro processo está calculando: espera o resultado publicado
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(settings.SINGLEFLIGHT_POLL_INTERVAL)
+
+        try:
+            self._count('executed')
+            result = fn()
+            cache.set(
+                result_key, (time.time(), result),
+                timeout=settings.SINGLEFLIGHT_RESULT_TTL
+            )
+            return result, False
+        finally:
+            # Sem o lock (espera esgotada) ou com ele já expirado, a chave
+            # pode ser de outro processo: só apaga o próprio lock
+            if owner and cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    def snapshot(self):
+        with self._lock:
+            return {'name': self.name, 'in_flight': len(self._calls),
+                    **self.stats}
+
+
+_groups = {}
+
+
+def singleflight_snapshot():
+    """Contadores de todos os grupos do processo"""
+    return [group.snapshot() for group in list(_groups.values())]
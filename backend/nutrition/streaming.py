@@ -0,0 +1,83 @@
+"""
+Codificação incremental de listas grandes (JSON, NDJSON e CSV).
+
+Em vez de montar a lista inteira (serializer com many=True) e só então
+gerar o JSON, os itens são lidos de um iterador (ex: queryset.iterator())
+e codificados em lotes de `batch_size`; a memória da requisição fica
+limitada a um lote, qualquer que seja o tamanho da resposta. Com o
+CompressionMiddleware cada lote também é comprimido e enviado em seguida.
+
+    return StreamingJSONResponse(
+        queryset.iterator(chunk_size=500), encode=lambda obj: {...}
+    )
+"""
+import csv
+
+from django.http import StreamingHttpResponse
+
+from .renderers import dumps
+
+BATCH_SIZE = 500
+
+
+def _batches(items, encode, batch_size):
+    batch = []
+    for item in items:
+        batch.append(dumps(encode(item) if encode else item))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_json_array(items, encode=None, batch_size=BATCH_SIZE):
+    """Array JSON em pedaços de bytes, um por lote de itens"""
+    yield b'['
+    separator = b''
+    for batch in _batches(items, encode, batch_size):
+        yield separator + b','.join(batch)
+        separator = b','
+    yield b']'
+
+
+def iter_ndjson(items, encode=None, batch_size=BATCH_SIZE):
+    """Um objeto JSON por linha (NDJSON), em pedaços por lote"""
+    for batch in _batches(items, encode, batch_size):
+        yield b'\n'.join(batch) + b'\n'
+
+
+class StreamingJSONResponse(StreamingHttpResponse):
+    """Resposta com um array JSON gerado à medida que é enviado"""
+
+    def __init__(self, items, encode=None, batch_size=BATCH_SIZE, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(
+            iter_json_array(items, encode, batch_size), **kwargs
+        )
+
+
+class _Buffer(list):
+    """Destino do csv.writer que só acumula as linhas escritas"""
+
+    def write(self, line):
+        self.append(line)
+
+
+def iter_csv(rows, fieldnames, batch_size=BATCH_SIZE):
+    """
+    CSV (UTF-8) de dicionários, com cabeçalho, em pedaços por lote de
+    linhas; campos ausentes ficam vazios
+    """
+    buffer = _Buffer()
+    writer = csv.DictWriter(
+        buffer, fieldnames, restval='', extrasaction='ignore'
+    )
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        if len(buffer) >= batch_size:
+            yield ''.join(buffer).encode()
+            buffer.clear()
+    if buffer:
+        yield ''.join(buffer).encode()
@@ -0,0 +1,51 @@
+"""
+Utilitários de teste compartilhados pelos apps.
+"""
+from contextlib import contextmanager
+
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+from .querycount import QueryCounter
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Runner do `manage.py test`: desliga o tracing, que exportaria traces
+    das requisições dos testes para TRACING_FILE. Os testes do tracing o
+    religam com override_settings.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._settings = override_settings(TRACING_ENABLED=False)
+        self._settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._settings.disable()
+        super().teardown_test_environment(**kwargs)
+
+
+class QueryBudgetMixin:
+    """
+    Para TestCase: `with self.assertMaxQueries(3): ...` falha se o bloco
+    fizer mais consultas que o limite ou repetir o mesmo formato de consulta
+    (N+1), mostrando as consultas repetidas na mensagem.
+    """
+    repeat_threshold = 3
+
+    @contextmanager
+    def assertMaxQueries(self, limit, repeat_threshold=None):
+        counter = QueryCounter()
+        with counter.capture():
+            yield counter
+
+        threshold = repeat_threshold or self.repeat_threshold
+        problems = []
+        if counter.count > limit:
+            problems.append(f"{counter.count} consultas, limite {limit}")
+        repeated = counter.report(threshold)
+        if repeated:
+            problems.append(f"consultas repetidas:\n{repeated}")
+        if problems:
+            self.fail('; '.join(problems))
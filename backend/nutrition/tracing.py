@@ -0,0 +1,369 @@
+"""
+Rastreamento (tracing) leve das requisições em árvores de spans.
+
+TracingMiddleware abre um trace por requisição com o span raiz da view;
+nos traces amostrados cada consulta SQL vira um span (execute_wrapper em
+todas as conexões), a renderização da resposta vira 'serialize' e o código
+marca outras etapas com:
+
+    with tracing.span('llm.complete', backend='groq'):
+        ...
+
+Todas as requisições são rastreadas em memória, mas só são exportadas as
+amostradas (TRACING_SAMPLE_RATE, `X-Trace: 1` de usuários staff ou
+`traceparent` com a flag sampled, esta só com TRACING_TRUST_TRACEPARENT,
+atrás de um proxy que controla o cabeçalho) e as lentas (mais de
+TRACING_SLOW_SECONDS; estas sem os spans de SQL, decididos no início).
+Cada trace exportado é uma linha JSON em TRACING_FILE, com os spans e seus
+pais, então `grep <trace id> traces.jsonl` traz a árvore inteira; acima de
+TRACING_MAX_BYTES o arquivo passa para TRACING_FILE.1 (o anterior é
+apagado). Com TRACING_EXPORTER=otlp os spans vão para um coletor
+OpenTelemetry local (OTLP/HTTP JSON em TRACING_OTLP_ENDPOINT) em uma thread
+separada.
+
+O id do trace volta nos cabeçalhos X-Trace-Id e traceparent (W3C).
+"""
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+from .profiling import is_staff_request
+
+logger = logging.getLogger(__name__)
+
+TRACE_HEADER = 'HTTP_X_TRACE'
+
+_TRACEPARENT_RE = re.compile(
+    r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$'
+)
+
+_trace = ContextVar('trace', default=None)
+_span = ContextVar('span', default=None)
+
+
+def _new_id(size):
+    return os.urandom(size).hex()
+
+
+class Span:
+    def __init__(self, trace, name, parent_id, attributes):
+        self.trace = trace
+        self.name = name
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+
+    def finish(self, error=None):
+        self.duration = time.time() - self.start
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+
+    def as_dict(self):
+        return {
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': round(self.start, 6),
+            'duration_ms': round((self.duration or 0) * 1000, 3),
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+class Trace:
+    def __init__(self, trace_id=None, parent_id=None, sampled=False):
+        self.trace_id = trace_id or _new_id(16)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.spans = []
+        self.dropped = 0
+
+    def start_span(self, name, parent_id, attributes):
+        span = Span(self, name, parent_id, attributes)
+        if len(self.spans) < settings.TRACING_MAX_SPANS:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+        return span
+
+    @property
+    def root(self):
+        return self.spans[0]
+
+    def as_dict(self):
+        root = self.root
+        return {
+            'trace_id': self.trace_id,
+            'parent_id': self.parent_id,
+            'name': root.name,
+            'start': round(root.start, 6),
+            'duration_ms': round((root.duration or 0) * 1000, 3),
+            'attributes': root.attributes,
+            'spans': [span.as_dict() for span in self.spans],
+            'dropped_spans': self.dropped,
+        }
+
+
+def current_trace():
+    return _trace.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    """Span filho do span atual; não faz nada fora de um trace"""
+    trace = _trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _span.get()
+    current = trace.start_span(
+        name, parent.span_id if parent else trace.parent_id, attributes
+    )
+    token = _span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.finish(e)
+        raise
+    else:
+        current.finish()
+    finally:
+        _span.reset(token)
+
+
+def traced(name):
+    """Decorador: a chamada da função vira um span"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _query_span(execute, sql, params, many, context):
+    with span('db.query', statement=sql[:500],
+              alias=context['connection'].alias):
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def start_trace(name, traceparent=None, sampled=None,
+                trust_traceparent=False, **attributes):
+    """
+    Abre um trace com o span raiz `name` e, se amostrado, rastreia o SQL do
+    bloco. A flag sampled do `traceparent` só vale com `trust_traceparent`.
+    Ao final exporta o trace se amostrado ou lento.
+    """
+    if not settings.TRACING_ENABLED or _trace.get() is not None:
+        with span(name, **attributes) as current:
+            yield current.trace if current else None
+        return
+
+    trace_id = parent_id = None
+    match = _TRACEPARENT_RE.match(traceparent or '')
+    if match:
+        trace_id, parent_id, flags = match.groups()
+        if sampled is None and trust_traceparent and int(flags, 16) & 1:
+            sampled = True
+    if sampled is None:
+        sampled = random.random() < settings.TRACING_SAMPLE_RATE
+
+    trace = Trace(trace_id, parent_id, sampled)
+    token = _trace.set(trace)
+    try:
+        with ExitStack() as stack:
+            if sampled:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(_query_span)
+                    )
+            with span(name, **attributes):
+                yield trace
+    finally:
+        _trace.reset(token)
+        slow = settings.TRACING_SLOW_SECONDS
+        if trace.sampled or (slow and trace.root.duration >= slow):
+            trace.sampled = True
+            export(trace)
+
+
+def traceparent(trace):
+    """Cabeçalho W3C traceparent que continua este trace"""
+    flags = '01' if trace.sampled else '00'
+    return f'00-{trace.trace_id}-{trace.root.span_id}-{flags}'
+
+
+# Exportação
+
+_file_lock = threading.Lock()
+_otlp_queue = None
+
+
+def export(trace):
+    try:
+        if settings.TRACING_EXPORTER == 'otlp':
+            _enqueue_otlp(trace)
+        else:
+            _write_jsonl(trace)
+    except Exception as e:
+        logger.warning(f"Trace {trace.trace_id} não exportado: {e}")
+
+
+def _write_jsonl(trace):
+    path = Path(settings.TRACING_FILE)
+    line = json.dumps(trace.as_dict(), ensure_ascii=False, default=str)
+    with _file_lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            size = 0
+        if size and size + len(line) > settings.TRACING_MAX_BYTES:
+            os.replace(path, f'{path}.1')
+        with open(path, 'a', encoding='utf-8') as file:
+            file.write(line + '\n')
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def otlp_payload(trace):
+    """Corpo OTLP/HTTP JSON (ExportTraceServiceRequest) do trace"""
+    spans = []
+    for item in trace.spans:
+        end = item.start + (item.duration or 0)
+        spans.append({
+            'traceId': trace.trace_id,
+            'spanId': item.span_id,
+            'parentSpanId': item.parent_id or '',
+            'name': item.name,
+            # SPAN_KIND_SERVER no raiz, INTERNAL nos demais
+            'kind': 2 if item is trace.root else 1,
+            'startTimeUnixNano': str(int(item.start * 1e9)),
+            'endTimeUnixNano': str(int(end * 1e9)),
+            'attributes': [
+                {'key': key, 'value': _otlp_value(value)}
+                for key, value in item.attributes.items()
+            ],
+            'status': (
+                {'code': 2, 'message': item.error} if item.error
+                else {'code': 0}
+            ),
+        })
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': [{
+                'key': 'service.name',
+                'value': {'stringValue': settings.TRACING_SERVICE_NAME},
+            }]},
+            'scopeSpans': [{
+                'scope': {'name': __name__},
+                'spans': spans,
+            }],
+        }]
+    }
+
+
+def _enqueue_otlp(trace):
+    global _otlp_queue
+    with _file_lock:
+        if _otlp_queue is None:
+            _otlp_queue = queue.Queue(maxsize=1000)
+            threading.Thread(
+                target=_otlp_worker, args=(_otlp_queue,),
+                name='otlp-exporter', daemon=True
+            ).start()
+    try:
+        _otlp_queue.put_nowait(otlp_payload(trace))
+    except queue.Full:
+        logger.warning(f"Fila OTLP cheia, trace {trace.trace_id} descartado")
+
+
+def _otlp_worker(pending):
+    while True:
+        payload = pending.get()
+        request = urllib.request.Request(
+            settings.TRACING_OTLP_ENDPOINT,
+            data=json.dumps(payload).encode(),
+            headers={'Content-Type': 'application/json'},
+        )
+        try:
+            urllib.request.urlopen(request, timeout=5).close()
+        except Exception as e:
+            logger.warning(f"Coletor OTLP indisponível: {e}")
+
+
+class TracingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.TRACING_ENABLED:
+            return self.get_response(request)
+
+        # Pedido explícito só é atendido para staff; o usuário é resolvido
+        # antes da view porque os spans de SQL dependem da amostragem
+        requested = (
+            request.META.get(TRACE_HEADER) == '1'
+            and is_staff_request(request)
+        )
+        with start_trace(
+            f'{request.method} {request.path}',
+            traceparent=request.META.get('HTTP_TRACEPARENT'),
+            sampled=True if requested else None,
+            trust_traceparent=settings.TRACING_TRUST_TRACEPARENT,
+            method=request.method, path=request.path,
+        ) as trace:
+            response = self.get_response(request)
+
+            root = trace.root
+            match = getattr(request, 'resolver_match', None)
+            if match:
+                root.name = f'{request.method} {match.view_name}'
+                root.attributes['route'] = match.view_name
+            root.attributes['status'] = response.status_code
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                root.attributes['user_id'] = user.pk
+
+        response['X-Trace-Id'] = trace.trace_id
+        response['traceparent'] = traceparent(trace)
+        return response
+
+    def process_template_response(self, request, response):
+        # Respostas do DRF são renderizadas depois da view
+        trace = _trace.get()
+        if trace is not None:
+            parent = _span.get()
+            current = trace.start_span(
+                'serialize', parent.span_id if parent else None, {}
+            )
+            response.add_post_render_callback(
+                lambda rendered: current.finish()
+            )
+        return response
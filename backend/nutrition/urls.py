@@ -3,6 +3,8 @@ from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings
 
+from nutrition.metrics import metrics_view
+
 from drf_spectacular.views import (
       SpectacularAPIView,
       SpectacularRedocView,
@@ -14,6 +16,7 @@ urlpatterns = [
     path('api/', include('api.urls')),
     path('api/auth/', include('user.urls')),
     path('api/chatbot/', include('chatbot.urls')),
+    path('metrics', metrics_view, name='metrics'),
 
     # DRF SPECTACULAR
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
@@ -61,10 +61,12 @@ class UserProfileSerializer(serializers.ModelSerializer):
         read_only_fields = ['name', 'email']
 
     def get_macros(self, obj):
-        plano = PlanoAlimentar.objects.filter(profile=obj).last()
-        if plano:
-            return PlanoAlimentarSerializer(plano).data
-        return None
+        # OneToOne: usa o plano já carregado por select_related, se houver
+        try:
+            plano = obj.plano_alimentar
+        except PlanoAlimentar.DoesNotExist:
+            return None
+        return PlanoAlimentarSerializer(plano).data
 
 
 class UserChangePasswordSerializer(serializers.Serializer):
@@ -105,10 +107,9 @@ class SendPasswordResetEmailSerializer(serializers.Serializer):
 
     def validate(self, attrs):
         email = attrs.get('email')
-        user = User.objects.filter(email=email)
+        user = User.objects.filter(email=email).first()
 
-        if user.exists():
-            user = user.first()
+        if user is not None:
             temp = Util.generate_temp_password()
             success = Util.send_email(
                 user=user,
@@ -8,7 +8,7 @@ from api.models import Refeicao
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
-        Refeicao.objects.create(user=instance, nome="Café da Manhã", essencial=True)
-        Refeicao.objects.create(user=instance, nome="Almoço", essencial=True)
-        Refeicao.objects.create(user=instance, nome="Lanche", essencial=True)
-        Refeicao.objects.create(user=instance, nome="Jantar", essencial=True)
+        Refeicao.objects.bulk_create([
+            Refeicao(user=instance, nome=nome, essencial=True)
+            for nome in ("Café da Manhã", "Almoço", "Lanche", "Jantar")
+        ])
@@ -1,3 +1,449 @@
-from django.test import TestCase
+import gzip
+import json
+import tempfile
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import make_password
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, override_settings
+)
+from rest_framework.test import APIClient
+
+from api.models import Refeicao
+from nutrition import compression, metrics, tracing
+from nutrition.testing import QueryBudgetMixin
+from .models import PlanoAlimentar, User
+from .views import get_tokens_for_user
+
+
+@override_settings(
+    QUERY_BUDGET_RAISE=True,
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+)
+class ConsultasPorEndpointTests(QueryBudgetMixin, TestCase):
+    """Número de consultas de cada endpoint de usuário"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='perfil@teste.com', name='Perfil',
+            password=make_password('Senha123')
+        )
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME='localhost')
+
+    def autenticar(self):
+        token = get_tokens_for_user(self.user)['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def preencher_perfil(self):
+        profile = self.user.profile
+        profile.idade = 30
+        profile.peso = 70
+        profile.altura = 175
+        profile.sexo = 'M'
+        profile.objetivo = 'manter'
+        profile.status = True
+        profile.save()
+        PlanoAlimentar.objects.create(
+            profile=profile, calorias_diarias=2200, proteinas_diarias=140,
+            carboidratos_diarios=250, gorduras_diarias=60
+        )
+
+    def test_cadastro(self):
+        with self.assertMaxQueries(4):
+            response = self.client.post('/api/auth/register/', {
+                'email': 'novo@teste.com', 'name': 'Novo',
+                'password': 'Senha123', 'password2': 'Senha123',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            Refeicao.objects.filter(user__email='novo@teste.com').count(), 4
+        )
+
+    def test_login(self):
+        with self.assertMaxQueries(1):
+            response = self.client.post('/api/auth/login/', {
+                'email': 'perfil@teste.com', 'password': 'Senha123',
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_perfil(self):
+        self.preencher_perfil()
+        self.autenticar()
+        with self.assertMaxQueries(2):
+            response = self.client.get('/api/auth/profile/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['macros']['calorias_diarias'], 2200)
+
+    def test_primeiro_preenchimento_do_perfil(self):
+        self.autenticar()
+        with self.assertMaxQueries(9):
+            response = self.client.put('/api/auth/profile/', {
+                'idade': 30, 'peso': 70, 'altura': 175, 'sexo': 'F',
+                'objetivo': 'emagrecer', 'nivel_atividade': 'leve',
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.json()['macros'])
+
+    def test_troca_de_senha(self):
+        self.autenticar()
+        with self.assertMaxQueries(2):
+            response = self.client.put('/api/auth/change-password/', {
+                'old_password': 'Senha123', 'new_password': 'Nova1234',
+                'new_password2': 'Nova1234',
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_recuperacao_de_senha(self):
+        with self.assertMaxQueries(2):
+            response = self.client.post('/api/auth/reset-password/', {
+                'email': 'perfil@teste.com',
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class RespostasDeErroTests(TestCase):
+    """Erros das views de usuário vêm em {"errors": ...}, os dados não"""
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME='localhost')
+
+    def test_erro_de_validacao(self):
+        response = self.client.post('/api/auth/register/', {
+            'email': 'invalido', 'name': 'X',
+            'password': 'a', 'password2': 'b',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('email', response.json()['errors'])
+
+    def test_sem_autenticacao(self):
+        response = self.client.get('/api/auth/profile/')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('detail', response.json()['errors'])
+
+    def test_conteudo_parecido_com_erro(self):
+        # Antes o renderer procurava 'ErrorDetail' no repr da resposta
+        user = User.objects.create(
+            email='erro@teste.com', name='ErrorDetail',
+            password=make_password('Senha123')
+        )
+        token = get_tokens_for_user(user)['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = self.client.get('/api/auth/profile/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'ErrorDetail')
+
+
+class PerfilamentoTests(TestCase):
+    """X-Profile e Server-Timing só para staff (nutrition/profiling.py)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='comum@teste.com', name='Comum')
+        cls.staff = User.objects.create(
+            email='staff@teste.com', name='Staff', is_staff=True
+        )
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME='localhost')
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.pasta = Path(pasta.name)
+        settings = override_settings(
+            PROFILING_DIR=self.pasta, PROFILING_SAMPLE_RATE=0,
+            PROFILING_SERVER_TIMING=False
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def perfil(self, user=None, token=None):
+        if user is not None:
+            token = get_tokens_for_user(user)['access']
+        if token is not None:
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return self.client.get('/api/auth/profile/', HTTP_X_PROFILE='1')
+
+    def test_staff(self):
+        response = self.perfil(self.staff)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertTrue(
+            list(self.pasta.glob(f"*/{response['X-Profile-File']}"))
+        )
+
+    def test_usuario_comum_e_token_invalido(self):
+        for response in (
+            self.perfil(self.user), self.perfil(token='invalido')
+        ):
+            with self.subTest(status=response.status_code):
+                self.assertNotIn('Server-Timing', response)
+                self.assertNotIn('X-Profile-File', response)
+        self.assertFalse(list(self.pasta.iterdir()))
+
+    def test_server_timing_ligado(self):
+        with self.settings(PROFILING_SERVER_TIMING=True):
+            response = self.client.get('/api/auth/profile/')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+
+class RastreamentoTests(TestCase):
+    """Amostragem e exportação dos traces (nutrition/tracing.py)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create(
+            email='traces@teste.com', name='Staff', is_staff=True
+        )
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME='localhost')
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.arquivo = Path(pasta.name) / 'traces.jsonl'
+        settings = override_settings(
+            TRACING_ENABLED=True, TRACING_FILE=self.arquivo,
+            TRACING_EXPORTER='jsonl', TRACING_SAMPLE_RATE=0,
+            TRACING_SLOW_SECONDS=0, TRACING_TRUST_TRACEPARENT=False
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.traceparent = f'00-{"a" * 32}-{"b" * 16}-01'
+
+    def traces(self):
+        if not self.arquivo.exists():
+            return []
+        linhas = self.arquivo.read_text().splitlines()
+        return [json.loads(linha) for linha in linhas]
+
+    def test_traceparent_externo_nao_forca_exportacao(self):
+        response = self.client.get(
+            '/api/auth/profile/', HTTP_TRACEPARENT=self.traceparent
+        )
+        self.assertEqual(response['X-Trace-Id'], 'a' * 32)
+        self.assertTrue(response['traceparent'].endswith('-00'))
+        self.assertEqual(self.traces(), [])
+
+        with self.settings(TRACING_TRUST_TRACEPARENT=True):
+            self.client.get(
+                '/api/auth/profile/', HTTP_TRACEPARENT=self.traceparent
+            )
+        self.assertEqual(
+            [trace['trace_id'] for trace in self.traces()], ['a' * 32]
+        )
+
+    def test_pedido_de_staff(self):
+        token = get_tokens_for_user(self.staff)['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = self.client.get('/api/auth/profile/', HTTP_X_TRACE='1')
+        [trace] = self.traces()
+        self.assertEqual(trace['trace_id'], response['X-Trace-Id'])
+        self.assertIn(
+            'db.query', [span['name'] for span in trace['spans']]
+        )
+
+    def test_sql_so_em_traces_amostrados(self):
+        for sampled in (False, True):
+            with tracing.start_trace('teste', sampled=sampled) as trace:
+                User.objects.count()
+            with self.subTest(sampled=sampled):
+                self.assertEqual(
+                    'db.query' in [span.name for span in trace.spans],
+                    sampled
+                )
+
+    def test_arquivo_girado_pelo_tamanho(self):
+        with self.settings(TRACING_MAX_BYTES=1000):
+            for _ in range(10):
+                with tracing.start_trace(
+                    'teste', sampled=True, texto='x' * 200
+                ):
+                    pass
+        anterior = Path(f'{self.arquivo}.1')
+        self.assertTrue(anterior.exists())
+        for arquivo in (self.arquivo, anterior):
+            self.assertLessEqual(arquivo.stat().st_size, 1000)
+        self.assertTrue(self.traces())
+
+
+@override_settings(COMPRESSION_ENABLED=True, COMPRESSION_MIN_SIZE=1024)
+class CompressaoTests(SimpleTestCase):
+    """Respostas comprimidas (nutrition/compression.py), em gzip"""
+
+    def setUp(self):
+        # Sem brotli a escolha é sempre gzip, instalado ou não o pacote
+        patcher = mock.patch.object(compression, 'brotli', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def comprimir(self, response, aceita='gzip, br'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=aceita)
+        middleware = compression.CompressionMiddleware(lambda r: response)
+        return middleware(request)
+
+    def test_codificacoes_aceitas(self):
+        self.assertEqual(
+            compression.accepted_encodings(
+                'GZIP;q=0, br;q=0.5, deflate, identity;q=0.0, zstd;q=x'
+            ),
+            {'br', 'deflate'}
+        )
+        response = self.comprimir(
+            HttpResponse('a' * 2000, content_type='application/json'),
+            aceita='gzip;q=0'
+        )
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_tamanho_minimo(self):
+        pequena = self.comprimir(
+            HttpResponse('a' * 1000, content_type='application/json')
+        )
+        self.assertFalse(pequena.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', pequena['Vary'])
+
+        grande = self.comprimir(
+            HttpResponse('a' * 2000, content_type='application/json')
+        )
+        self.assertEqual(grande['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(grande.content), b'a' * 2000)
+        self.assertEqual(grande['Content-Length'], str(len(grande.content)))
+
+    def test_etag_fraca(self):
+        response = HttpResponse('a' * 2000, content_type='text/plain')
+        response['ETag'] = '"abc"'
+        self.assertEqual(self.comprimir(response)['ETag'], 'W/"abc"')
+
+    def test_streaming(self):
+        linhas = [f'{{"linha": {i}}}\n'.encode() for i in range(50)]
+        response = self.comprimir(StreamingHttpResponse(
+            iter(linhas), content_type='application/x-ndjson'
+        ))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)),
+            b''.join(linhas)
+        )
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_DIR='')
+class MetricasTests(SimpleTestCase):
+    """Formato do Prometheus, soma entre processos e acesso ao /metrics"""
+
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.pasta = Path(pasta.name)
+        settings = override_settings(METRICS_DIR=str(self.pasta))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # Store novo, em arquivo, só para o teste
+        patcher = mock.patch.multiple(metrics, _store=None, _store_pid=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def linhas(self):
+        return metrics.render().splitlines()
+
+    def test_contador(self):
+        for _ in range(2):
+            metrics.inc(
+                'nutriapp_cache_requests_total', cache='catalogo',
+                result='hit'
+            )
+        metrics.inc('nutriapp_http_db_seconds_total', 0.25, route='perfil')
+        linhas = self.linhas()
+        self.assertIn(
+            '# HELP nutriapp_cache_requests_total Acessos aos caches em '
+            'memória (result=hit|miss)', linhas
+        )
+        self.assertIn('# TYPE nutriapp_cache_requests_total counter', linhas)
+        self.assertIn(
+            'nutriapp_cache_requests_total{cache="catalogo",result="hit"} 2',
+            linhas
+        )
+        self.assertIn(
+            'nutriapp_http_db_seconds_total{route="perfil"} 0.25', linhas
+        )
+        # Métricas sem amostras não aparecem
+        self.assertNotIn(
+            '# TYPE nutriapp_http_requests_total counter', linhas
+        )
+
+    def test_histograma(self):
+        for valor in (4, 60):
+            metrics.observe(
+                'nutriapp_http_request_db_queries', valor, route='perfil'
+            )
+        linhas = [
+            linha for linha in self.linhas()
+            if 'nutriapp_http_request_db_queries' in linha
+        ]
+        self.assertEqual(linhas[1], (
+            '# TYPE nutriapp_http_request_db_queries histogram'
+        ))
+        nome = 'nutriapp_http_request_db_queries'
+        for le, total in (('3', 0), ('5', 1), ('50', 1), ('100', 2),
+                          ('+Inf', 2)):
+            self.assertIn(
+                f'{nome}_bucket{{route="perfil",le="{le}"}} {total}', linhas
+            )
+        self.assertIn(f'{nome}_sum{{route="perfil"}} 64', linhas)
+        self.assertEqual(linhas[-1], f'{nome}_count{{route="perfil"}} 2')
+
+    def test_escape_dos_rotulos(self):
+        metrics.inc(
+            'nutriapp_cache_requests_total', cache='a"b\\c\nd', result='x'
+        )
+        self.assertIn(
+            'nutriapp_cache_requests_total{cache="a\\"b\\\\c\\nd",'
+            'result="x"} 1',
+            self.linhas()
+        )
+
+    def test_soma_dos_arquivos_dos_processos(self):
+        chave = metrics._key('nutriapp_cache_requests_total', {'cache': 'x'})
+        # Arquivo pequeno: as entradas novas forçam o crescimento do mmap
+        with mock.patch.object(metrics._MmapStore, 'INITIAL_SIZE', 64):
+            primeiro = metrics._MmapStore(self.pasta / '1.db')
+            segundo = metrics._MmapStore(self.pasta / '2.db')
+            primeiro.inc(chave, 2)
+            for i in range(10):
+                segundo.inc(metrics._key('outra', {'i': i}), 1)
+            segundo.inc(chave, 3)
+        self.assertEqual(metrics.collect()[chave], 5)
+
+        # Reaberto (mesmo pid depois de reiniciar), o arquivo continua
+        reaberto = metrics._MmapStore(self.pasta / '1.db')
+        reaberto.inc(chave, 1)
+        self.assertEqual(dict(reaberto.items())[chave], 3)
+        self.assertEqual(metrics.collect()[chave], 6)
+
+    def test_endpoint_exige_token(self):
+        client = APIClient(SERVER_NAME='localhost')
+        with self.settings(METRICS_TOKEN=''):
+            self.assertEqual(client.get('/metrics').status_code, 404)
+
+        with self.settings(METRICS_TOKEN='segredo'):
+            self.assertEqual(client.get('/metrics').status_code, 401)
+            response = client.get(
+                '/metrics', HTTP_AUTHORIZATION='Bearer errado'
+            )
+            self.assertEqual(response.status_code, 401)
+            response = client.get(
+                '/metrics', HTTP_AUTHORIZATION='Bearer segredo'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertIn(
+            '# TYPE nutriapp_http_requests_total counter',
+            response.content.decode()
+        )
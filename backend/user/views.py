@@ -6,7 +6,6 @@ from .serializers import UserRegistrationSerializer,\
                                 UserChangePasswordSerializer, \
                                 SendPasswordResetEmailSerializer
 from django.contrib.auth import authenticate
-from .renderers import UserRenderer
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.generics import CreateAPIView, GenericAPIView
@@ -79,7 +78,7 @@ class UserRegistrationAPI(CreateAPIView):
     """
     An endpoint for register user.
     """
-    renderer_classes = [UserRenderer]
+    wrap_errors = True
     serializer_class = UserRegistrationSerializer
     queryset = User.objects.all()
 
@@ -97,7 +96,7 @@ class UserLoginAPI(GenericAPIView):
     """
     An endpoint for login user.
     """
-    renderer_classes = [UserRenderer]
+    wrap_errors = True
     serializer_class = UserLoginSerializer
 
     def post(self, request, format=None):
@@ -121,13 +120,15 @@ class UserProfileAPI(GenericAPIView):
     """
     An endpoint for profile user.
     """
-    renderer_classes = [UserRenderer]
+    wrap_errors = True
     permission_classes = [IsAuthenticated]
     serializer_class = UserProfileSerializer
 
     def get(self, request, format=None):
         try:
-            profile = request.user.profile
+            profile = UserProfile.objects.select_related(
+                'user', 'plano_alimentar'
+            ).get(user=request.user)
             serializer = self.get_serializer(instance=profile)
             return Response(serializer.data, status=status.HTTP_200_OK)
         except UserProfile.DoesNotExist:
@@ -139,16 +140,16 @@ class UserProfileAPI(GenericAPIView):
     def put(self, request, format=None):
         serializer = self.get_serializer(instance=request.user.profile, data=request.data)
         serializer.is_valid(raise_exception=True)
-        profile = serializer.save()
+        primeiro_preenchimento = serializer.instance.status is False
 
         # Se o preenchimento do perfil for a primeira vez
-        if profile.status is False:
+        if primeiro_preenchimento:
+            # Atualiza o status para True no mesmo save do preenchimento
+            profile = serializer.save(status=True)
             macros = calcular_macros(profile)
-            # Atualiza o status para True após o primeiro preenchimento
-            profile.status = True
-            profile.save()
         # Se o usuario quer alterar os macros manualmente
         else:
+            profile = serializer.save()
             macros = request.data.get('macros', {})
 
         # Corrige o uso do update_or_create
@@ -164,7 +165,7 @@ class UserChangePasswordView(GenericAPIView):
     """
     An endpoint for change password.
     """
-    renderer_classes = [UserRenderer]
+    wrap_errors = True
     permission_classes = [IsAuthenticated]
     serializer_class = UserChangePasswordSerializer
 
@@ -180,7 +181,7 @@ class PasswordResetEmailView(GenericAPIView):
     """
      An endpoint to change the password via email.
     """
-    renderer_classes = [UserRenderer]
+    wrap_errors = True
     serializer_class = SendPasswordResetEmailSerializer
 
     def post(self, request, format=None):